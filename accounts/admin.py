@@ -1,10 +1,11 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from hilton_ramses.changelists import FastChangeListMixin
 from .models import CustomUser
 
 
 @admin.register(CustomUser)
-class CustomUserAdmin(BaseUserAdmin):
+class CustomUserAdmin(FastChangeListMixin, BaseUserAdmin):
     """Custom User Admin with email as primary username"""
     
     fieldsets = (
@@ -36,6 +37,10 @@ class CustomUserAdmin(BaseUserAdmin):
     list_display = ['email', 'first_name', 'last_name', 'phone_number', 'is_staff', 'is_active', 'created_at']
     list_filter = ['is_staff', 'is_superuser', 'is_active', 'email_notifications', 'newsletter_subscription', 'created_at']
     search_fields = ['email', 'first_name', 'last_name', 'phone_number']
+    search_help_text = 'Email addresses starting with the search text; if there are none, users whose email, name or phone number contains it'
+    prefix_search_field = 'email'
+    prefix_search_ignore_case = True
+    prefix_search_fallback = True
     ordering = ['-created_at']
     readonly_fields = ['created_at', 'updated_at', 'last_login', 'date_joined']
     
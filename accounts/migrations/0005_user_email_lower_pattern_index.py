@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-17 21:40
+
+from django.db import migrations
+
+
+INDEX_NAME = 'user_email_lower_like_idx'
+
+
+def create_pattern_index(apps, schema_editor):
+    # LOWER(email) LIKE 'x%' only uses a pattern-ops index on PostgreSQL (unless
+    # the collation is C); SQLite answers the prefix search with a range on
+    # user_email_lower_idx instead, and has no operator classes
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = schema_editor.quote_name(apps.get_model('accounts', 'CustomUser')._meta.db_table)
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON {table} (LOWER(email) varchar_pattern_ops)'
+    )
+
+
+def drop_pattern_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_user_email_lower_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_pattern_index, drop_pattern_index),
+    ]
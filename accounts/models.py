@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
@@ -76,6 +77,11 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         indexes = [
             models.Index(fields=['email']),
             models.Index(fields=['-date_joined']),
+            # Admin list order (keyset pagination) and the created_at filter
+            models.Index(fields=['created_at', 'id'], name='user_created_idx'),
+            # Case-insensitive email prefix search in the admin (a range scan on SQLite);
+            # PostgreSQL uses user_email_lower_like_idx (varchar_pattern_ops), see migration 0005
+            models.Index(Lower('email'), name='user_email_lower_idx'),
         ]
     
     def __str__(self):
@@ -97,6 +103,6 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         return self.first_name
     
     def email_user(self, subject, message, from_email=None, **kwargs):
-        """Send an email to this user"""
-        from django.core.mail import send_mail
-        send_mail(subject, message, from_email, [self.email], **kwargs)
+        """Queue an email to this user; the run_jobs worker sends it"""
+        from .tasks import send_user_email
+        send_user_email.enqueue(self.pk, subject, message, from_email, **kwargs)
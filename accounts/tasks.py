@@ -0,0 +1,10 @@
+from django.contrib.auth import get_user_model
+from django.core.mail import send_mail
+from jobs.queue import task
+
+
+@task(queue='email')
+def send_user_email(user_id, subject, message, from_email=None, **kwargs):
+    """Send an email to one user"""
+    user = get_user_model().objects.get(pk=user_id)
+    send_mail(subject, message, from_email, [user.email], **kwargs)
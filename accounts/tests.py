@@ -1,3 +1,44 @@
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+
+class CustomUserChangeListTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.admin = User.objects.create_superuser('admin@example.com', 'secret')
+        for name in ('Alice.Smith', 'alan', 'bob'):
+            User.objects.create_user(f'{name}@example.com', 'secret', first_name=name.title())
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:accounts_customuser_changelist')
+
+    def test_search_matches_email_prefix(self):
+        response = self.client.get(self.url, {'q': 'ala'})
+        self.assertEqual([user.email for user in response.context['cl'].result_list], ['alan@example.com'])
+        self.assertEqual(self.client.get(self.url, {'q': 'al'}).context['cl'].result_count, 2)
+        response = self.client.get(self.url, {'q': 'Alice'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        self.assertEqual(self.client.get(self.url, {'q': 'nobody'}).context['cl'].result_count, 0)
+
+    def test_email_search_ignores_case(self):
+        response = self.client.get(self.url, {'q': 'ALICE'})
+        self.assertEqual([user.email for user in response.context['cl'].result_list], ['Alice.Smith@example.com'])
+        self.assertEqual(self.client.get(self.url, {'q': 'alice'}).context['cl'].result_count, 1)
+
+    def test_names_and_phone_numbers_when_no_email_matches(self):
+        get_user_model().objects.filter(email='bob@example.com').update(last_name='Marley', phone_number='+20 100 555')
+        response = self.client.get(self.url, {'q': 'marley'})
+        self.assertEqual([user.email for user in response.context['cl'].result_list], ['bob@example.com'])
+        self.assertEqual(self.client.get(self.url, {'q': '555'}).context['cl'].result_count, 1)
+
+    def test_list_is_paged_by_cursor(self):
+        response = self.client.get(self.url)
+        cl = response.context['cl']
+        self.assertTrue(cl.keyset)
+        self.assertEqual(cl.result_count, 4)
+        self.assertEqual(cl.result_list[0].email, 'bob@example.com')
+        self.assertContains(response, '4 Users')
@@ -0,0 +1,118 @@
+"""
+Admin changelist timings on a large subscriber and user table, stock admin vs fast changelists.
+
+Generates ``--subscribers`` subscribers and ``--users`` accounts with
+``generate_data`` in a throw-away database, then renders the subscriber and
+user changelists through the real admin views: the first page, a page deep
+in the list (``--depth`` pages in), a filtered list and a search. Each case is
+run with a stock ``ModelAdmin`` (exact counts, OFFSET pages, icontains
+search) and with the project's admin classes, reporting milliseconds (total
+and in SQL) and queries. Usage:
+
+    python benchmarks/admin_changelists.py [--subscribers 1000000] [--users 50000] [--depth 2000] [--json out.json]
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from common import setup_django, test_database, write_results
+
+
+def timed(view, request, repeat):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings, query_timings = [], []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = view(request)
+            response.render()
+            timings.append(time.perf_counter() - started)
+        query_timings.append(sum(float(query['time']) for query in queries))
+    return {
+        'ms': round(statistics.median(timings) * 1000, 1),
+        'query_ms': round(statistics.median(query_timings) * 1000, 1),
+        'queries': len(queries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--subscribers', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=50_000)
+    parser.add_argument('--depth', type=int, default=2000, help='How many pages deep the "deep page" case goes')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', default=None, help='Also write the results to this file')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib import admin
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.admin import UserAdmin
+    from django.test import RequestFactory
+    from hilton_ramses.changelists import CURSOR_VAR, encode_cursor
+    from welcomeletter.models import MailingListSubscriber
+    from welcomeletter.synthetic import generate_data
+
+    User = get_user_model()
+    with test_database():
+        started = time.perf_counter()
+        generate_data(subscribers=args.subscribers, users=args.users)
+        seeded = time.perf_counter() - started
+        superuser = User.objects.create_superuser('bench-admin@example.com', 'secret')
+
+        class StockSubscriberAdmin(admin.ModelAdmin):
+            list_display = ['email', 'is_active', 'subscribed_at', 'ip_address']
+            list_filter = ['is_active', 'subscribed_at']
+            search_fields = ['email']
+            ordering = ['-subscribed_at']
+
+        class StockUserAdmin(UserAdmin):
+            list_display = ['email', 'first_name', 'last_name', 'phone_number', 'is_staff', 'is_active', 'created_at']
+            list_filter = ['is_staff', 'is_superuser', 'is_active', 'email_notifications',
+                           'newsletter_subscription', 'created_at']
+            search_fields = ['email', 'first_name', 'last_name', 'phone_number']
+            ordering = ['-created_at']
+
+        tables = {
+            'subscribers': (MailingListSubscriber, StockSubscriberAdmin, 'subscribed_at',
+                            {'is_active__exact': '1'}, 'synthetic-maria'),
+            'users': (User, StockUserAdmin, 'created_at', {'is_staff__exact': '0'}, 'synthetic-user12'),
+        }
+        factory = RequestFactory()
+        results = {'seed_seconds': round(seeded, 1), 'subscribers': args.subscribers, 'users': args.users}
+        for name, (model, stock_class, column, filters, term) in tables.items():
+            fast = admin.site._registry[model]
+            stock = stock_class(model, admin.site)
+            per_page = fast.list_per_page
+            depth = max(1, min(args.depth, model.objects.count() // per_page - 1))
+            offset = depth * per_page
+            # The row the cursor would point at after --depth pages
+            deep = model.objects.order_by(f'-{column}', '-pk').values_list(column, 'pk')[offset - 1:offset].first()
+            deep_page = {CURSOR_VAR: encode_cursor('after', *deep)} if deep else {}
+
+            cases = {
+                'first_page': ({}, {}),
+                'deep_page': ({'p': depth + 1}, deep_page),
+                'filtered': (filters, filters),
+                'search': ({'q': term}, {'q': term}),
+            }
+            results[name] = {}
+            for case, (stock_params, fast_params) in cases.items():
+                row = {}
+                for label, model_admin, params in (('stock', stock, stock_params), ('fast', fast, fast_params)):
+                    request = factory.get('/admin/', params)
+                    request.user = superuser
+                    row[label] = timed(model_admin.changelist_view, request, args.repeat)
+                results[name][case] = row
+                print(f'{name:12} {case:11} ' + '   '.join(
+                    f'{label} {row[label]["ms"]:>7} ms ({row[label]["query_ms"]:>6} ms in SQL)' for label in row
+                ), file=sys.stderr)
+
+    write_results(results, args.json)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
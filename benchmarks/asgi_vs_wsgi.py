@@ -0,0 +1,80 @@
+"""
+Throughput and tail latency of the WSGI deployment against the ASGI one, at rising concurrency.
+
+Seeds one throw-away database like ``load.py``, then starts each server in
+``--servers`` in turn (sync gunicorn workers with the sync views, gunicorn with
+uvicorn workers and the async views, ...) with ``--workers`` workers, and
+drives a cached page, the CSRF token endpoint and the newsletter sign-up at
+each ``--concurrency`` level. Reports req/s, p50/p99 latency and errors per
+server, route and level. Usage:
+
+    python benchmarks/asgi_vs_wsgi.py [--servers gunicorn gunicorn-uvicorn] [--concurrency 16 64 256]
+                                      [--requests 2000] [--workers 3] [--json out.json]
+"""
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from common import BASE_DIR, write_results
+from load import BENCH_DIR, SERVERS, drive, free_port, seed, start_server
+
+
+ROUTES = [
+    # (label, method, path)
+    ('cached page', 'GET', '/restaurants/'),
+    ('csrf token', 'GET', '/subscribe/token/'),
+    ('sign-up', 'SUBSCRIBE', '/subscribe/'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--servers', nargs='+', choices=list(SERVERS), default=['gunicorn', 'gunicorn-uvicorn'])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[16, 64, 256], help='Parallel connections')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per route and concurrency level')
+    parser.add_argument('--workers', type=int, default=3, help='Server worker processes')
+    parser.add_argument('--restaurants', type=int, default=50)
+    parser.add_argument('--subscribers', type=int, default=10000)
+    parser.add_argument('--json', default=None, help='Also write the results to this file')
+    args = parser.parse_args()
+
+    headers = {'Accept': 'text/html', 'Accept-Encoding': 'gzip', 'User-Agent': 'hilton-asgi-benchmark'}
+    results = {'workers': args.workers, 'requests': args.requests, 'cpus': os.cpu_count(), 'servers': {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'bench_settings',
+            'BENCH_DATABASE': str(Path(tmp) / 'bench.sqlite3'),
+            'PYTHONPATH': os.pathsep.join([str(BENCH_DIR), str(BASE_DIR), os.environ.get('PYTHONPATH', '')]),
+        }
+        os.environ.update({key: env[key] for key in ('DJANGO_SETTINGS_MODULE', 'BENCH_DATABASE')})
+        sys.path.insert(0, str(BASE_DIR))
+        import django
+        django.setup()
+        seed(args.restaurants, args.subscribers)
+
+        for kind in args.servers:
+            port = free_port()
+            server = start_server(kind, port, args.workers, env)
+            rows = results['servers'][kind] = {}
+            try:
+                for label, method, path in ROUTES:
+                    # Warm up caches and connections before measuring
+                    drive('127.0.0.1', port, method, path, args.workers * 4, args.workers * 4, headers)
+                    for concurrency in args.concurrency:
+                        row = drive('127.0.0.1', port, method, path, args.requests, concurrency, headers)
+                        rows[f'{label} @{concurrency}'] = row
+                        print(f'{kind:17} {label:12} @{concurrency:<4} {row["requests_per_second"]:>8} req/s  '
+                              f'p50 {row["latency_ms"]["p50"]:>8} ms  p99 {row["latency_ms"]["p99"]:>8} ms  '
+                              f'errors {row["errors"]}', file=sys.stderr)
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+    write_results(results, args.json)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
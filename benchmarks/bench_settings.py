@@ -0,0 +1,28 @@
+"""
+Settings for ``load.py``: the project settings as in production, but on the
+throw-away SQLite database named by ``BENCH_DATABASE`` and over plain HTTP.
+"""
+import os
+
+from hilton_ramses.settings import *  # noqa: F401,F403
+
+
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['BENCH_DATABASE'],
+        # Sign-ups from several workers queue for the write lock instead of failing
+        'OPTIONS': {'timeout': 30},
+    },
+}
+CONTENT_VERSION_FILE = os.environ['BENCH_DATABASE'] + '.content-version'
+MEDIA_ROOT = os.path.join(os.path.dirname(os.environ['BENCH_DATABASE']), 'media')
+# The benchmark does not run collectstatic, so it cannot use the manifest storage
+STORAGES = {**STORAGES, 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}}  # noqa: F405
+
+# Queries per request are read from the Server-Timing header
+SERVER_TIMING = 'all'
+METRICS_DIR = ''
+METRICS_TOKEN = 'bench'
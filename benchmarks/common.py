@@ -0,0 +1,50 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+The scripts are run from the project root (``python benchmarks/<name>.py``)
+and work against a throw-away test database so they never touch real data.
+"""
+import contextlib
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    """Configure Django for a standalone script"""
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hilton_ramses.settings')
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database(media_root=None):
+    """Create a temporary database (and media directory) for the duration of the block"""
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            # Nothing is collected, so use the plain static storage as the test runner does
+            plain_static = {**settings.STORAGES, 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}}
+            with override_settings(MEDIA_ROOT=media_root or tmp, ALLOWED_HOSTS=['*'], DEBUG=False, STORAGES=plain_static):
+                yield Path(media_root or tmp)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+
+def write_results(results, path):
+    """Print results and, when a path is given, also store them as JSON"""
+    text = json.dumps(results, indent=2, default=str)
+    print(text)
+    if path:
+        Path(path).write_text(text + '\n')
@@ -0,0 +1,51 @@
+"""
+Bytes a browser needs before it can first render each public page, with and without critical CSS.
+
+Fills a throw-away database with ``populate_data``, renders every public page
+and adds up the gzipped HTML and the gzipped local stylesheets it blocks on:
+once as the pages were served before (the full ``main.css`` linked in
+``<head>``) and once with the committed ``build_assets`` output (critical CSS
+inline, the minified bundle loaded asynchronously). Run ``build_assets`` first
+after changing the CSS. Usage:
+
+    python benchmarks/first_render.py [--json out.json]
+"""
+import argparse
+import sys
+
+from common import setup_django, test_database, write_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--json', default=None, help='Also write the results to this file')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+    from django.urls import resolve
+    from welcomeletter import assets
+    from welcomeletter.pagecache import public_pages
+
+    with test_database():
+        call_command('populate_data', stdout=sys.stderr)
+        built = assets.get_assets()
+        if not built.critical:
+            sys.exit('No critical CSS in static/dist/assets.json, run `python manage.py build_assets` first')
+
+        results = {}
+        for url_path, callback in public_pages():
+            row = results[resolve(url_path).url_name] = {}
+            for label, state in (('before', assets.Assets()), ('after', built)):
+                assets._assets = state
+                html = assets.render_page(url_path, callback, 'localhost')
+                row[f'{label}_bytes'] = assets.first_render_bytes(html)
+            row['saved'] = f'{1 - row["after_bytes"] / row["before_bytes"]:.0%}'
+            print(f'{url_path:16} {row["before_bytes"]:>7} -> {row["after_bytes"]:>7} bytes', file=sys.stderr)
+        assets.reset_assets()
+
+    write_results(results, args.json)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Bytes a guest downloads for restaurant images, before and after responsive variants.
+
+Seeds restaurants with phone-sized photos, renders the restaurants and board
+menu pages and, for a few common viewports, adds up the image bytes a browser
+fetches: the original upload ("before") versus the srcset candidate it would
+pick ("after", WebP). Usage:
+
+    python benchmarks/image_bytes.py [--restaurants 6] [--size 4032x3024] [--json out.json]
+"""
+import argparse
+import io
+import sys
+
+from common import setup_django, test_database, write_results
+
+
+VIEWPORTS = {
+    # name: (CSS width of the image slot, device pixel ratio)
+    'phone': (390, 3),
+    'tablet': (384, 2),
+    'desktop': (380, 1),
+}
+
+
+def make_photo(width, height):
+    """A noisy photo-like JPEG so the encoder cannot cheat"""
+    from PIL import Image
+    image = Image.effect_noise((width, height), 64).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=92)
+    return buffer.getvalue()
+
+
+def pick_candidate(sources, slot_width, dpr):
+    needed = slot_width * dpr
+    for item in sources:
+        if item['width'] >= needed:
+            return item
+    return sources[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--restaurants', type=int, default=6)
+    parser.add_argument('--size', default='4032x3024', help='Width x height of the uploaded photos')
+    parser.add_argument('--json', default=None, help='Also write the results to this file')
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split('x'))
+
+    setup_django()
+    from django.core.files.base import ContentFile
+    from django.test import Client
+    from welcomeletter.content import clear_snapshot
+    from welcomeletter.images import process_image_field
+    from welcomeletter.models import Restaurant
+
+    with test_database():
+        photo = make_photo(width, height)
+        for i in range(args.restaurants):
+            restaurant = Restaurant(name=f'Restaurant {i}', slug=f'restaurant-{i}', description='Food', order=i)
+            restaurant.image.save(f'photo-{i}.jpg', ContentFile(photo), save=False)
+            restaurant.save()
+
+        client = Client()
+        paths = ('/restaurants/', '/board-menus/')
+        clear_snapshot()
+        html_before = {path: len(client.get(path).content) for path in paths}
+        for pk in Restaurant.objects.values_list('pk', flat=True):
+            process_image_field(Restaurant, pk, 'image')
+        clear_snapshot()
+        html_after = {path: len(client.get(path).content) for path in paths}
+
+        restaurants = list(Restaurant.objects.all())
+        original = sum(r.image.size for r in restaurants)
+        viewports = {}
+        for name, (slot, dpr) in VIEWPORTS.items():
+            responsive = sum(
+                pick_candidate(r.image_variants['sources']['webp'], slot, dpr)['bytes'] for r in restaurants
+            )
+            viewports[name] = {
+                'image_bytes_before': original,
+                'image_bytes_after': responsive,
+                'saving': f'{100 - responsive * 100 / original:.1f}%',
+            }
+
+        # Both pages show every active restaurant with the same image slot
+        results = {
+            'restaurants': args.restaurants,
+            'upload': args.size,
+            'pages': {
+                path: {
+                    'html_bytes_before': html_before[path],
+                    'html_bytes_after': html_after[path],
+                    'viewports': viewports,
+                }
+                for path in paths
+            },
+        }
+
+    write_results(results, args.json)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
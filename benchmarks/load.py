@@ -0,0 +1,308 @@
+"""
+Load test of every public route and the newsletter sign-up against a real server.
+
+Seeds a throw-away SQLite database (``populate_data`` plus ``generate_data``
+restaurants and subscribers), starts gunicorn (or uvicorn) on it with
+``bench_settings`` and sends ``--requests`` requests per route from
+``--concurrency`` keep-alive connections. For every route it reports req/s,
+p50/p95/p99 latency, ORM queries per request (from the Server-Timing header)
+and bytes per response. Usage:
+
+    python benchmarks/load.py [--concurrency 8] [--requests 500] [--workers 2] [--server gunicorn|uvicorn|gunicorn-uvicorn]
+                              [--restaurants 50] [--subscribers 10000] [--json results/today.json]
+
+With ``--url http://host:port`` nothing is seeded or started and the routes are
+driven against that server instead (queries per request are only reported if
+it sends Server-Timing to everyone).
+"""
+import argparse
+import http.client
+import importlib.util
+import io
+import json
+import math
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.cookies import SimpleCookie
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from common import BASE_DIR, write_results
+
+
+BENCH_DIR = Path(__file__).resolve().parent
+
+# Example arguments for routes that take them
+ROUTE_EXAMPLES = {
+    'qr_redirect': [{'source': 'room-1204'}, {'source': 'table-nile-terrace-1', 'target': 'restaurants/'}],
+}
+# Routes with their own request logic (subscribe) or that are not worth timing alone
+SKIPPED_ROUTES = {'subscribe_newsletter'}
+
+QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted ``values``"""
+    if not values:
+        return None
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[rank - 1]
+
+
+def public_routes():
+    """(name, path) of every GET route in welcomeletter/urls.py"""
+    from django.urls import reverse
+    from welcomeletter.urls import urlpatterns
+
+    routes, seen = [], set()
+    for pattern in urlpatterns:
+        name = pattern.name
+        if name in SKIPPED_ROUTES:
+            continue
+        for kwargs in ROUTE_EXAMPLES.get(name, [{}]):
+            if pattern.pattern.converters and not set(pattern.pattern.converters) <= set(kwargs):
+                continue
+            if not pattern.pattern.converters and kwargs:
+                continue
+            path = reverse(name, kwargs=kwargs or None)
+            if path not in seen:
+                seen.add(path)
+                routes.append((name, path))
+    return routes
+
+
+class Connection:
+    """One keep-alive HTTP connection, reopened after errors"""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        try:
+            self.conn.request(method, path, body=body, headers=headers or {})
+            response = self.conn.getresponse()
+            return response, response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            raise
+
+
+def subscribe(connection, number, headers):
+    """Fetch a CSRF token, then sign up a new address the way the page script does"""
+    response, body = connection.request('GET', '/subscribe/token/', headers=headers)
+    cookie = SimpleCookie(response.getheader('Set-Cookie', ''))
+    token = json.loads(body)['csrfToken']
+    form = f'email=bench-{number}-{time.time_ns()}%40example.com'
+    return connection.request('POST', '/subscribe/', body=form, headers={
+        **headers,
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Cookie': f'csrftoken={cookie["csrftoken"].value}',
+        'X-CSRFToken': token,
+        'X-Requested-With': 'XMLHttpRequest',
+        'Referer': f'http://{connection.host}:{connection.port}/',
+    })
+
+
+def drive(host, port, method, path, total, concurrency, headers):
+    """Send ``total`` requests from ``concurrency`` threads; return one route's results"""
+    remaining = iter(range(total))
+    lock = threading.Lock()
+    samples, errors = [], []
+
+    def worker():
+        connection = Connection(host, port)
+        while True:
+            with lock:
+                number = next(remaining, None)
+            if number is None:
+                return
+            started = time.perf_counter()
+            try:
+                if method == 'SUBSCRIBE':
+                    response, body = subscribe(connection, number, headers)
+                else:
+                    response, body = connection.request(method, path, headers=headers)
+            except Exception as exc:
+                errors.append(repr(exc))
+                continue
+            elapsed = time.perf_counter() - started
+            match = QUERIES.search(response.getheader('Server-Timing', ''))
+            samples.append((elapsed, response.status, len(body), int(match.group(1)) if match else None))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    latencies = sorted(sample[0] for sample in samples)
+    queries = [sample[3] for sample in samples if sample[3] is not None]
+    statuses = {}
+    for sample in samples:
+        statuses[str(sample[1])] = statuses.get(str(sample[1]), 0) + 1
+    return {
+        'path': path,
+        'method': 'POST' if method == 'SUBSCRIBE' else method,
+        'requests': len(samples),
+        'errors': len(errors),
+        'statuses': statuses,
+        'requests_per_second': round(len(samples) / seconds, 1) if seconds else None,
+        'latency_ms': {
+            name: round(percentile(latencies, percent) * 1000, 2) if latencies else None
+            for name, percent in (('p50', 50), ('p95', 95), ('p99', 99))
+        },
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        'bytes_per_response': round(sum(sample[2] for sample in samples) / len(samples)) if samples else None,
+    }
+
+
+def seed(restaurants, subscribers):
+    """Fill the benchmark database with the stock content plus synthetic rows"""
+    from django.core.management import call_command
+
+    call_command('migrate', verbosity=0)
+    call_command('populate_data', stdout=io.StringIO())
+    call_command('generate_data', restaurants=restaurants, subscribers=subscribers, stdout=io.StringIO())
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+SERVERS = {
+    'gunicorn': ['gunicorn'],
+    'uvicorn': ['uvicorn'],
+    # The ASGI deployment from DEPLOYMENT.md: gunicorn managing uvicorn workers
+    'gunicorn-uvicorn': ['gunicorn', 'uvicorn', 'uvicorn_worker'],
+}
+
+
+def start_server(kind, port, workers, env):
+    if kind == 'uvicorn':
+        command = [sys.executable, '-m', 'uvicorn', 'hilton_ramses.asgi:application',
+                   '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers), '--no-access-log']
+    elif kind == 'gunicorn-uvicorn':
+        command = [sys.executable, '-m', 'gunicorn', 'hilton_ramses.asgi:application',
+                   '--worker-class', 'uvicorn_worker.UvicornWorker',
+                   '--bind', f'127.0.0.1:{port}', '--workers', str(workers)]
+    else:
+        command = [sys.executable, '-m', 'gunicorn', 'hilton_ramses.wsgi:application',
+                   '--bind', f'127.0.0.1:{port}', '--workers', str(workers)]
+    for module in SERVERS[kind]:
+        if importlib.util.find_spec(module) is None:
+            raise SystemExit(f'{module} is not installed')
+    process = subprocess.Popen(command, cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'{kind} exited:\n{process.stderr.read().decode()}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f'{kind} did not start within 30s')
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--concurrency', type=int, default=8, help='Parallel connections')
+    parser.add_argument('--requests', type=int, default=500, help='Requests per route')
+    parser.add_argument('--workers', type=int, default=2, help='Server worker processes')
+    parser.add_argument('--server', choices=list(SERVERS), default='gunicorn')
+    parser.add_argument('--restaurants', type=int, default=50, help='Synthetic restaurants on top of populate_data')
+    parser.add_argument('--subscribers', type=int, default=10000, help='Synthetic newsletter subscribers')
+    parser.add_argument('--no-gzip', action='store_true', help='Do not send Accept-Encoding: gzip')
+    parser.add_argument('--url', help='Benchmark this running server instead of starting one')
+    parser.add_argument('--json', default=None, help='Also write the results to this file')
+    args = parser.parse_args()
+
+    headers = {'Accept': 'text/html', 'User-Agent': 'hilton-load-benchmark'}
+    if not args.no_gzip:
+        headers['Accept-Encoding'] = 'gzip'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'bench_settings',
+            'BENCH_DATABASE': str(Path(tmp) / 'bench.sqlite3'),
+            'PYTHONPATH': os.pathsep.join([str(BENCH_DIR), str(BASE_DIR), os.environ.get('PYTHONPATH', '')]),
+        }
+        if not args.url:
+            os.environ.update({key: env[key] for key in ('DJANGO_SETTINGS_MODULE', 'BENCH_DATABASE')})
+        sys.path.insert(0, str(BASE_DIR))
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hilton_ramses.settings')
+        import django
+        django.setup()
+
+        server = None
+        if args.url:
+            host, port = urlsplit(args.url).hostname, urlsplit(args.url).port or 80
+        else:
+            seed(args.restaurants, args.subscribers)
+            host, port = '127.0.0.1', free_port()
+            server = start_server(args.server, port, args.workers, env)
+        try:
+            routes = {}
+            for name, path in public_routes():
+                if name == 'metrics':
+                    route_headers = {**headers, 'Authorization': 'Bearer bench'}
+                else:
+                    route_headers = headers
+                # Warm up caches and connections before measuring
+                drive(host, port, 'GET', path, args.concurrency, args.concurrency, route_headers)
+                routes[path] = {'name': name, **drive(
+                    host, port, 'GET', path, args.requests, args.concurrency, route_headers,
+                )}
+                print(f'{path:45} {routes[path]["requests_per_second"]:>8} req/s', file=sys.stderr)
+            routes['/subscribe/'] = {'name': 'subscribe_newsletter', **drive(
+                host, port, 'SUBSCRIBE', '/subscribe/', args.requests, args.concurrency, headers,
+            )}
+            print(f'{"/subscribe/ (token + POST)":45} {routes["/subscribe/"]["requests_per_second"]:>8} req/s',
+                  file=sys.stderr)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+
+    results = {
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'server': args.url or f'{args.server} ({args.workers} workers)',
+        'concurrency': args.concurrency,
+        'requests_per_route': args.requests,
+        'seed': {'restaurants': args.restaurants, 'subscribers': args.subscribers},
+        'machine': {'python': platform.python_version(), 'cpus': os.cpu_count(), 'platform': platform.platform()},
+        'routes': routes,
+    }
+    write_results(results, args.json)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,25 @@
+# Gunicorn reads this file automatically when started from the project root.
+# Pass settings such as --bind and --workers on the command line as before.
+# The hooks also run for uvicorn workers (--worker-class uvicorn_worker.UvicornWorker).
+from pathlib import Path
+
+
+def on_starting(server):
+    """Start the request metrics from zero, like the counters of a fresh process"""
+    from decouple import config
+
+    directory = config('METRICS_DIR', default='')
+    if directory and Path(directory).is_dir():
+        for path in Path(directory).glob('metrics-*.json'):
+            path.unlink()
+
+
+def worker_exit(server, worker):
+    """Write buffered newsletter sign-ups, QR scan counts and request metrics before a worker goes away"""
+    from welcomeletter.buffer import close_buffer
+    from welcomeletter.metrics import close_metrics
+    from welcomeletter.scans import close_counter
+
+    close_buffer()
+    close_counter()
+    close_metrics()
@@ -2,6 +2,8 @@
 ASGI config for hilton_ramses project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The public pages are served by the async views unless the environment sets
+ASYNC_VIEWS=False.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +14,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hilton_ramses.settings')
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
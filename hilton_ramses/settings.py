@@ -49,11 +49,15 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'accounts',
     'welcomeletter',
+    'jobs',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'welcomeletter.compression.CompressionMiddleware',
+    'welcomeletter.metrics.RequestMetricsMiddleware',
+    'welcomeletter.querylog.QueryLogMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -62,11 +66,20 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Serve the public pages with the async views (hilton_ramses/asgi.py turns this on)
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+if ASYNC_VIEWS:
+    # WhiteNoise only runs synchronously and would put every request through a
+    # thread; under ASGI nginx serves /static/ from STATIC_ROOT instead
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+
 ROOT_URLCONF = 'hilton_ramses.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also times rendering for the request metrics
+        'BACKEND': 'welcomeletter.metrics.TimedDjangoTemplates',
+        'NAME': 'django',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -99,6 +112,9 @@ if Development:
             'PASSWORD': DB_PASSWORD,
             'HOST': DB_HOST,
             'PORT': DB_PORT,
+            # A file (rather than shared in-memory) test database gives threaded
+            # tests SQLite's normal locking with a busy timeout
+            'TEST': {'NAME': BASE_DIR / 'test-db.sqlite3'},
         }
     }
 elif Production:
@@ -171,7 +187,16 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = config('STATIC_ROOT', default=BASE_DIR / 'staticfiles')  # collectstatic target for production
-STATICFILES_STORAGE = config('STATICFILES_STORAGE', default='whitenoise.storage.CompressedManifestStaticFilesStorage')
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    # WhiteNoise's hashed, compressed files plus AVIF/WebP/resized image variants (see welcomeletter/storage.py)
+    'staticfiles': {'BACKEND': config('STATICFILES_STORAGE', default='welcomeletter.storage.OptimizedStaticFilesStorage')},
+}
+STATIC_IMAGE_WIDTHS = (160, 320, 640, 1280, 1920)  # renditions made of each static image
+STATIC_IMAGE_WORKERS = config('STATIC_IMAGE_WORKERS', default=0, cast=int)  # encoder processes, 0 = one per core
+STATIC_IMAGE_CACHE = config('STATIC_IMAGE_CACHE', default=BASE_DIR / '.cache' / 'static-images')  # encoded variants by content hash
+# Tests run without collectstatic, so they use the plain static files storage
+TEST_RUNNER = 'hilton_ramses.test_runner.TestRunner'
 
 # Media files (User uploaded content)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/#serving-uploaded-files-in-development
@@ -189,6 +214,79 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'accounts.CustomUser'
 
+# Public content versioning
+# Admin edits bump a shared counter; every worker re-reads it at most once per
+# poll interval. Use the 'file' backend to share the counter through a local
+# file instead of the database (all workers must run on the same node).
+CONTENT_VERSION_BACKEND = config('CONTENT_VERSION_BACKEND', default='db')  # 'db' or 'file'
+CONTENT_VERSION_FILE = config('CONTENT_VERSION_FILE', default=BASE_DIR / 'content-version')
+CONTENT_VERSION_POLL_INTERVAL = config('CONTENT_VERSION_POLL_INTERVAL', default=2.0, cast=float)  # seconds
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Rendered public pages go to the 'pages' cache. Point PAGE_CACHE_BACKEND at
+# django.core.cache.backends.filebased.FileBasedCache (with a directory as
+# PAGE_CACHE_LOCATION) to share rendered pages between the gunicorn workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pages': {
+        'BACKEND': config('PAGE_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('PAGE_CACHE_LOCATION', default='welcomeletter-pages'),
+    },
+}
+PAGE_CACHE_ALIAS = 'pages'
+PAGE_CACHE_TIMEOUT = config('PAGE_CACHE_TIMEOUT', default=60 * 60 * 24, cast=int)  # seconds
+PAGE_CACHE_COMPRESS = config('PAGE_CACHE_COMPRESS', default=True, cast=bool)  # also store Brotli and gzip copies
+HTML_MINIFY = config('HTML_MINIFY', default=True, cast=bool)  # strip comments and extra whitespace from rendered HTML
+PAGE_CACHE_MAX_AGE = config('PAGE_CACHE_MAX_AGE', default=60, cast=int)  # Cache-Control max-age for browsers/proxies
+
+# Queue newsletter sign-ups in memory and write them in batches (see welcomeletter/buffer.py)
+SUBSCRIBE_BUFFERED = config('SUBSCRIBE_BUFFERED', default=False, cast=bool)
+SUBSCRIBE_BUFFER_SIZE = config('SUBSCRIBE_BUFFER_SIZE', default=100, cast=int)  # flush once this many are queued
+SUBSCRIBE_BUFFER_MAX_DELAY = config('SUBSCRIBE_BUFFER_MAX_DELAY', default=2.0, cast=float)  # seconds
+
+# QR scans are counted in memory and added to QRScanDaily periodically (see welcomeletter/scans.py)
+QR_SCAN_FLUSH_INTERVAL = config('QR_SCAN_FLUSH_INTERVAL', default=60.0, cast=float)  # seconds
+QR_SCAN_MAX_SOURCES = config('QR_SCAN_MAX_SOURCES', default=5000, cast=int)  # distinct codes per day (and per worker between flushes) before 'other'
+
+# Request timings (see welcomeletter/metrics.py)
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+SERVER_TIMING = config('SERVER_TIMING', default='staff')  # who gets the Server-Timing header: 'staff', 'all' or 'off'
+METRICS_DIR = config('METRICS_DIR', default='')  # shared by the gunicorn workers so /metrics covers all of them
+METRICS_WRITE_INTERVAL = config('METRICS_WRITE_INTERVAL', default=15.0, cast=float)  # seconds
+METRICS_TOKEN = config('METRICS_TOKEN', default='')  # Bearer token for scraping /metrics; staff can always see it
+
+# Warn about repeated queries and views over their @query_budget (see welcomeletter/querylog.py)
+QUERY_LOG = config('QUERY_LOG', default=False, cast=bool)  # meant for development
+
+# Outgoing email (newsletter campaigns)
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=30, cast=int)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='webmaster@localhost')
+NEWSLETTER_FROM_EMAIL = config('NEWSLETTER_FROM_EMAIL', default=DEFAULT_FROM_EMAIL)
+NEWSLETTER_WORKERS = config('NEWSLETTER_WORKERS', default=4, cast=int)  # parallel SMTP connections
+NEWSLETTER_RATE_LIMIT = config('NEWSLETTER_RATE_LIMIT', default=10, cast=float)  # messages per second, 0 = unlimited
+
+# Background jobs run by `manage.py run_jobs` (see jobs/worker.py)
+JOBS_RETRY_BACKOFF = config('JOBS_RETRY_BACKOFF', default=10, cast=int)  # seconds before the first retry, doubled each time
+JOBS_LOCK_TIMEOUT = config('JOBS_LOCK_TIMEOUT', default=300, cast=int)  # requeue running jobs without a heartbeat for this long (dead worker)
+JOBS_HEARTBEAT_INTERVAL = config('JOBS_HEARTBEAT_INTERVAL', default=60, cast=int)  # seconds between lock renewals of a running job
+JOBS_RETENTION_DAYS = config('JOBS_RETENTION_DAYS', default=7, cast=int)  # keep finished jobs this long
+# Jobs of these queues that may run at once across all workers
+JOBS_QUEUE_CONCURRENCY = {
+    'images': config('JOBS_IMAGES_CONCURRENCY', default=1, cast=int),
+    'email': config('JOBS_EMAIL_CONCURRENCY', default=1, cast=int),
+    # Separate from 'email', so a long campaign does not hold up password resets
+    'campaigns': config('JOBS_CAMPAIGNS_CONCURRENCY', default=1, cast=int),
+}
+
 # Production security tweaks
 if not DEBUG:
     # Honor the `X-Forwarded-Proto` header for request.is_secure()
@@ -0,0 +1,25 @@
+"""
+Test runner for the project.
+
+Outside ``DEBUG`` the static files storage only serves names recorded by
+``collectstatic``, and the tests run without collecting. They use Django's
+plain storage instead; the tests of ``OptimizedStaticFilesStorage`` select it
+and collect into a temporary directory.
+"""
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._plain_static = override_settings(STORAGES={
+            **settings.STORAGES, 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        })
+        self._plain_static.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._plain_static.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,33 @@
+from django.contrib import admin
+from django.utils import timezone
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    change_list_template = 'admin/jobs/job/change_list.html'
+    list_display = ['task', 'queue', 'status', 'attempts', 'run_at', 'wait_time', 'finished_at']
+    list_filter = ['status', 'queue']
+    search_fields = ['task', 'locked_by']
+    ordering = ['-created_at']
+    readonly_fields = [
+        'task', 'args', 'kwargs', 'queue', 'priority', 'status', 'attempts', 'max_attempts',
+        'run_at', 'created_at', 'started_at', 'finished_at', 'locked_by', 'locked_at', 'last_error',
+    ]
+    
+    actions = ['retry_jobs']
+    
+    def has_add_permission(self, request):
+        # Jobs are created by the code that needs them
+        return False
+    
+    def retry_jobs(self, request, queryset):
+        count = queryset.exclude(status='running').update(
+            status='queued', attempts=0, run_at=timezone.now(), finished_at=None, locked_by='',
+        )
+        self.message_user(request, f'Queued {count} job(s) again')
+    retry_jobs.short_description = "Run selected jobs again"
+    
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {**(extra_context or {}), 'queue_stats': Job.objects.queue_stats()}
+        return super().changelist_view(request, extra_context)
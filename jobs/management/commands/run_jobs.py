@@ -0,0 +1,31 @@
+import signal
+
+from django.core.management.base import BaseCommand
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (image processing, emails, QR codes, campaigns)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='append', dest='queues', help='Only run jobs of this queue (repeatable)')
+        parser.add_argument('--concurrency', type=int, default=2, help='Jobs run in parallel by this worker')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between checks when idle')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due (for cron or deploy hooks)')
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            queues=options['queues'],
+            concurrency=options['concurrency'],
+            poll_interval=options['poll_interval'],
+        )
+
+        def shutdown(signum, frame):
+            self.stdout.write('Stopping after the jobs in progress...')
+            worker.stop()
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        self.stdout.write(f'Worker {worker.name} started ({options["concurrency"]} thread(s))')
+        processed = worker.run(burst=options['burst'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} job(s)'))
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:04
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def lock_running_jobs(apps, schema_editor):
+    # Jobs already running count from their start, as before
+    Job = apps.get_model('jobs', 'Job')
+    Job.objects.filter(status='running').update(locked_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='locked_at',
+            field=models.DateTimeField(blank=True, help_text='Last heartbeat of the worker running the job', null=True),
+        ),
+        migrations.RunPython(lock_running_jobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.db import models
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min, Q
+from django.utils import timezone
+
+
+class JobManager(models.Manager):
+    """Manager with queue depth and latency figures for the admin"""
+    
+    def queue_stats(self, window=timedelta(hours=1)):
+        """
+        Return one dict per queue with its depth and latency.
+        
+        ``oldest_wait`` is how long the oldest due job has been waiting and
+        ``avg_wait`` the average delay between due time and start for jobs
+        started within ``window``.
+        """
+        now = timezone.now()
+        due = Q(status='queued', run_at__lte=now)
+        wait = ExpressionWrapper(F('started_at') - F('run_at'), output_field=DurationField())
+        rows = self.values('queue').annotate(
+            queued=Count('id', filter=Q(status='queued')),
+            due=Count('id', filter=due),
+            running=Count('id', filter=Q(status='running')),
+            failed=Count('id', filter=Q(status='failed')),
+            oldest_due=Min('run_at', filter=due),
+            avg_wait=Avg(wait, filter=Q(started_at__gte=now - window)),
+        ).order_by('queue')
+        stats = []
+        for row in rows:
+            oldest_due = row.pop('oldest_due')
+            row['oldest_wait'] = now - oldest_due if oldest_due else None
+            stats.append(row)
+        return stats
+
+
+class Job(models.Model):
+    """A call of a registered task, run later by the run_jobs worker"""
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    task = models.CharField(max_length=200, help_text="Registered task name")
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    queue = models.CharField(max_length=50, default='default')
+    priority = models.SmallIntegerField(default=0, help_text="Higher runs first")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now, help_text="Not started before this time")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True, help_text="Worker running the job")
+    locked_at = models.DateTimeField(null=True, blank=True, help_text="Last heartbeat of the worker running the job")
+    last_error = models.TextField(blank=True)
+    
+    objects = JobManager()
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Job'
+        verbose_name_plural = 'Jobs'
+        indexes = [
+            models.Index(fields=['status', 'queue', 'run_at'], name='jobs_job_claim_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.task} #{self.pk}"
+    
+    @property
+    def wait_time(self):
+        """How long the job waited for a worker after it became due"""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.run_at
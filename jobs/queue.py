@@ -0,0 +1,74 @@
+"""
+Registering tasks and putting jobs on the queue.
+
+A task is a plain function decorated with ``@task`` in an app's ``tasks.py``
+(found by ``JobsConfig.ready``). ``enqueue`` stores a ``Job`` row naming the
+task and its JSON-serialisable arguments; the ``run_jobs`` worker picks it up.
+Enqueue inside the transaction that makes the work necessary: the job only
+becomes visible to workers when that transaction commits.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import Job
+
+
+registry = {}
+
+
+class Task:
+    """A registered function plus the defaults for its jobs"""
+
+    def __init__(self, func, name, queue, max_attempts, priority):
+        self.func = func
+        self.name = name
+        self.queue = queue
+        self.max_attempts = max_attempts
+        self.priority = priority
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, **kwargs):
+        """Queue a call of this task with the default options"""
+        return enqueue(self, *args, **kwargs)
+
+    def __repr__(self):
+        return f'<Task {self.name}>'
+
+
+def task(func=None, *, name=None, queue='default', max_attempts=3, priority=0):
+    """Register a function as a task; use as ``@task`` or ``@task(queue='images')``"""
+    def register(func):
+        registered = Task(func, name or f'{func.__module__}.{func.__name__}', queue, max_attempts, priority)
+        registry[registered.name] = registered
+        return registered
+    return register(func) if func is not None else register
+
+
+def get_task(name):
+    """Return the registered task called ``name`` or raise KeyError"""
+    return registry[name]
+
+
+def enqueue(task, *args, _queue=None, _delay=None, _priority=None, _max_attempts=None, **kwargs):
+    """Store a job for ``task`` (a ``Task`` or its name) and return it
+
+    Options for the job itself are passed with a leading underscore so they
+    cannot clash with the task's own keyword arguments.
+    """
+    if not isinstance(task, Task):
+        task = get_task(task)
+    run_at = timezone.now()
+    if _delay:
+        run_at += _delay if isinstance(_delay, timedelta) else timedelta(seconds=_delay)
+    return Job.objects.create(
+        task=task.name,
+        args=list(args),
+        kwargs=kwargs,
+        queue=_queue or task.queue,
+        priority=task.priority if _priority is None else _priority,
+        max_attempts=_max_attempts or task.max_attempts,
+        run_at=run_at,
+    )
@@ -0,0 +1,157 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Job
+from .queue import enqueue, task
+from .worker import Heartbeat, Worker, claim_job, requeue_stale_jobs, run_job
+
+
+calls = []
+
+
+@task(name='jobs.tests.record')
+def record(value, fail_times=0):
+    calls.append(value)
+    if calls.count(value) <= fail_times:
+        raise RuntimeError(f'failing {value}')
+
+
+@task(name='jobs.tests.limited', queue='limited')
+def limited(value):
+    calls.append(value)
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        job = record.enqueue('a')
+        self.assertEqual((job.task, job.args, job.status), ('jobs.tests.record', ['a'], 'queued'))
+
+        claimed = claim_job('test')
+        self.assertEqual((claimed.pk, claimed.status, claimed.attempts), (job.pk, 'running', 1))
+        self.assertIsNone(claim_job('test'))
+        self.assertTrue(run_job(claimed))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(calls, ['a'])
+
+    def test_delayed_and_prioritised_jobs(self):
+        enqueue('jobs.tests.record', 'later', _delay=60)
+        enqueue('jobs.tests.record', 'low')
+        enqueue('jobs.tests.record', 'high', _priority=10)
+        self.assertEqual(claim_job('test').args, ['high'])
+        self.assertEqual(claim_job('test').args, ['low'])
+        self.assertIsNone(claim_job('test'))
+
+    @override_settings(JOBS_RETRY_BACKOFF=10)
+    def test_retries_with_backoff_then_fails(self):
+        job = record.enqueue('b', fail_times=5, _max_attempts=2)
+        self.assertFalse(run_job(claim_job('test')))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('failing b', job.last_error)
+        self.assertGreaterEqual(job.run_at, timezone.now() + timedelta(seconds=9))
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        run_job(claim_job('test'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+    def test_unknown_task_fails(self):
+        job = Job.objects.create(task='jobs.tests.missing')
+        self.assertFalse(run_job(claim_job('test')))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    @override_settings(JOBS_LOCK_TIMEOUT=60)
+    def test_stale_running_jobs_are_requeued(self):
+        job = record.enqueue('c')
+        claim_job('dead-worker')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual(claim_job('test').pk, job.pk)
+
+    @override_settings(JOBS_LOCK_TIMEOUT=60)
+    def test_long_running_job_with_heartbeat_is_kept(self):
+        job = record.enqueue('g')
+        claim_job('busy-worker')
+        # Started long ago, but the lock was renewed recently
+        Job.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=5))
+        self.assertEqual(requeue_stale_jobs(), 0)
+
+    def test_outcome_not_recorded_after_losing_the_lock(self):
+        job = record.enqueue('h')
+        first = claim_job('slow-worker')
+        # The lock expired and another worker took the job over
+        Job.objects.filter(pk=job.pk).update(status='queued', locked_by='')
+        second = claim_job('other-worker')
+        self.assertFalse(run_job(first))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), ('running', 'other-worker'))
+        self.assertTrue(run_job(second))
+
+    @override_settings(JOBS_QUEUE_CONCURRENCY={'limited': 1})
+    def test_queue_concurrency_limit(self):
+        limited.enqueue(1)
+        limited.enqueue(2)
+        record.enqueue('other')
+        self.assertEqual(claim_job('w1').queue, 'limited')
+        # The limited queue is full, so the next worker takes other work
+        self.assertEqual(claim_job('w2').queue, 'default')
+        self.assertIsNone(claim_job('w3'))
+
+    def test_email_user_is_queued(self):
+        user = get_user_model().objects.create_user('guest@example.com', 'secret')
+        user.email_user('Welcome', 'Hello')
+        self.assertEqual(len(mail.outbox), 0)
+        run_job(claim_job('test'))
+        self.assertEqual(mail.outbox[0].to, ['guest@example.com'])
+
+    def test_admin_shows_queue_depth(self):
+        record.enqueue('d')
+        record.enqueue('e', _delay=600)
+        admin_user = get_user_model().objects.create_superuser('admin@example.com', 'secret')
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse('admin:jobs_job_changelist'))
+        self.assertEqual(response.context['queue_stats'][0]['queue'], 'default')
+        self.assertEqual(response.context['queue_stats'][0]['queued'], 2)
+        self.assertEqual(response.context['queue_stats'][0]['due'], 1)
+        self.assertContains(response, 'Oldest due job waiting')
+
+    def test_average_wait(self):
+        job = record.enqueue('f')
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now() - timedelta(seconds=30))
+        run_job(claim_job('test'))
+        wait = Job.objects.queue_stats()[0]['avg_wait']
+        self.assertGreaterEqual(wait, timedelta(seconds=30))
+
+
+class WorkerTests(TransactionTestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_concurrent_threads_run_each_job_once(self):
+        for i in range(30):
+            record.enqueue(i)
+        processed = Worker(concurrency=4, poll_interval=0.01).run(burst=True)
+        self.assertEqual(processed, 30)
+        self.assertEqual(sorted(calls), list(range(30)))
+        self.assertEqual(Job.objects.filter(status='done').count(), 30)
+
+    def test_heartbeat_renews_the_lock(self):
+        job = record.enqueue('i')
+        claimed = claim_job('test')
+        with Heartbeat(claimed, interval=0.05):
+            time.sleep(0.3)
+        job.refresh_from_db()
+        self.assertGreater(job.locked_at, claimed.locked_at)
@@ -0,0 +1,248 @@
+"""
+Claiming and running queued jobs.
+
+Workers claim one due job at a time. On databases that support it the
+candidate row is locked with ``SELECT ... FOR UPDATE SKIP LOCKED``, so
+workers never wait on each other; elsewhere (SQLite) the job is claimed with a
+conditional ``UPDATE ... WHERE status = 'queued'`` and a worker that loses the
+race moves on to the next candidate.
+
+A failing job is retried with exponential backoff until it has used
+``max_attempts``. While a job runs its worker renews the lock every
+``JOBS_HEARTBEAT_INTERVAL`` seconds; a job whose lock has not been renewed for
+``JOBS_LOCK_TIMEOUT`` (its worker died) is queued again, however long it has
+been running. A worker only records the outcome of a job it still holds. ``JOBS_QUEUE_CONCURRENCY`` caps how many
+jobs of a queue run at the same time across all workers (checked when
+claiming, so it is a best-effort limit).
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, connections, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Job
+from .queue import get_task
+
+
+logger = logging.getLogger(__name__)
+
+HOUSEKEEPING_INTERVAL = 60  # seconds between stale-job and cleanup sweeps
+
+
+def retry_delay(attempts):
+    """Seconds to wait before attempt number ``attempts + 1``"""
+    base = getattr(settings, 'JOBS_RETRY_BACKOFF', 10)
+    delay = min(base * 2 ** (attempts - 1), getattr(settings, 'JOBS_RETRY_BACKOFF_MAX', 3600))
+    # Jitter keeps jobs that failed together from retrying together
+    return delay * random.uniform(1, 1.1)
+
+
+def _full_queues(queues):
+    limits = getattr(settings, 'JOBS_QUEUE_CONCURRENCY', {})
+    limited = [queue for queue in limits if queues is None or queue in queues]
+    if not limited:
+        return []
+    running = dict(
+        Job.objects.filter(status='running', queue__in=limited)
+        .values_list('queue').annotate(count=Count('id')).values_list('queue', 'count')
+    )
+    return [queue for queue in limited if running.get(queue, 0) >= limits[queue]]
+
+
+def _due_jobs(queues, now):
+    jobs = Job.objects.filter(status='queued', run_at__lte=now)
+    if queues is not None:
+        jobs = jobs.filter(queue__in=queues)
+    full = _full_queues(queues)
+    if full:
+        jobs = jobs.exclude(queue__in=full)
+    return jobs.order_by('-priority', 'run_at', 'id')
+
+
+def claim_job(worker_name, queues=None):
+    """Mark the next due job as running for this worker and return it, or None"""
+    now = timezone.now()
+    claimed = {
+        'status': 'running', 'locked_by': worker_name, 'started_at': now, 'locked_at': now,
+        'attempts': F('attempts') + 1,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = _due_jobs(queues, now).select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            Job.objects.filter(pk=job.pk).update(**claimed)
+    else:
+        for pk in _due_jobs(queues, now).values_list('pk', flat=True)[:10]:
+            if Job.objects.filter(pk=pk, status='queued').update(**claimed):
+                break
+        else:
+            return None
+        job = Job(pk=pk)
+    job.refresh_from_db()
+    return job
+
+
+def owned(job):
+    """The job's row, as long as this claim of it still holds the lock"""
+    return Job.objects.filter(pk=job.pk, status='running', locked_by=job.locked_by, attempts=job.attempts)
+
+
+class Heartbeat:
+    """Renews a running job's lock from a background thread until the block exits"""
+
+    def __init__(self, job, interval=None):
+        self.job = job
+        self.interval = interval or getattr(settings, 'JOBS_HEARTBEAT_INTERVAL', 60)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f'jobs-heartbeat-{job.pk}', daemon=True)
+
+    def _beat(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    if not owned(self.job).update(locked_at=timezone.now()):
+                        logger.warning('Job %s lost its lock while running', self.job.pk)
+                        return
+                except Exception:
+                    logger.exception('Could not renew the lock of job %s', self.job.pk)
+        finally:
+            connections.close_all()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+
+def run_job(job):
+    """Call the job's task and record the outcome"""
+    try:
+        task = get_task(job.task)
+    except KeyError:
+        owned(job).update(status='failed', finished_at=timezone.now(), last_error=f'Unknown task {job.task}')
+        logger.error('Job %s: unknown task %s', job.pk, job.task)
+        return False
+
+    try:
+        with Heartbeat(job):
+            task(*job.args, **job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            delay = retry_delay(job.attempts)
+            recorded = owned(job).update(
+                status='queued', locked_by='', last_error=error,
+                run_at=timezone.now() + timedelta(seconds=delay),
+            )
+            if recorded:
+                logger.warning('Job %s (%s) failed, retrying in %.0fs', job.pk, job.task, delay, exc_info=True)
+        else:
+            recorded = owned(job).update(status='failed', finished_at=timezone.now(), last_error=error)
+            if recorded:
+                logger.error('Job %s (%s) failed for good after %d attempts', job.pk, job.task, job.attempts,
+                             exc_info=True)
+        if not recorded:
+            logger.warning('Job %s (%s) failed after its lock expired; outcome not recorded', job.pk, job.task,
+                           exc_info=True)
+        return False
+
+    if not owned(job).update(status='done', finished_at=timezone.now(), last_error=''):
+        logger.warning('Job %s (%s) finished after its lock expired; outcome not recorded', job.pk, job.task)
+        return False
+    return True
+
+
+def requeue_stale_jobs():
+    """Put back jobs whose worker stopped renewing their lock"""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'JOBS_LOCK_TIMEOUT', 300))
+    stale = Job.objects.filter(status='running', locked_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', finished_at=timezone.now(), last_error='Worker stopped while running the job',
+    )
+    requeued = stale.update(status='queued', locked_by='')
+    if failed or requeued:
+        logger.warning('Requeued %d and failed %d stale jobs', requeued, failed)
+    return requeued
+
+
+def purge_finished_jobs():
+    """Delete done jobs older than JOBS_RETENTION_DAYS"""
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'JOBS_RETENTION_DAYS', 7))
+    deleted, _ = Job.objects.filter(status='done', finished_at__lt=cutoff).delete()
+    return deleted
+
+
+class Worker:
+    """Runs jobs in ``concurrency`` threads until stopped"""
+
+    def __init__(self, queues=None, concurrency=1, poll_interval=1.0, name=None):
+        self.queues = queues or None
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+        self.processed = 0
+        self._lock = threading.Lock()
+
+    def stop(self):
+        """Finish the jobs in progress, then return from run()"""
+        self.stopping.set()
+
+    def _loop(self, number, burst):
+        name = f'{self.name}/{number}'
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                job = claim_job(name, self.queues)
+                if job is None:
+                    if burst:
+                        return
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                run_job(job)
+                with self._lock:
+                    self.processed += 1
+        finally:
+            connections.close_all()
+
+    def run(self, burst=False):
+        """Process jobs; with ``burst`` return as soon as no job is due"""
+        requeue_stale_jobs()
+        purge_finished_jobs()
+        threads = [
+            threading.Thread(target=self._loop, args=(number, burst), name=f'jobs-worker-{number}', daemon=True)
+            for number in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        housekeeping = time.monotonic()
+        try:
+            while not self.stopping.is_set():
+                alive = [thread for thread in threads if thread.is_alive()]
+                if not alive:
+                    break
+                alive[0].join(timeout=1)
+                if time.monotonic() - housekeeping >= HOUSEKEEPING_INTERVAL:
+                    housekeeping = time.monotonic()
+                    requeue_stale_jobs()
+                    purge_finished_jobs()
+        finally:
+            self.stopping.set()
+            for thread in threads:
+                thread.join()
+            connections.close_all()
+        return self.processed
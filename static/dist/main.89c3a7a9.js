@@ -0,0 +1,282 @@
+document.addEventListener('DOMContentLoaded', function() {
+initMobileMenu();
+initSmoothScroll();
+initScrollAnimations();
+initNewsletterForm();
+initReadMore();
+});
+function initMobileMenu() {
+const menuToggle = document.querySelector('.menu-toggle');
+const navMenu = document.querySelector('.nav-menu');
+const navOverlay = document.querySelector('.nav-overlay');
+const navLinks = document.querySelectorAll('.nav-menu a');
+if (!menuToggle || !navMenu) return;
+menuToggle.addEventListener('click', function() {
+toggleMenu();
+});
+if (navOverlay) {
+navOverlay.addEventListener('click', function() {
+closeMenu();
+});
+}
+navLinks.forEach(function(link) {
+link.addEventListener('click', function() {
+closeMenu();
+});
+});
+document.addEventListener('keydown', function(e) {
+if (e.key === 'Escape' && navMenu.classList.contains('active')) {
+closeMenu();
+}
+});
+function toggleMenu() {
+menuToggle.classList.toggle('active');
+navMenu.classList.toggle('active');
+if (navOverlay) {
+navOverlay.classList.toggle('active');
+}
+document.body.style.overflow = navMenu.classList.contains('active') ? 'hidden' : '';
+}
+function closeMenu() {
+menuToggle.classList.remove('active');
+navMenu.classList.remove('active');
+if (navOverlay) {
+navOverlay.classList.remove('active');
+}
+document.body.style.overflow = '';
+}
+}
+function initSmoothScroll() {
+const links = document.querySelectorAll('a[href^="#"]');
+links.forEach(function(link) {
+link.addEventListener('click', function(e) {
+const href = this.getAttribute('href');
+if (href === '#') return;
+const target = document.querySelector(href);
+if (target) {
+e.preventDefault();
+const headerOffset = 80;
+const elementPosition = target.getBoundingClientRect().top;
+const offsetPosition = elementPosition + window.pageYOffset - headerOffset;
+window.scrollTo({
+top: offsetPosition,
+behavior: 'smooth'
+});
+}
+});
+});
+}
+function initScrollAnimations() {
+const animatedElements = document.querySelectorAll('.info-card, .restaurant-card, .benefit-card, .feature-item');
+animatedElements.forEach(function(el) {
+el.classList.add('fade-in');
+});
+}
+function initNewsletterForm() {
+const form = document.querySelector('.newsletter-form');
+if (!form) {
+return;
+}
+let tokenRequest = null;
+function loadToken() {
+if (!tokenRequest) {
+tokenRequest = fetch(form.dataset.tokenUrl, { credentials: 'same-origin' })
+.then(function(response) { return response.json(); })
+.then(function(data) {
+let input = form.querySelector('input[name="csrfmiddlewaretoken"]');
+if (!input) {
+input = document.createElement('input');
+input.type = 'hidden';
+input.name = 'csrfmiddlewaretoken';
+form.appendChild(input);
+}
+input.value = data.csrfToken;
+return data.csrfToken;
+})
+.catch(function(error) {
+tokenRequest = null;
+throw error;
+});
+}
+return tokenRequest;
+}
+if (!window.fetch) {
+form.addEventListener('submit', function(e) {
+e.preventDefault();
+showNotification('Please update your browser to subscribe.', 'error');
+});
+return;
+}
+form.addEventListener('focusin', function() {
+loadToken().catch(function() {});
+}, { once: true });
+form.addEventListener('submit', function(e) {
+e.preventDefault();
+const email = form.querySelector('input[type="email"]');
+const checkbox = form.querySelector('input[type="checkbox"]');
+if (!email || !email.value || !isValidEmail(email.value)) {
+showNotification('Please enter a valid email address.', 'error');
+return;
+}
+if (checkbox && !checkbox.checked) {
+showNotification('Please agree to subscribe to the mailing list.', 'error');
+return;
+}
+loadToken()
+.then(function(token) {
+return fetch(form.action, {
+method: 'POST',
+credentials: 'same-origin',
+headers: {
+'X-CSRFToken': token,
+'X-Requested-With': 'XMLHttpRequest'
+},
+body: new FormData(form)
+});
+})
+.then(function(response) { return response.json(); })
+.then(function(data) {
+showNotification(data.message, data.success ? 'success' : 'error');
+if (data.success) {
+form.reset();
+}
+})
+.catch(function() {
+showNotification('Sorry, something went wrong. Please try again.', 'error');
+});
+});
+}
+function isValidEmail(email) {
+const pattern = /^[^\s@]+@[^\s@]+\.[^\s@]+$/;
+return pattern.test(email);
+}
+function showNotification(message, type) {
+const existingNotification = document.querySelector('.notification');
+if (existingNotification) {
+existingNotification.remove();
+}
+const notification = document.createElement('div');
+notification.className = 'notification notification-' + type;
+notification.textContent = message;
+notification.style.cssText = `
+        position: fixed;
+        bottom: 20px;
+        right: 20px;
+        padding: 1rem 1.5rem;
+        border-radius: 8px;
+        color: white;
+        font-weight: 500;
+        z-index: 9999;
+        animation: slideIn 0.3s ease;
+        background-color: ${type === 'success' ? '#28a745' : '#dc3545'};
+    `;
+document.body.appendChild(notification);
+setTimeout(function() {
+notification.style.animation = 'slideOut 0.3s ease';
+setTimeout(function() {
+notification.remove();
+}, 300);
+}, 3000);
+}
+(function addNotificationStyles() {
+const style = document.createElement('style');
+style.textContent = `
+        @keyframes slideIn {
+            from {
+                transform: translateX(100%);
+                opacity: 0;
+            }
+            to {
+                transform: translateX(0);
+                opacity: 1;
+            }
+        }
+        @keyframes slideOut {
+            from {
+                transform: translateX(0);
+                opacity: 1;
+            }
+            to {
+                transform: translateX(100%);
+                opacity: 0;
+            }
+        }
+    `;
+document.head.appendChild(style);
+})();
+function initReadMore() {
+const descriptions = document.querySelectorAll('.restaurant-content .description');
+descriptions.forEach(function(desc) {
+const btn = document.createElement('button');
+btn.className = 'read-more-btn';
+btn.type = 'button';
+btn.textContent = 'Read more';
+btn.setAttribute('aria-expanded', 'false');
+desc.insertAdjacentElement('afterend', btn);
+function checkOverflow() {
+const isOverflowing = desc.scrollHeight > desc.clientHeight + 1;
+btn.style.display = isOverflowing ? 'inline-block' : 'none';
+}
+checkOverflow();
+btn.addEventListener('click', function() {
+const expanded = btn.getAttribute('aria-expanded') === 'true';
+if (expanded) {
+desc.classList.remove('expanded');
+btn.textContent = 'Read more';
+btn.setAttribute('aria-expanded', 'false');
+desc.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
+} else {
+desc.classList.add('expanded');
+btn.textContent = 'Show less';
+btn.setAttribute('aria-expanded', 'true');
+}
+});
+window.addEventListener('resize', checkOverflow);
+});
+}
+(function initHeaderScroll() {
+const header = document.querySelector('.header');
+let lastScroll = 0;
+if (!header) return;
+window.addEventListener('scroll', function() {
+const currentScroll = window.pageYOffset;
+if (currentScroll <= 0) {
+header.style.boxShadow = '0 2px 10px rgba(0, 0, 0, 0.1)';
+return;
+}
+if (currentScroll > lastScroll) {
+header.style.boxShadow = '0 4px 20px rgba(0, 0, 0, 0.15)';
+} else {
+header.style.boxShadow = '0 2px 10px rgba(0, 0, 0, 0.1)';
+}
+lastScroll = currentScroll;
+});
+})();
+(function initLazyLoading() {
+if ('loading' in HTMLImageElement.prototype) {
+const images = document.querySelectorAll('img[data-src]');
+images.forEach(function(img) {
+img.src = img.dataset.src;
+});
+} else {
+const images = document.querySelectorAll('img[data-src]');
+if ('IntersectionObserver' in window) {
+const imageObserver = new IntersectionObserver(function(entries) {
+entries.forEach(function(entry) {
+if (entry.isIntersecting) {
+const image = entry.target;
+image.src = image.dataset.src;
+imageObserver.unobserve(image);
+}
+});
+});
+images.forEach(function(img) {
+imageObserver.observe(img);
+});
+} else {
+images.forEach(function(img) {
+img.src = img.dataset.src;
+});
+}
+}
+})();
@@ -110,7 +110,11 @@ function initScrollAnimations() {
 }
 
 /**
- * Newsletter Form Handling - Using standard form submission as fallback
+ * Newsletter Form Handling
+ * Pages are served without cookies, so the CSRF token is only fetched once
+ * the guest starts using the form. Submissions go through fetch and the
+ * result is shown as a notification. The page has no token of its own, so
+ * the form cannot be posted without fetch.
  */
 function initNewsletterForm() {
     const form = document.querySelector('.newsletter-form');
@@ -119,26 +123,82 @@ function initNewsletterForm() {
         return;
     }
     
-    // Just do basic validation, let the form submit normally if AJAX fails
+    let tokenRequest = null;
+    
+    function loadToken() {
+        if (!tokenRequest) {
+            tokenRequest = fetch(form.dataset.tokenUrl, { credentials: 'same-origin' })
+                .then(function(response) { return response.json(); })
+                .then(function(data) {
+                    let input = form.querySelector('input[name="csrfmiddlewaretoken"]');
+                    if (!input) {
+                        input = document.createElement('input');
+                        input.type = 'hidden';
+                        input.name = 'csrfmiddlewaretoken';
+                        form.appendChild(input);
+                    }
+                    input.value = data.csrfToken;
+                    return data.csrfToken;
+                })
+                .catch(function(error) {
+                    tokenRequest = null;
+                    throw error;
+                });
+        }
+        return tokenRequest;
+    }
+    
+    if (!window.fetch) {
+        form.addEventListener('submit', function(e) {
+            e.preventDefault();
+            showNotification('Please update your browser to subscribe.', 'error');
+        });
+        return;
+    }
+    
+    // Warm up the token as soon as the guest shows interest in the form
+    form.addEventListener('focusin', function() {
+        loadToken().catch(function() {});
+    }, { once: true });
+    
     form.addEventListener('submit', function(e) {
+        e.preventDefault();
+        
         const email = form.querySelector('input[type="email"]');
         const checkbox = form.querySelector('input[type="checkbox"]');
         
-        // Basic validation only - don't prevent default
         if (!email || !email.value || !isValidEmail(email.value)) {
-            e.preventDefault();
             showNotification('Please enter a valid email address.', 'error');
             return;
         }
         
         if (checkbox && !checkbox.checked) {
-            e.preventDefault();
             showNotification('Please agree to subscribe to the mailing list.', 'error');
             return;
         }
         
-        // Let the form submit normally - the server will handle it
-        // This ensures it works even if there's a JavaScript issue
+        loadToken()
+            .then(function(token) {
+                return fetch(form.action, {
+                    method: 'POST',
+                    credentials: 'same-origin',
+                    headers: {
+                        'X-CSRFToken': token,
+                        'X-Requested-With': 'XMLHttpRequest'
+                    },
+                    body: new FormData(form)
+                });
+            })
+            .then(function(response) { return response.json(); })
+            .then(function(data) {
+                showNotification(data.message, data.success ? 'success' : 'error');
+                if (data.success) {
+                    form.reset();
+                }
+            })
+            .catch(function() {
+                showNotification('Sorry, something went wrong. Please try again.', 'error');
+            });
     });
 }
 
@@ -1,5 +1,17 @@
-from django.contrib import admin
-from .models import ExternalLink, Restaurant, TransferOption, MailingListSubscriber, SiteSettings
+import csv
+import io
+
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.db.models import Count, Q, Sum
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from hilton_ramses.changelists import FastChangeListMixin
+from .exports import export_response
+from .imports import import_subscribers
+from .models import ExternalLink, Restaurant, TransferOption, MailingListSubscriber, Campaign, QRScanDaily, SiteSettings
 
 
 @admin.register(ExternalLink)
@@ -50,15 +62,26 @@ class TransferOptionAdmin(admin.ModelAdmin):
     list_editable = ['order', 'is_active']
 
 
+class SubscriberImportForm(forms.Form):
+    csv_file = forms.FileField(
+        label='CSV file',
+        help_text='A column named "email" (or addresses in the first column). Unsubscribed addresses are reactivated.',
+    )
+
+
 @admin.register(MailingListSubscriber)
-class MailingListSubscriberAdmin(admin.ModelAdmin):
+class MailingListSubscriberAdmin(FastChangeListMixin, admin.ModelAdmin):
+    change_list_template = 'admin/welcomeletter/mailinglistsubscriber/change_list.html'
     list_display = ['email', 'is_active', 'subscribed_at', 'ip_address']
     list_filter = ['is_active', 'subscribed_at']
     search_fields = ['email']
+    search_help_text = 'Addresses starting with the search text'
+    prefix_search_field = 'email'
+    prefix_search_lowercase = True
     ordering = ['-subscribed_at']
     readonly_fields = ['subscribed_at', 'ip_address']
     
-    actions = ['activate_subscribers', 'deactivate_subscribers']
+    actions = ['activate_subscribers', 'deactivate_subscribers', 'export_csv', 'export_jsonl']
     
     def activate_subscribers(self, request, queryset):
         queryset.update(is_active=True)
@@ -67,6 +90,101 @@ class MailingListSubscriberAdmin(admin.ModelAdmin):
     def deactivate_subscribers(self, request, queryset):
         queryset.update(is_active=False)
     deactivate_subscribers.short_description = "Deactivate selected subscribers"
+    
+    def export_csv(self, request, queryset):
+        return export_response(queryset, 'csv')
+    export_csv.short_description = "Export selected subscribers as CSV"
+    
+    def export_jsonl(self, request, queryset):
+        return export_response(queryset, 'jsonl')
+    export_jsonl.short_description = "Export selected subscribers as JSON Lines"
+    
+    def get_urls(self):
+        urls = [
+            path('import/', self.admin_site.admin_view(self.import_csv), name='welcomeletter_mailinglistsubscriber_import'),
+        ]
+        return urls + super().get_urls()
+    
+    def import_csv(self, request):
+        """Upload a CSV file of subscribers"""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = SubscriberImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            lines = io.TextIOWrapper(form.cleaned_data['csv_file'].file, encoding='utf-8-sig', newline='')
+            try:
+                result = import_subscribers(lines)
+            except (UnicodeDecodeError, csv.Error) as exc:
+                form.add_error('csv_file', f'Could not read the file: {exc}')
+            else:
+                self.message_user(request, f'Imported {result}', messages.SUCCESS)
+                return redirect('admin:welcomeletter_mailinglistsubscriber_changelist')
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Import subscribers',
+            'opts': self.model._meta,
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/welcomeletter/mailinglistsubscriber/import.html', context)
+
+
+@admin.register(Campaign)
+class CampaignAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'status', 'sent_count', 'failed_count', 'created_at', 'finished_at']
+    list_filter = ['status']
+    search_fields = ['subject']
+    readonly_fields = ['status', 'created_at', 'started_at', 'finished_at']
+    
+    actions = ['send_in_background']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            sent=Count('deliveries', filter=Q(deliveries__status='sent')),
+            failed=Count('deliveries', filter=Q(deliveries__status='failed')),
+        )
+    
+    def sent_count(self, obj):
+        return obj.sent
+    sent_count.short_description = 'Sent'
+    sent_count.admin_order_field = 'sent'
+    
+    def failed_count(self, obj):
+        return obj.failed
+    failed_count.short_description = 'Failed'
+    failed_count.admin_order_field = 'failed'
+    
+    def send_in_background(self, request, queryset):
+        from .tasks import send_campaign_job
+        for campaign in queryset:
+            send_campaign_job.enqueue(campaign.pk)
+        self.message_user(request, f'Queued {queryset.count()} campaign(s) for sending')
+    send_in_background.short_description = "Send selected campaigns (background job)"
+
+
+@admin.register(QRScanDaily)
+class QRScanDailyAdmin(admin.ModelAdmin):
+    change_list_template = 'admin/welcomeletter/qrscandaily/change_list.html'
+    list_display = ['day', 'source', 'count']
+    search_fields = ['source']
+    date_hierarchy = 'day'
+    readonly_fields = ['day', 'source', 'count']
+    
+    def has_add_permission(self, request):
+        # Rows are written by the scan counters
+        return False
+    
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        changelist = getattr(response, 'context_data', {}).get('cl')
+        if changelist is not None:
+            # Roll up whatever the date hierarchy and search currently select
+            scans = changelist.queryset.order_by()
+            response.context_data.update({
+                'scan_total': scans.aggregate(total=Sum('count'))['total'] or 0,
+                'scans_by_day': scans.values('day').annotate(total=Sum('count')).order_by('-day')[:31],
+                'top_sources': scans.values('source').annotate(total=Sum('count')).order_by('-total', 'source')[:20],
+            })
+        return response
 
 
 @admin.register(SiteSettings)
@@ -0,0 +1,432 @@
+"""
+Critical CSS and minified, content-hashed CSS/JS bundles.
+
+``build_assets`` minifies each file in ``BUNDLES`` into ``static/dist/`` under a
+name carrying a hash of its content (``main.3f2a9c1d.css``), so browsers can
+cache it for good, then renders every public page to find the CSS its first
+screen needs: the rules whose selectors can match an element of the header
+and the first ``FOLD_SECTIONS`` sections of the page (or a class ``main.js``
+adds at load), plus the custom properties, ``@font-face`` rules and the
+keyframes they use. Everything goes into ``static/dist/assets.json``.
+
+``{% page_css %}`` in ``base.html`` inlines that CSS in ``<head>`` and loads the
+full bundle without blocking the first render, resolving the fonts and images
+it refers to through the static files storage (so they get the same hashed
+URLs as in the bundle and the font preloads); ``{% bundle %}`` gives the URL
+of a hashed bundle. Until the build has run, or when a source file no longer
+matches what was built from it, both fall back to the plain source files.
+"""
+import gzip
+import hashlib
+import inspect
+import json
+import logging
+import posixpath
+import re
+from html.parser import HTMLParser
+from pathlib import Path
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.signals import setting_changed
+from django.test import RequestFactory
+from django.urls import resolve
+
+
+logger = logging.getLogger(__name__)
+
+BUNDLES = ['css/main.css', 'js/main.js']
+CRITICAL_SOURCE = 'css/main.css'
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'assets.json'
+# The header plus this many top-level sections make up the first screen
+FOLD_SECTIONS = 2
+# Blocks holding declarations rather than rules
+DECLARATION_AT_RULES = ('@font-face', '@page', '@property', '@counter-style')
+
+_CSS_STRING = r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\''
+_CSS_COMMENTS = re.compile(rf'({_CSS_STRING})|/\*.*?\*/', re.DOTALL)
+_CSS_STRINGS = re.compile(rf'({_CSS_STRING})')
+_CSS_URLS = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+_ABSOLUTE_URL = re.compile(r'[a-z]+:|/|#')
+_STATE_PSEUDO = re.compile(r':(?:hover|focus|focus-visible|focus-within|active|visited)\b')
+_IGNORED_PARTS = re.compile(r'::?[\w-]+(?:\([^)]*\))?|\[[^\]]*\]')
+_JS_CLASSES = re.compile(r'classList\.add\(([^)]*)\)|className\s*=\s*([\'"][^\'"]*[\'"])')
+# A ``/`` after one of these starts a regular expression, not a division
+_JS_REGEX_PREFIX = set('(,=:[!&|?{};')
+
+
+def static_dir():
+    return Path(settings.STATICFILES_DIRS[0])
+
+
+def sha256(data):
+    return hashlib.sha256(data.encode() if isinstance(data, str) else data).hexdigest()
+
+
+def minify_css(text):
+    """``text`` without comments and optional whitespace; strings are left alone"""
+    text = _CSS_COMMENTS.sub(lambda match: match.group(1) or '', text)
+    parts = _CSS_STRINGS.split(text)
+    for index in range(0, len(parts), 2):
+        part = re.sub(r'\s+', ' ', parts[index])
+        part = re.sub(r'\s*([{};,>])\s*', r'\1', part)
+        parts[index] = re.sub(r':\s+', ':', part).replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+def minify_js(text):
+    """``text`` without comments, indentation and blank lines
+
+    Line breaks are kept so automatic semicolon insertion still works, and
+    strings, template literals and regular expressions pass through as-is.
+    """
+    out, index, length = [], 0, len(text)
+    previous = ''  # last significant character written
+    while index < length:
+        char = text[index]
+        pair = text[index:index + 2]
+        if char in '\'"`':
+            end = index + 1
+            while end < length and text[end] != char:
+                end += 2 if text[end] == '\\' else 1
+            out.append(text[index:end + 1])
+            index, previous = end + 1, char
+        elif pair == '//':
+            index = text.find('\n', index)
+            index = length if index == -1 else index
+        elif pair == '/*':
+            end = text.find('*/', index + 2)
+            index = length if end == -1 else end + 2
+        elif char == '/' and previous in _JS_REGEX_PREFIX:
+            end, in_class = index + 1, False
+            while end < length and (text[end] != '/' or in_class):
+                if text[end] == '\\':
+                    end += 1
+                elif text[end] in '[]':
+                    in_class = text[end] == '['
+                end += 1
+            out.append(text[index:end + 1])
+            index, previous = end + 1, '/'
+        elif char == '\n':
+            # Drop trailing spaces, indentation and blank lines
+            while out and out[-1] in (' ', '\t'):
+                out.pop()
+            if out and out[-1] != '\n':
+                out.append(char)
+            while index < length and text[index] in ' \t\r\n':
+                index += 1
+        else:
+            out.append(char)
+            if not char.isspace():
+                previous = char
+            index += 1
+    return ''.join(out).strip() + '\n'
+
+
+def _find(text, characters, pos):
+    """Index of the first of ``characters`` at or after ``pos`` outside a string, or -1"""
+    while pos < len(text):
+        char = text[pos]
+        if char in '\'"':
+            match = _CSS_STRINGS.match(text, pos)
+            pos = match.end() if match else pos + 1
+            continue
+        if char in characters:
+            return pos
+        pos += 1
+    return -1
+
+
+def parse_css(text):
+    """``[(prelude, body)]`` of minified CSS; ``body`` is a list of the same for at-rules holding rules"""
+    return _parse_rules(text, 0)[0]
+
+
+def _parse_rules(text, pos):
+    rules = []
+    while pos < len(text):
+        if text[pos] == '}':
+            return rules, pos + 1
+        brace = _find(text, '{;}', pos)
+        if brace == -1:
+            break
+        if text[brace] == ';':
+            # @charset / @import
+            rules.append((text[pos:brace], None))
+            pos = brace + 1
+            continue
+        prelude = text[pos:brace].strip()
+        if prelude.startswith('@') and not prelude.startswith(DECLARATION_AT_RULES):
+            children, pos = _parse_rules(text, brace + 1)
+            rules.append((prelude, children))
+        else:
+            end = _find(text, '}', brace + 1)
+            end = len(text) if end == -1 else end
+            rules.append((prelude, text[brace + 1:end]))
+            pos = end + 1
+    return rules, pos
+
+
+def serialize_css(rules):
+    out = []
+    for prelude, body in rules:
+        if body is None:
+            out.append(prelude + ';')
+        elif isinstance(body, list):
+            out.append(prelude + '{' + serialize_css(body) + '}')
+        else:
+            out.append(prelude + '{' + body + '}')
+    return ''.join(out)
+
+
+def split_selectors(prelude):
+    """The selectors of a comma-separated list, leaving commas inside ``:is(...)`` and the like alone"""
+    selectors, depth, start = [], 0, 0
+    for index, char in enumerate(prelude):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            selectors.append(prelude[start:index])
+            start = index + 1
+    selectors.append(prelude[start:])
+    return [selector.strip() for selector in selectors if selector.strip()]
+
+
+def selector_matches(selector, tags, classes, ids):
+    """Whether ``selector`` may match an element built from ``tags``, ``classes`` and ``ids``
+
+    Errs on the side of keeping: pseudo-classes, pseudo-elements and attribute
+    selectors are ignored, except the interaction states, which cannot apply
+    before the page has rendered.
+    """
+    if _STATE_PSEUDO.search(selector):
+        return False
+    for compound in re.split(r'[\s>+~]+', _IGNORED_PARTS.sub('', selector)):
+        if not compound or compound == '*':
+            continue
+        tag = re.match(r'[a-zA-Z][\w-]*', compound)
+        if tag and tag.group().lower() not in tags:
+            return False
+        if not set(re.findall(r'\.([\w-]+)', compound)) <= classes:
+            return False
+        if not set(re.findall(r'#([\w-]+)', compound)) <= ids:
+            return False
+    return True
+
+
+class FoldParser(HTMLParser):
+    """Tags, classes and ids of the first screen: the ``<body>`` up to the end of its first sections"""
+
+    def __init__(self, sections=FOLD_SECTIONS):
+        super().__init__()
+        self.tags, self.classes, self.ids = {'html', 'body'}, set(), set()
+        self.sections = sections
+        self.open_sections = 0
+        self.in_body = self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        self.in_body = self.in_body or tag == 'body'
+        if not self.in_body or self.done:
+            return
+        attrs = dict(attrs)
+        self.tags.add(tag)
+        self.classes.update((attrs.get('class') or '').split())
+        if attrs.get('id'):
+            self.ids.add(attrs['id'])
+        if tag == 'section':
+            self.open_sections += 1
+
+    def handle_endtag(self, tag):
+        if tag == 'section' and self.in_body and not self.done:
+            self.open_sections -= 1
+            if self.open_sections == 0:
+                self.sections -= 1
+                self.done = self.sections <= 0
+
+
+def script_classes(script):
+    """Classes ``script`` adds to elements (``classList.add('x')``, ``className = 'x y'``)"""
+    classes = set()
+    for added, assigned in _JS_CLASSES.findall(script):
+        for literal in re.findall(r'[\'"]([^\'"]*)[\'"]', added or assigned):
+            classes.update(literal.split())
+    return classes
+
+
+def static_paths(css, source):
+    """Make the relative ``url()`` references of ``css`` (from the static file ``source``) static paths"""
+    def replace(match):
+        quote, url = match.groups()
+        if _ABSOLUTE_URL.match(url):
+            return match.group(0)
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(source), url))
+        return f'url({quote}{path}{quote})'
+    return _CSS_URLS.sub(replace, css)
+
+
+def static_urls(css):
+    """Resolve the static paths left in ``url()`` references by ``static_paths`` through the storage"""
+    def replace(match):
+        quote, path = match.groups()
+        if _ABSOLUTE_URL.match(path):
+            return match.group(0)
+        return f'url({quote}{staticfiles_storage.url(path)}{quote})'
+    return _CSS_URLS.sub(replace, css)
+
+
+def critical_css(rules, tags, classes, ids):
+    """The part of the parsed stylesheet ``rules`` the first screen needs"""
+    def keep(rules):
+        kept = []
+        for prelude, body in rules:
+            if body is None or prelude.startswith('@font-face'):
+                kept.append((prelude, body))
+            elif re.match(r'@(-\w+-)?keyframes', prelude):
+                continue
+            elif isinstance(body, list):
+                children = keep(body)
+                if children:
+                    kept.append((prelude, children))
+            else:
+                selectors = [s for s in split_selectors(prelude) if selector_matches(s, tags, classes, ids)]
+                if selectors:
+                    kept.append((','.join(selectors), body))
+        return kept
+
+    kept = keep(rules)
+    css = serialize_css(kept)
+    animations = ' '.join(re.findall(r'animation(?:-name)?:([^;}]*)', css))
+    for prelude, body in rules:
+        if re.match(r'@(-\w+-)?keyframes', prelude):
+            name = re.escape(prelude.split()[-1])
+            if re.search(rf'(?<![\w-]){name}(?![\w-])', animations):
+                kept.append((prelude, body))
+    return serialize_css(kept)
+
+
+def render_page(url_path, callback, host):
+    """The HTML of the undecorated view at ``url_path``"""
+    request = RequestFactory().get(url_path, HTTP_HOST=host)
+    request.resolver_match = resolve(url_path)
+    view = inspect.unwrap(callback)
+    response = async_to_sync(view)(request) if iscoroutinefunction(view) else view(request)
+    if response.status_code != 200:
+        raise ValueError(f'{url_path} returned HTTP {response.status_code}')
+    return response.content.decode()
+
+
+def first_render_bytes(html):
+    """Gzipped bytes a browser needs before its first render: the HTML and the stylesheets it blocks on"""
+    head = html.split('</head>', 1)[0]
+    head = re.sub(r'<noscript>.*?</noscript>', '', head, flags=re.DOTALL)
+    total = len(gzip.compress(html.encode(), 6, mtime=0))
+    for link in re.findall(r'<link\b[^>]*>', head):
+        href = re.search(r'href="([^"]+)"', link)
+        if 'rel="stylesheet"' in link and href and href.group(1).startswith(settings.STATIC_URL):
+            path = static_dir() / href.group(1)[len(settings.STATIC_URL):].split('?')[0]
+            total += len(gzip.compress(path.read_bytes(), 6, mtime=0))
+    return total
+
+
+class Assets:
+    """The bundles and critical CSS recorded in ``assets.json``, where their sources still match"""
+
+    def __init__(self, manifest=None):
+        manifest = manifest or {}
+        # Changes whenever build_assets writes different bundles or critical CSS
+        self.build_id = sha256(json.dumps(manifest, sort_keys=True).encode())[:8]
+        self.bundles, self.critical = {}, {}
+        for source, entry in manifest.get('bundles', {}).items():
+            path = static_dir() / source
+            if path.exists() and sha256(path.read_bytes()) == entry['source_sha256']:
+                self.bundles[source] = entry['name']
+            else:
+                logger.warning('%s changed since the last build_assets, serving it unminified', source)
+        if CRITICAL_SOURCE in self.bundles:
+            self.critical = manifest.get('critical', {})
+        self._critical_urls = {}
+
+    def bundle(self, source):
+        """Static path of the built bundle of ``source``, or ``source`` itself"""
+        return self.bundles.get(source, source)
+
+    def critical_css(self, url_name):
+        """The critical CSS of the page ``url_name`` with its URLs resolved, or None"""
+        if url_name not in self.critical:
+            return None
+        if url_name not in self._critical_urls:
+            self._critical_urls[url_name] = static_urls(self.critical[url_name])
+        return self._critical_urls[url_name]
+
+
+_assets = None
+
+
+def get_assets():
+    global _assets
+    if _assets is None:
+        path = static_dir() / DIST_DIR / MANIFEST_NAME
+        _assets = Assets(json.loads(path.read_text()) if path.exists() else None)
+    return _assets
+
+
+def reset_assets(**kwargs):
+    global _assets
+    if kwargs.get('setting', 'STATICFILES_DIRS') in ('STATICFILES_DIRS', 'STATIC_URL', 'STORAGES'):
+        _assets = None
+
+
+def build_assets(pages=True, host=None):
+    """Write the bundles and the critical CSS of every public page; returns the new manifest
+
+    Pages are only rendered with ``pages``, which needs the database.
+    """
+    # The page cache keys pages by get_assets().build_id
+    from .pagecache import public_pages, purge_pages
+
+    dist = static_dir() / DIST_DIR
+    dist.mkdir(parents=True, exist_ok=True)
+    manifest_path = dist / MANIFEST_NAME
+    previous = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    manifest = {'bundles': {}, 'critical': {}}
+    sources = {}
+    for source in BUNDLES:
+        text = (static_dir() / source).read_text(encoding='utf-8')
+        minified = minify_css(text) if source.endswith('.css') else minify_js(text)
+        stem, suffix = posixpath.splitext(posixpath.basename(source))
+        name = f'{DIST_DIR}/{stem}.{sha256(minified)[:8]}{suffix}'
+        target = static_dir() / name
+        if not target.exists():
+            target.write_text(minified, encoding='utf-8')
+        manifest['bundles'][source] = {'name': name, 'source_sha256': sha256(text.encode()), 'bytes': len(minified)}
+        sources[source] = minified
+
+    if pages:
+        host = host or next((h for h in settings.ALLOWED_HOSTS if h and not h.startswith('.') and h != '*'), 'localhost')
+        rules = parse_css(sources[CRITICAL_SOURCE])
+        added = set().union(*(script_classes(sources[s]) for s in sources if s.endswith('.js')))
+        for url_path, callback in public_pages():
+            fold = FoldParser()
+            fold.feed(render_page(url_path, callback, host))
+            css = critical_css(rules, fold.tags, fold.classes | added, fold.ids)
+            manifest['critical'][resolve(url_path).url_name] = static_paths(css, CRITICAL_SOURCE)
+
+    # Superseded bundles go; pages cached with their names are purged below, and
+    # collectstatic leaves the copies already in STATIC_ROOT for HTML cached elsewhere
+    keep = {MANIFEST_NAME} | {posixpath.basename(entry['name']) for entry in manifest['bundles'].values()}
+    for path in dist.iterdir():
+        if path.is_file() and path.name not in keep:
+            path.unlink()
+    manifest_path.write_text(json.dumps(manifest, indent=2, sort_keys=True) + '\n')
+    reset_assets()
+    if manifest != previous:
+        # Cached pages link the old bundles and inline the old critical CSS
+        purge_pages()
+    return manifest
+
+
+setting_changed.connect(reset_assets, dispatch_uid='welcomeletter_reset_assets')
@@ -0,0 +1,166 @@
+"""
+Coroutine versions of the views in ``views.py``, for ASGI deployments.
+
+With ``ASYNC_VIEWS`` (set by ``hilton_ramses/asgi.py``) ``urls.py`` routes to
+these instead. They share the decorators, templates and helpers of the sync
+views, take their content from ``aget_snapshot`` and reach the database only
+through the async ORM, so a worker keeps answering other guests while one
+request waits for the database. Rendering is CPU work and stays on the event
+loop; the snapshot already holds everything the templates read.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.middleware.csrf import get_token
+from django.shortcuts import render
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_GET, require_POST
+
+from .buffer import get_buffer
+from .conditional import conditional_page
+from .content import aget_snapshot
+from .metrics import CONTENT_TYPE, get_metrics, render_prometheus
+from .models import MailingListSubscriber
+from .pagecache import cache_public_page
+from .querylog import query_budget
+from .scans import get_counter
+from .views import (
+    BUFFERED_MESSAGE, SUBSCRIBE_MESSAGES, clean_email, get_client_ip, get_common_context, has_metrics_token,
+    newsletter_response,
+)
+
+
+async def page_context(request):
+    """Common context of the public pages, plus the snapshot it came from"""
+    # conditional_page has already loaded it for this request
+    snapshot = getattr(request, 'content_snapshot', None) or await aget_snapshot()
+    return snapshot, get_common_context(snapshot)
+
+
+@query_budget(6)
+@conditional_page
+@cache_public_page
+async def home(request):
+    """Welcome Letter page - main landing page"""
+    snapshot, context = await page_context(request)
+    return render(request, 'home.html', context)
+
+
+@query_budget(6)
+@conditional_page
+@cache_public_page
+async def transfers(request):
+    """Transfers & Parking page"""
+    snapshot, context = await page_context(request)
+    context['transfer_options'] = snapshot.transfer_options
+    return render(request, 'transfers.html', context)
+
+
+@query_budget(6)
+@conditional_page
+@cache_public_page
+async def info(request):
+    """Important Information page"""
+    snapshot, context = await page_context(request)
+    context['room_dining_link'] = snapshot.first_link('room_dining')
+    context['info_link'] = snapshot.first_link('info')
+    return render(request, 'info.html', context)
+
+
+@query_budget(6)
+@conditional_page
+@cache_public_page
+async def restaurants(request):
+    """Restaurants & Bars page"""
+    snapshot, context = await page_context(request)
+    context['restaurants'] = snapshot.restaurants
+    return render(request, 'restaurants.html', context)
+
+
+@query_budget(6)
+@conditional_page
+@cache_public_page
+async def kids(request):
+    """Kids & Family page"""
+    snapshot, context = await page_context(request)
+    return render(request, 'kids.html', context)
+
+
+@query_budget(6)
+@conditional_page
+@cache_public_page
+async def spa(request):
+    """The Spa page"""
+    snapshot, context = await page_context(request)
+    context['spa_menu_link'] = snapshot.links_by_slug.get('spa-menu')
+    return render(request, 'spa.html', context)
+
+
+@query_budget(6)
+@conditional_page
+@cache_public_page
+async def board_menus(request):
+    """Half & Full Board Menus page"""
+    snapshot, context = await page_context(request)
+    context['restaurants'] = snapshot.restaurants
+    return render(request, 'board_menus.html', context)
+
+
+@query_budget(6)
+@conditional_page
+@cache_public_page
+async def hilton_honors(request):
+    """Hilton Honors Benefits page"""
+    snapshot, context = await page_context(request)
+    return render(request, 'hilton_honors.html', context)
+
+
+@query_budget(0)
+@never_cache
+async def qr_redirect(request, source, target=''):
+    """Count a scan of a printed QR code and send the guest on to its page"""
+    get_counter().add(source)
+    url = '/' + target.lstrip('/')
+    if request.META.get('QUERY_STRING'):
+        url += '?' + request.META['QUERY_STRING']
+    return HttpResponseRedirect(url)
+
+
+@query_budget(0)
+@never_cache
+@require_GET
+async def newsletter_token(request):
+    """Hand out a CSRF token for the newsletter form when a guest starts using it"""
+    return JsonResponse({'csrfToken': get_token(request)})
+
+
+@query_budget(7)
+@require_POST
+async def subscribe_newsletter(request):
+    """Handle newsletter subscription"""
+    email, error = clean_email(request)
+    if error:
+        return newsletter_response(False, error)
+
+    ip_address = get_client_ip(request)
+    if getattr(settings, 'SUBSCRIBE_BUFFERED', False):
+        get_buffer().add(email, ip_address)
+        message = BUFFERED_MESSAGE
+    else:
+        status = await MailingListSubscriber.objects.asubscribe(email, ip_address)
+        message = SUBSCRIBE_MESSAGES[status]
+    return newsletter_response(True, message)
+
+
+@query_budget(2)
+@never_cache
+@require_GET
+async def metrics(request):
+    """Request metrics of all workers for Prometheus (token or staff only)"""
+    if not getattr(settings, 'METRICS_ENABLED', True):
+        raise Http404
+    if not has_metrics_token(request) and not (await request.auser()).is_staff:
+        raise Http404
+    # Reads every worker's metrics file
+    collected = await sync_to_async(get_metrics().collect)()
+    return HttpResponse(render_prometheus(collected), content_type=CONTENT_TYPE)
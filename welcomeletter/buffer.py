@@ -0,0 +1,221 @@
+"""
+Write-behind buffer for newsletter subscriptions.
+
+With ``SUBSCRIBE_BUFFERED`` enabled, ``subscribe_newsletter`` only validates
+the address and hands it to the process-wide ``SubscriptionBuffer``; the
+request is answered without touching the database. A background thread writes
+the queued addresses in one ``bulk_create(..., ignore_conflicts=True)`` when
+``SUBSCRIBE_BUFFER_SIZE`` addresses are waiting or the oldest one has waited
+``SUBSCRIBE_BUFFER_MAX_DELAY`` seconds, then reactivates any of them that had
+unsubscribed.
+
+Queued addresses only live in the worker's memory. They are flushed when the
+worker shuts down gracefully (the ``worker_exit`` hook in ``gunicorn.conf.py``
+and an ``atexit`` handler), and a failed flush puts them back in the queue, but
+a killed worker loses whatever was still waiting. ``stats()`` reports the
+buffer depth and flush latency; ``/metrics`` exports them for every worker
+(see ``metrics.Metrics.snapshot``).
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def write_subscriptions(entries):
+    """Insert new subscribers and reactivate returning ones; ``entries`` maps email to IP"""
+    from .models import MailingListSubscriber
+
+    MailingListSubscriber.objects.bulk_create(
+        [MailingListSubscriber(email=email, ip_address=ip) for email, ip in entries.items()],
+        ignore_conflicts=True,
+    )
+    MailingListSubscriber.objects.filter(email__in=list(entries), is_active=False).update(
+        is_active=True, unsubscribed_at=None,
+    )
+
+
+class SubscriptionBuffer:
+    """Thread-safe queue of subscriptions written to the database in batches"""
+
+    def __init__(self, max_size=100, max_delay=2.0, writer=write_subscriptions, clock=time.monotonic):
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.writer = writer
+        self.clock = clock
+        self._reset()
+
+    def _reset(self):
+        # Also called in a forked child: locks and threads do not survive fork()
+        self._pid = os.getpid()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._oldest = None
+        self._thread = None
+        self._closed = False
+        self._stats = {
+            'depth': 0,
+            'max_depth': 0,
+            'flushes': 0,
+            'flushed': 0,
+            'failures': 0,
+            'last_flush_size': 0,
+            'last_flush_seconds': 0.0,
+            'total_flush_seconds': 0.0,
+        }
+
+    def add(self, email, ip_address=None):
+        """Queue a subscription; returns immediately"""
+        if self._pid != os.getpid():
+            self._reset()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('Subscription buffer is closed')
+            # The first submission of an address keeps its IP
+            self._pending.setdefault(email.strip().lower(), ip_address)
+            if self._oldest is None:
+                self._oldest = self.clock()
+            depth = len(self._pending)
+            self._stats['depth'] = depth
+            self._stats['max_depth'] = max(self._stats['max_depth'], depth)
+            self._ensure_thread()
+            if depth >= self.max_size:
+                self._condition.notify()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='subscription-buffer', daemon=True)
+            self._thread.start()
+
+    def _due(self):
+        if not self._pending:
+            return False
+        return len(self._pending) >= self.max_size or self.clock() - self._oldest >= self.max_delay
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and not self._due():
+                    timeout = None
+                    if self._pending:
+                        timeout = max(0.0, self.max_delay - (self.clock() - self._oldest))
+                    self._condition.wait(timeout)
+                if self._closed:
+                    return
+            try:
+                written = self.flush()
+            finally:
+                connections.close_all()
+            if not written:
+                # The write failed; back off instead of retrying in a tight loop
+                with self._condition:
+                    if not self._closed:
+                        self._condition.wait(self.max_delay)
+
+    def _take(self):
+        with self._condition:
+            entries, self._pending, self._oldest = self._pending, {}, None
+            self._stats['depth'] = 0
+        return entries
+
+    def _requeue(self, entries):
+        with self._condition:
+            for email, ip_address in entries.items():
+                self._pending.setdefault(email, ip_address)
+            if self._pending and self._oldest is None:
+                self._oldest = self.clock()
+            self._stats['depth'] = len(self._pending)
+
+    def flush(self):
+        """Write everything queued so far; returns the number of addresses written"""
+        with self._flush_lock:
+            entries = self._take()
+            if not entries:
+                return 0
+            started = time.perf_counter()
+            try:
+                self.writer(entries)
+            except Exception:
+                logger.exception('Could not write %d buffered subscriptions, keeping them queued', len(entries))
+                self._requeue(entries)
+                with self._condition:
+                    self._stats['failures'] += 1
+                return 0
+            elapsed = time.perf_counter() - started
+            with self._condition:
+                self._stats['flushes'] += 1
+                self._stats['flushed'] += len(entries)
+                self._stats['last_flush_size'] = len(entries)
+                self._stats['last_flush_seconds'] = elapsed
+                self._stats['total_flush_seconds'] += elapsed
+            logger.debug('Wrote %d buffered subscriptions in %.3fs', len(entries), elapsed)
+            return len(entries)
+
+    def close(self):
+        """Stop the flusher thread and write whatever is still queued"""
+        if self._pid != os.getpid():
+            return
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=max(self.max_delay, 5))
+        self.flush()
+        with self._condition:
+            left = dict(self._pending)
+        if left:
+            logger.error('Lost %d buffered subscriptions on shutdown: %s', len(left), ', '.join(sorted(left)))
+
+    def stats(self):
+        """Return a copy of the depth and flush counters"""
+        with self._condition:
+            return dict(self._stats)
+
+
+def get_buffer():
+    """Return the process-wide buffer, creating it from the settings on first use"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = SubscriptionBuffer(
+                    max_size=getattr(settings, 'SUBSCRIBE_BUFFER_SIZE', 100),
+                    max_delay=getattr(settings, 'SUBSCRIBE_BUFFER_MAX_DELAY', 2.0),
+                )
+    return _buffer
+
+
+def buffer_stats():
+    """Stats of the process-wide buffer, or None if this process has not used it"""
+    buffer = _buffer
+    return buffer.stats() if buffer is not None else None
+
+
+def close_buffer():
+    """Flush and drop the process-wide buffer (graceful worker shutdown)"""
+    global _buffer
+    with _buffer_lock:
+        buffer, _buffer = _buffer, None
+    if buffer is not None:
+        buffer.close()
+
+
+def reset_buffer(**kwargs):
+    if kwargs['setting'].startswith('SUBSCRIBE_BUFFER'):
+        close_buffer()
+
+
+atexit.register(close_buffer)
+setting_changed.connect(reset_buffer, dispatch_uid='welcomeletter_reset_buffer')
@@ -0,0 +1,287 @@
+"""
+Sending a ``Campaign`` to every active subscriber.
+
+Subscribers are read in chunks of ``chunk_size`` (by primary key, skipping
+anyone who already has a delivery row for the campaign). Each chunk is first
+recorded as ``queued`` deliveries carrying the run's claim token; only the rows
+this run actually inserted are mailed, so two overlapping runs never share an
+address. The claimed rows are then split into batches that a few worker
+threads send over a small pool of SMTP connections, opened once and reused for
+the whole run. A shared ``RateLimiter`` keeps the run under
+``NEWSLETTER_RATE_LIMIT`` messages per second.
+
+Only one run sends a campaign at a time: a run locks the campaign row, refuses
+to start while it is ``sending`` and sets it to ``sending`` itself. When the
+run ends the campaign is ``sent``, or back to ``draft`` if some addresses are
+left. Because the delivery row is committed before the email goes out, a run
+that stops can simply be started again: addresses marked ``sent`` or
+``failed`` are not mailed twice, and rows still ``queued`` from the earlier
+run (the email may or may not have left) are marked ``unknown`` and skipped
+unless ``retry_unknown`` is set. Rows a run could not even try to send (no
+SMTP connection) are released again and left to the next run. A run killed
+outright leaves the campaign ``sending``; pass ``force`` to take it over.
+"""
+import logging
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connections, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Campaign, CampaignDelivery, MailingListSubscriber
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+BATCH_SIZE = 50
+
+
+class CampaignInProgress(RuntimeError):
+    """Another run is sending the campaign"""
+
+
+class RateLimiter:
+    """Token bucket shared by the sending threads"""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until one more message may be sent"""
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                # Tolerate float rounding so a refill after sleep() always suffices
+                if self._tokens >= 1 - 1e-9:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self.sleep(wait)
+
+
+class ConnectionPool:
+    """A fixed number of open mail connections handed out to worker threads"""
+
+    def __init__(self, size, backend=None):
+        self._connections = queue.Queue()
+        self._all = []
+        for _ in range(size):
+            connection = get_connection(backend)
+            self._all.append(connection)
+            self._connections.put(connection)
+
+    def acquire(self):
+        connection = self._connections.get()
+        try:
+            # Keep the SMTP session open across messages; a no-op if it already is
+            connection.open()
+        except Exception:
+            self._connections.put(connection)
+            raise
+        return connection
+
+    def release(self, connection):
+        self._connections.put(connection)
+
+    def close(self):
+        for connection in self._all:
+            try:
+                connection.close()
+            except Exception:
+                logger.exception('Could not close mail connection')
+
+
+@dataclass
+class SendResult:
+    """Counts reported after a run"""
+
+    sent: int = 0
+    failed: int = 0
+    unknown: int = 0
+    deferred: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        rate = self.sent / self.seconds if self.seconds else 0.0
+        deferred = f', {self.deferred} left for the next run' if self.deferred else ''
+        return (
+            f'{self.sent} sent, {self.failed} failed, {self.unknown} interrupted earlier{deferred} '
+            f'({self.seconds:.1f}s, {rate:.1f} messages/s)'
+        )
+
+
+def build_message(campaign, email, connection):
+    message = EmailMultiAlternatives(
+        subject=campaign.subject,
+        body=campaign.body_text,
+        from_email=getattr(settings, 'NEWSLETTER_FROM_EMAIL', None) or settings.DEFAULT_FROM_EMAIL,
+        to=[email],
+        connection=connection,
+    )
+    if campaign.body_html:
+        message.attach_alternative(campaign.body_html, 'text/html')
+    return message
+
+
+def pending_subscribers(campaign):
+    """Active subscribers that have no delivery row for the campaign yet"""
+    delivered = CampaignDelivery.objects.filter(campaign=campaign, subscriber=OuterRef('pk'))
+    return MailingListSubscriber.objects.filter(is_active=True).exclude(Exists(delivered))
+
+
+def _claim_chunk(campaign, last_pk, chunk_size, claim):
+    """The last subscriber pk read and the ``(pk, email)`` rows this run claimed
+
+    Another run may have claimed some of the subscribers read between the
+    select and the insert; their rows are left alone.
+    """
+    subscribers = list(
+        pending_subscribers(campaign).filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'email')[:chunk_size]
+    )
+    if not subscribers:
+        return None, []
+    CampaignDelivery.objects.bulk_create(
+        [CampaignDelivery(campaign=campaign, subscriber_id=pk, claim=claim) for pk, _ in subscribers],
+        ignore_conflicts=True,
+    )
+    claimed = set(
+        CampaignDelivery.objects.filter(
+            campaign=campaign, claim=claim, subscriber_id__in=[pk for pk, _ in subscribers],
+        ).values_list('subscriber_id', flat=True)
+    )
+    return subscribers[-1][0], [(pk, email) for pk, email in subscribers if pk in claimed]
+
+
+def _send_batch(campaign, batch, pool, limiter, claim):
+    sent, failed = [], {}
+    try:
+        connection = pool.acquire()
+    except Exception:
+        logger.exception('Could not open mail connection for campaign %s', campaign.pk)
+        connection = None
+    if connection is not None:
+        try:
+            for pk, email in batch:
+                limiter.acquire()
+                try:
+                    build_message(campaign, email, connection).send()
+                except Exception as exc:
+                    logger.warning('Could not send campaign %s to %s: %s', campaign.pk, email, exc)
+                    failed[pk] = str(exc)
+                    # The SMTP session may be broken; start a fresh one for the rest
+                    try:
+                        connection.close()
+                        connection.open()
+                    except Exception:
+                        logger.exception('Could not reopen mail connection')
+                        break
+                else:
+                    sent.append(pk)
+        finally:
+            pool.release(connection)
+
+    deliveries = CampaignDelivery.objects.filter(campaign=campaign, claim=claim)
+    if sent:
+        deliveries.filter(subscriber_id__in=sent).update(status='sent', sent_at=timezone.now())
+    for pk, error in failed.items():
+        deliveries.filter(subscriber_id=pk).update(status='failed', error=error)
+    # Never handed to SMTP: release them so the next run sends them
+    unsent = [pk for pk, _ in batch if pk not in failed and pk not in sent]
+    if unsent:
+        deliveries.filter(subscriber_id__in=unsent, status='queued').delete()
+    return len(sent), len(failed), len(unsent)
+
+
+def _send_batch_in_thread(*args):
+    try:
+        return _send_batch(*args)
+    finally:
+        connections.close_all()
+
+
+def send_campaign(campaign, workers=None, rate=None, chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE,
+                  retry_unknown=False, backend=None, force=False):
+    """Send ``campaign`` to every active subscriber that has not received it yet
+
+    Raises ``CampaignInProgress`` if the campaign is already being sent, unless
+    ``force`` is set because that run is known to be dead.
+    """
+    workers = workers or getattr(settings, 'NEWSLETTER_WORKERS', 4)
+    rate = getattr(settings, 'NEWSLETTER_RATE_LIMIT', 10) if rate is None else rate
+    result = SendResult()
+    started = time.perf_counter()
+
+    with transaction.atomic():
+        locked = Campaign.objects.select_for_update().get(pk=campaign.pk)
+        if locked.status == 'sending' and not force:
+            raise CampaignInProgress(f'Campaign {campaign.pk} is already being sent')
+        Campaign.objects.filter(pk=campaign.pk, started_at__isnull=True).update(started_at=timezone.now())
+        Campaign.objects.filter(pk=campaign.pk).update(status='sending', finished_at=None)
+
+        # No other run is sending, so anything still queued was claimed by one that stopped mid-batch
+        deliveries = CampaignDelivery.objects.filter(campaign=campaign)
+        if retry_unknown:
+            deliveries.filter(status__in=('queued', 'unknown')).delete()
+        else:
+            deliveries.filter(status='queued').update(status='unknown')
+            result.unknown = deliveries.filter(status='unknown').count()
+
+    claim = uuid.uuid4().hex
+    limiter = RateLimiter(rate)
+    pool = ConnectionPool(workers, backend)
+    # A single worker sends from the calling thread (and its database connection)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='campaign') if workers > 1 else None
+    last_pk = 0
+    completed = False
+    try:
+        while True:
+            last_pk, chunk = _claim_chunk(campaign, last_pk, chunk_size, claim)
+            if last_pk is None:
+                break
+            jobs = [
+                (campaign, chunk[i:i + batch_size], pool, limiter, claim) for i in range(0, len(chunk), batch_size)
+            ]
+            if executor is None:
+                counts = [_send_batch(*job) for job in jobs]
+            else:
+                counts = executor.map(lambda job: _send_batch_in_thread(*job), jobs)
+            for sent, failed, deferred in counts:
+                result.sent += sent
+                result.failed += failed
+                result.deferred += deferred
+            logger.info('Campaign %s: %d sent, %d failed so far', campaign.pk, result.sent, result.failed)
+        completed = True
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        pool.close()
+        if not completed:
+            # Free the campaign for the next run once no thread is sending
+            Campaign.objects.filter(pk=campaign.pk).update(status='draft')
+
+    if not result.deferred:
+        Campaign.objects.filter(pk=campaign.pk).update(status='sent', finished_at=timezone.now())
+    else:
+        Campaign.objects.filter(pk=campaign.pk).update(status='draft')
+        logger.warning('Campaign %s: %d message(s) could not be sent, run it again', campaign.pk, result.deferred)
+    campaign.refresh_from_db()
+    result.seconds = time.perf_counter() - started
+    return result
@@ -0,0 +1,88 @@
+"""
+Conditional GET support for the public pages.
+
+The ETag and Last-Modified values come from the content snapshot, so a
+revalidation is answered with ``304 Not Modified`` before the page cache,
+the templates or the ORM are touched. The ETag also covers the templates and
+static manifest (``get_build_id``) and the encoding the page is sent with, so
+a deploy or a different Accept-Encoding never reuses a stale validator.
+
+Django computes the validators synchronously, so for async views the snapshot
+is loaded beforehand with ``aget_snapshot`` and kept on the request.
+"""
+import hashlib
+from functools import lru_cache, wraps
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction
+
+from django.conf import settings
+from django.template import engines
+from django.utils import translation
+from django.views.decorators.http import condition
+
+from .content import aget_snapshot, get_snapshot
+from .pagecache import negotiate_encoding
+
+
+def _build_id():
+    digest = hashlib.sha1(usedforsecurity=False)
+    paths = []
+    for directory in engines['django'].engine.dirs:
+        paths.extend(sorted(Path(directory).rglob('*.html')))
+    manifest = Path(settings.STATIC_ROOT) / 'staticfiles.json'
+    if manifest.exists():
+        paths.append(manifest)
+    for path in paths:
+        digest.update(f'{path}:{path.stat().st_mtime_ns}\n'.encode())
+    return digest.hexdigest()
+
+
+_cached_build_id = lru_cache(maxsize=None)(_build_id)
+
+
+def get_build_id():
+    """Fingerprint of the project templates and static manifest the pages are built from"""
+    # Templates only change with a deploy in production; re-check them while developing
+    if settings.DEBUG:
+        return _build_id()
+    return _cached_build_id()
+
+
+def request_snapshot(request):
+    snapshot = getattr(request, 'content_snapshot', None)
+    return snapshot if snapshot is not None else get_snapshot()
+
+
+def page_etag(request, *args, **kwargs):
+    """Strong ETag of a public page"""
+    snapshot = request_snapshot(request)
+    parts = (
+        str(snapshot.version),
+        snapshot.last_modified.isoformat() if snapshot.last_modified else '',
+        get_build_id(),
+        translation.get_language() or '',
+        negotiate_encoding(request),
+    )
+    return hashlib.sha1('|'.join(parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def page_last_modified(request, *args, **kwargs):
+    """Time of the latest change to the public content"""
+    return request_snapshot(request).last_modified
+
+
+_condition = condition(etag_func=page_etag, last_modified_func=page_last_modified)
+
+
+def conditional_page(view_func):
+    """Answer revalidations of a public page with 304 Not Modified"""
+    conditional_view = _condition(view_func)
+    if not iscoroutinefunction(view_func):
+        return conditional_view
+
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        request.content_snapshot = await aget_snapshot()
+        return await conditional_view(request, *args, **kwargs)
+    return _wrapped_view
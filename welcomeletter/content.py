@@ -0,0 +1,124 @@
+"""
+Process-wide snapshot of the content shown on the public welcome-letter pages.
+
+Every public view needs the same handful of rows (site settings, active links,
+restaurants and transfer options). Instead of querying them on every request,
+they are loaded together into an immutable ``ContentSnapshot`` that is shared
+by all requests of the process and only rebuilt when the content version
+changes (see ``versioning``). Treat the model instances held by a snapshot as
+read-only.
+"""
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from .models import ExternalLink, Restaurant, TransferOption, SiteSettings, ContentVersion
+from .versioning import aget_content_version, get_content_version
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class ContentSnapshot:
+    """Immutable view of all content rendered by the public pages"""
+
+    version: int
+    settings: SiteSettings
+    links_by_slug: MappingProxyType
+    links_by_category: MappingProxyType
+    restaurants: tuple
+    transfer_options: tuple
+    last_modified: object = None
+
+    def first_link(self, category):
+        """Return the first active link of a category, or None"""
+        links = self.links_by_category.get(category)
+        return links[0] if links else None
+
+
+def make_snapshot(version, settings, links, restaurants, transfer_options, version_updated_at):
+    by_category = {}
+    for link in links:
+        by_category.setdefault(link.category, []).append(link)
+
+    # The version row is touched on every save/delete (including deactivations
+    # and SiteSettings edits), the rows themselves cover direct data loads.
+    timestamps = [obj.updated_at for obj in (*links, *restaurants, *transfer_options)]
+    timestamps.append(version_updated_at)
+    timestamps = [ts for ts in timestamps if ts is not None]
+
+    return ContentSnapshot(
+        version=version,
+        settings=settings,
+        links_by_slug=MappingProxyType({link.slug: link for link in links}),
+        links_by_category=MappingProxyType(
+            {category: tuple(items) for category, items in by_category.items()}
+        ),
+        restaurants=tuple(restaurants),
+        transfer_options=tuple(transfer_options),
+        last_modified=max(timestamps) if timestamps else None,
+    )
+
+
+def build_snapshot(version):
+    """Load all public content from the database in one pass"""
+    links = list(ExternalLink.objects.filter(is_active=True))
+    restaurants = list(Restaurant.objects.filter(is_active=True).select_related('menu_link'))
+    transfer_options = list(TransferOption.objects.filter(is_active=True))
+    version_updated_at = ContentVersion.objects.filter(pk=1).values_list('updated_at', flat=True).first()
+    return make_snapshot(
+        version, SiteSettings.get_settings(), links, restaurants, transfer_options, version_updated_at,
+    )
+
+
+async def abuild_snapshot(version):
+    """``build_snapshot`` with the async ORM"""
+    links = [link async for link in ExternalLink.objects.filter(is_active=True)]
+    restaurants = [
+        restaurant async for restaurant in Restaurant.objects.filter(is_active=True).select_related('menu_link')
+    ]
+    transfer_options = [option async for option in TransferOption.objects.filter(is_active=True)]
+    version_updated_at = await ContentVersion.objects.filter(pk=1).values_list('updated_at', flat=True).afirst()
+    return make_snapshot(
+        version, await SiteSettings.aget_settings(), links, restaurants, transfer_options, version_updated_at,
+    )
+
+
+def get_snapshot():
+    """Return the snapshot for the current content version, rebuilding it if stale"""
+    global _snapshot
+    version = get_content_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with _lock:
+        snapshot = _snapshot
+        if snapshot is None or snapshot.version != version:
+            snapshot = build_snapshot(version)
+            _snapshot = snapshot
+    return snapshot
+
+
+async def aget_snapshot():
+    """``get_snapshot`` for async views; only touches the database when the version moved"""
+    global _snapshot
+    version = await aget_content_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    # Requests arriving together may each build it; they all get the same content
+    snapshot = await abuild_snapshot(version)
+    with _lock:
+        if _snapshot is None or _snapshot.version <= version:
+            _snapshot = snapshot
+    return snapshot
+
+
+def clear_snapshot():
+    """Drop the cached snapshot (used by tests and management commands)"""
+    global _snapshot
+    with _lock:
+        _snapshot = None
@@ -0,0 +1,235 @@
+"""
+Brand fonts subset to the characters the site uses, served as WOFF2.
+
+``build_fonts`` collects every character of the project templates, the front
+end script and the public content in the database, then cuts each face in
+``FACES`` down to those characters (always keeping printable ASCII, so text
+typed into the admin later still renders) and saves it as WOFF2. The
+characters are split by ``unicode-range`` into a ``latin`` file, which every
+page needs, and an ``extra`` file for the rest (dashes, quotes, accented
+names...) that browsers only download when a page contains one of them.
+Characters a face does not have are left to the next font in the stack.
+
+The build rewrites the ``@font-face`` rules between the ``fonts:start`` and
+``fonts:end`` markers in ``static/css/main.css`` and the preload links for the
+``CRITICAL`` faces in ``templates/includes/font_preload.html``. What went into
+each file is recorded in ``OUTPUT_DIR/fonts.json``, so a rebuild with the same
+fonts and characters does nothing. Run it with ``manage.py build_fonts`` before
+``collectstatic`` and commit the result; it needs ``fonttools`` and ``brotli``.
+"""
+import hashlib
+import html
+import json
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import CharField, TextField
+from django.template import engines
+
+
+FACES = [
+    # (family, weight, source file in static/fonts/)
+    ('Hilton Serif', 400, 'HiltonSerif-Regular.otf'),
+    ('Hilton Serif', 500, 'HiltonSerif-Medium.otf'),
+    ('Hilton Sans', 400, 'HiltonSans-Regular.ttf'),
+    ('Hilton Sans', 500, 'HiltonSans-Medium.ttf'),
+]
+# Body text and headings: preloaded so the first paint already uses them
+CRITICAL = [('Hilton Sans', 400), ('Hilton Serif', 500)]
+
+# Google Fonts' "latin" subset
+LATIN = (
+    (0x0000, 0x00FF), (0x0131, 0x0131), (0x0152, 0x0153), (0x02BB, 0x02BC), (0x02C6, 0x02C6),
+    (0x02DA, 0x02DA), (0x02DC, 0x02DC), (0x2000, 0x206F), (0x20AC, 0x20AC), (0x2122, 0x2122),
+    (0x2191, 0x2191), (0x2193, 0x2193), (0x2212, 0x2212), (0x2215, 0x2215), (0xFEFF, 0xFEFF),
+    (0xFFFD, 0xFFFD),
+)
+ASCII = set(range(0x20, 0x7F))
+
+SOURCE_DIR = 'fonts'
+OUTPUT_DIR = 'fonts/woff2'
+CSS_FILE = 'css/main.css'
+PRELOAD_TEMPLATE = 'includes/font_preload.html'
+START, END = '/* fonts:start */', '/* fonts:end */'
+# Bump to rebuild every file after changing the subsetting options
+BUILD_VERSION = 1
+
+
+def static_dir():
+    return Path(settings.STATICFILES_DIRS[0])
+
+
+def template_dir():
+    return Path(engines['django'].engine.dirs[0])
+
+
+def is_latin(codepoint):
+    return any(low <= codepoint <= high for low, high in LATIN)
+
+
+def template_characters():
+    """Every character in the project templates and the front end script, entities decoded"""
+    paths = []
+    for directory in engines['django'].engine.dirs:
+        paths.extend(Path(directory).rglob('*.html'))
+    paths.extend((static_dir() / 'js').glob('*.js'))
+    characters = set()
+    for path in paths:
+        characters.update(html.unescape(path.read_text(encoding='utf-8')))
+    return characters
+
+
+def content_characters():
+    """Every character in the text of the public content models"""
+    from .models import ExternalLink, Restaurant, SiteSettings, TransferOption
+
+    characters = set()
+    for model in (ExternalLink, Restaurant, SiteSettings, TransferOption):
+        fields = [field.name for field in model._meta.fields if isinstance(field, (CharField, TextField))]
+        for row in model.objects.values_list(*fields).iterator():
+            for value in row:
+                if value:
+                    characters.update(value)
+    return characters
+
+
+def used_codepoints(include_content=True):
+    characters = template_characters()
+    if include_content:
+        characters |= content_characters()
+    return {ord(character) for character in characters} | ASCII
+
+
+def unicode_range(codepoints):
+    """CSS ``unicode-range`` value covering exactly ``codepoints``"""
+    ranges, points = [], sorted(codepoints)
+    start = previous = points[0]
+    for point in points[1:] + [None]:
+        if point is not None and point == previous + 1:
+            previous = point
+            continue
+        ranges.append(f'U+{start:X}' if start == previous else f'U+{start:X}-{previous:X}')
+        if point is not None:
+            start = previous = point
+    return ', '.join(ranges)
+
+
+def subset_font(source, codepoints, target):
+    """Write the glyphs of ``codepoints`` from ``source`` to ``target`` as WOFF2; returns its size"""
+    from fontTools import subset
+    from fontTools.ttLib import TTFont
+
+    options = subset.Options()
+    options.flavor = 'woff2'
+    # Fewer, larger CFF charstrings compress better with Brotli
+    options.desubroutinize = True
+    font = TTFont(source)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=codepoints)
+    subsetter.subset(font)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    font.flavor = 'woff2'
+    font.save(target)
+    return target.stat().st_size
+
+
+def plan(codepoints):
+    """``[(family, weight, source, group, codepoints)]`` of the files to build"""
+    from fontTools.ttLib import TTFont
+
+    files = []
+    for family, weight, filename in FACES:
+        source = static_dir() / SOURCE_DIR / filename
+        covered = codepoints & set(TTFont(source, lazy=True).getBestCmap())
+        groups = {
+            'latin': {point for point in covered if is_latin(point)},
+            'extra': {point for point in covered if not is_latin(point)},
+        }
+        for group, points in groups.items():
+            if points:
+                files.append((family, weight, source, group, points))
+    return files
+
+
+def font_face_css(faces):
+    rules = []
+    for family, weight, name, points in faces:
+        rules.append(
+            '@font-face {\n'
+            f"    font-family: '{family}';\n"
+            f"    src: url('../{OUTPUT_DIR}/{name}') format('woff2');\n"
+            f'    font-weight: {weight};\n'
+            '    font-style: normal;\n'
+            '    font-display: swap;\n'
+            f'    unicode-range: {unicode_range(points)};\n'
+            '}'
+        )
+    return '\n\n'.join(rules)
+
+
+def preload_html(faces):
+    lines = ['{% load static %}']
+    for family, weight, name, points in faces:
+        if (family, weight) in CRITICAL and name.endswith('-latin.woff2'):
+            lines.append(
+                f'<link rel="preload" href="{{% static \'{OUTPUT_DIR}/{name}\' %}}" as="font" type="font/woff2" crossorigin>'
+            )
+    return '\n'.join(lines) + '\n'
+
+
+def replace_between_markers(text, replacement):
+    pattern = re.compile(re.escape(START) + r'.*?' + re.escape(END), re.DOTALL)
+    if not pattern.search(text):
+        raise ValueError(f'{CSS_FILE} has no {START} ... {END} block for the @font-face rules')
+    return pattern.sub(lambda match: f'{START}\n{replacement}\n{END}', text, count=1)
+
+
+def write_if_changed(path, text):
+    if path.exists() and path.read_text(encoding='utf-8') == text:
+        return False
+    path.write_text(text, encoding='utf-8')
+    return True
+
+
+def build_fonts(include_content=True, force=False, progress=None):
+    """Subset and convert the brand fonts, then update main.css and the preload links
+
+    Returns ``{file name: (bytes, rebuilt)}``.
+    """
+    try:
+        codepoints = used_codepoints(include_content)
+    except DatabaseError:
+        # No database while building (e.g. in CI): the templates still count
+        codepoints = used_codepoints(include_content=False)
+
+    output = static_dir() / OUTPUT_DIR
+    manifest_path = output / 'fonts.json'
+    manifest = {} if force or not manifest_path.exists() else json.loads(manifest_path.read_text())
+    built, faces, results = {}, [], {}
+    for family, weight, source, group, points in plan(codepoints):
+        name = f'{source.stem}-{group}.woff2'
+        digest = hashlib.sha256(source.read_bytes())
+        digest.update(f'{BUILD_VERSION}:{sorted(points)}'.encode())
+        key = digest.hexdigest()
+        target = output / name
+        rebuilt = manifest.get(name) != key or not target.exists()
+        if rebuilt:
+            subset_font(source, points, target)
+        built[name] = key
+        results[name] = (target.stat().st_size, rebuilt)
+        faces.append((family, weight, name, points))
+        if progress is not None:
+            progress(name, *results[name])
+
+    # Drop files of groups that are no longer needed
+    for stale in set(manifest) - set(built):
+        (output / stale).unlink(missing_ok=True)
+    output.mkdir(parents=True, exist_ok=True)
+    manifest_path.write_text(json.dumps(built, indent=2, sort_keys=True) + '\n')
+
+    css_path = static_dir() / CSS_FILE
+    write_if_changed(css_path, replace_between_markers(css_path.read_text(encoding='utf-8'), font_face_css(faces)))
+    write_if_changed(template_dir() / PRELOAD_TEMPLATE, preload_html(faces))
+    return results
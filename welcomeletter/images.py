@@ -0,0 +1,120 @@
+"""
+Responsive derivatives for uploaded images.
+
+After an upload, the original is resized to a few widths in WebP and JPEG and
+a tiny blurred placeholder is made. The files are stored next to the original
+(``restaurants/villa.jpg`` -> ``restaurants/villa-640w.webp``), and what was
+produced is recorded in the ``<field>_variants`` JSON field of the model, so
+the ``responsive_image`` template tag can emit ``srcset`` without touching
+storage. Processing is queued as a job (see ``welcomeletter.tasks``) when the
+admin save commits and done by the ``run_jobs`` worker.
+"""
+import base64
+import io
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+
+DEFAULT_WIDTHS = (320, 640, 960, 1280)
+PLACEHOLDER_WIDTH = 24
+FORMATS = {
+    'webp': ('WEBP', {'quality': 78, 'method': 6}),
+    'jpg': ('JPEG', {'quality': 80, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_name(name, width, ext):
+    """Storage name of the derivative of ``name`` at ``width`` pixels"""
+    path = PurePosixPath(name)
+    return str(path.with_name(f'{path.stem}-{width}w.{ext}'))
+
+
+def _save(storage, name, image, fmt, options):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, ContentFile(buffer.getvalue())), buffer.tell()
+
+
+def generate_variants(field_file, widths=None, storage=None):
+    """Write resized WebP/JPEG copies of an image and return their description"""
+    from PIL import Image, ImageFilter, ImageOps
+
+    storage = storage or default_storage
+    widths = widths or getattr(settings, 'RESPONSIVE_IMAGE_WIDTHS', DEFAULT_WIDTHS)
+    with field_file.open('rb') as f:
+        image = Image.open(f)
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGB')
+
+    original_width, original_height = image.size
+    # Never upscale; the largest derivative is capped at the original width
+    targets = sorted({min(width, original_width) for width in widths})
+    sources = {ext: [] for ext in FORMATS}
+    for width in targets:
+        height = round(original_height * width / original_width)
+        resized = image.resize((width, height), Image.LANCZOS) if width != original_width else image
+        for ext, (fmt, options) in FORMATS.items():
+            name, size = _save(storage, variant_name(field_file.name, width, ext), resized, fmt, options)
+            sources[ext].append({'name': name, 'width': width, 'bytes': size})
+
+    tiny = image.resize(
+        (PLACEHOLDER_WIDTH, max(1, round(original_height * PLACEHOLDER_WIDTH / original_width)))
+    ).filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    tiny.save(buffer, 'JPEG', quality=40)
+    placeholder = 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+    return {
+        'source': field_file.name,
+        'width': original_width,
+        'height': original_height,
+        'sources': sources,
+        'placeholder': placeholder,
+    }
+
+
+def delete_variants(variants, storage=None):
+    """Remove the files described by a variants dict"""
+    storage = storage or default_storage
+    for items in (variants or {}).get('sources', {}).values():
+        for item in items:
+            if storage.exists(item['name']):
+                storage.delete(item['name'])
+
+
+def needs_variants(instance, field_name):
+    field_file = getattr(instance, field_name)
+    variants = getattr(instance, f'{field_name}_variants') or {}
+    return bool(field_file) and variants.get('source') != field_file.name
+
+
+def process_image_field(model, pk, field_name):
+    """Generate derivatives for one instance and store their description"""
+    from .versioning import bump_content_version
+    from .pagecache import purge_pages
+
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not needs_variants(instance, field_name):
+        return
+    field_file = getattr(instance, field_name)
+    old_variants = getattr(instance, f'{field_name}_variants')
+    variants = generate_variants(field_file)
+    # update() keeps post_save quiet; the public pages are invalidated explicitly
+    model.objects.filter(pk=pk).update(**{f'{field_name}_variants': variants})
+    if old_variants and old_variants.get('source') != variants['source']:
+        delete_variants(old_variants)
+    bump_content_version()
+    purge_pages()
+
+
+def schedule_image_processing(instance, field_name):
+    """Queue processing of a new upload; the job becomes visible when the save commits"""
+    if not needs_variants(instance, field_name):
+        return
+    from .tasks import process_image
+    process_image.enqueue(instance._meta.label, instance.pk, field_name)
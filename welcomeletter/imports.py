@@ -0,0 +1,174 @@
+"""
+Bulk import of mailing list subscribers from CSV.
+
+The file is read one row at a time; addresses are lowercased, validated and
+de-duplicated, then written in batches of ``batch_size``. On PostgreSQL each
+batch is COPYed into a temporary staging table and merged with a single
+``INSERT ... SELECT ... ON CONFLICT`` (new addresses are inserted, unsubscribed
+ones reactivated). Other databases look the batch up with one query and use
+``bulk_create(ignore_conflicts=True)`` plus one reactivation ``UPDATE``.
+Used by the subscriber admin's upload page and the ``import_subscribers``
+management command.
+"""
+import csv
+import io
+import time
+from dataclasses import dataclass
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import MailingListSubscriber
+
+
+BATCH_SIZE = 5000
+EMAIL_COLUMNS = ('email', 'e-mail', 'email address', 'mail')
+
+
+@dataclass
+class ImportResult:
+    """Counts reported after an import"""
+
+    rows: int = 0
+    inserted: int = 0
+    reactivated: int = 0
+    skipped: int = 0
+    invalid: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            f'{self.rows} rows: {self.inserted} inserted, {self.reactivated} reactivated, '
+            f'{self.skipped} skipped, {self.invalid} invalid '
+            f'({self.seconds:.1f}s, {self.rows_per_second:.0f} rows/s)'
+        )
+
+
+def normalize_email(value):
+    """Return the lowercased address, or None if it is not a valid email"""
+    email = (value or '').strip().strip('<>').strip().lower()
+    if email.startswith('mailto:'):
+        email = email[len('mailto:'):]
+    try:
+        validate_email(email)
+    except ValidationError:
+        return None
+    return email
+
+
+def iter_csv_emails(lines):
+    """Yield the raw email cell of every data row of a CSV file
+
+    The column is found by its header (``email``, ``e-mail``, ...); files
+    without a recognised header are read from their first column.
+    """
+    reader = csv.reader(lines)
+    first = next(reader, None)
+    if first is None:
+        return
+    header = [cell.strip().lower() for cell in first]
+    column = next((header.index(name) for name in EMAIL_COLUMNS if name in header), None)
+    if column is None:
+        column = 0
+        yield first[0] if first else ''
+    for row in reader:
+        yield row[column] if len(row) > column else ''
+
+
+def _upsert_postgresql(connection, emails, ip_address, now):
+    meta = MailingListSubscriber._meta
+    qn = connection.ops.quote_name
+    table = qn(meta.db_table)
+    column = {name: qn(meta.get_field(name).column) for name in (
+        'email', 'is_active', 'subscribed_at', 'unsubscribed_at', 'ip_address',
+    )}
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMPORARY TABLE welcomeletter_subscriber_import (email text NOT NULL) ON COMMIT DROP'
+        )
+        copy_sql = 'COPY welcomeletter_subscriber_import (email) FROM STDIN'
+        if hasattr(cursor.cursor, 'copy'):  # psycopg 3
+            with cursor.cursor.copy(copy_sql) as copy:
+                for email in emails:
+                    copy.write_row((email,))
+        else:  # psycopg2; addresses passed validate_email, so no COPY escaping is needed
+            cursor.cursor.copy_expert(copy_sql, io.StringIO(''.join(f'{email}\n' for email in emails)))
+        # xmax is 0 for freshly inserted rows and set for rows touched by DO UPDATE
+        cursor.execute(
+            f"INSERT INTO {table} ({column['email']}, {column['is_active']}, {column['subscribed_at']}, "
+            f"{column['unsubscribed_at']}, {column['ip_address']}) "
+            f"SELECT email, true, %s, NULL, %s FROM welcomeletter_subscriber_import "
+            f"ON CONFLICT (LOWER({column['email']})) DO UPDATE "
+            f"SET {column['is_active']} = true, {column['unsubscribed_at']} = NULL "
+            f"WHERE {table}.{column['is_active']} = false "
+            f"RETURNING (xmax = 0)",
+            [now, ip_address],
+        )
+        flags = [row[0] for row in cursor.fetchall()]
+    inserted = sum(flags)
+    return inserted, len(flags) - inserted
+
+
+def _upsert_generic(using, emails, ip_address):
+    manager = MailingListSubscriber.objects.db_manager(using)
+    with transaction.atomic(using=using):
+        existing = dict(manager.filter(email__in=emails).values_list('email', 'is_active'))
+        new = [
+            MailingListSubscriber(email=email, ip_address=ip_address)
+            for email in emails if email not in existing
+        ]
+        manager.bulk_create(new, ignore_conflicts=True)
+        inactive = [email for email, is_active in existing.items() if not is_active]
+        if inactive:
+            manager.filter(email__in=inactive).update(is_active=True, unsubscribed_at=None)
+    return len(new), len(inactive)
+
+
+def upsert_batch(emails, ip_address=None, using='default'):
+    """Insert new addresses and reactivate unsubscribed ones; returns (inserted, reactivated)"""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return _upsert_postgresql(connection, emails, ip_address, timezone.now())
+    return _upsert_generic(using, emails, ip_address)
+
+
+def import_subscribers(lines, batch_size=BATCH_SIZE, ip_address=None, using='default'):
+    """Import the addresses of a CSV file (any iterable of text lines)"""
+    result = ImportResult()
+    started = time.perf_counter()
+    seen = set()
+    batch = []
+
+    def write():
+        inserted, reactivated = upsert_batch(batch, ip_address, using)
+        result.inserted += inserted
+        result.reactivated += reactivated
+        batch.clear()
+
+    for value in iter_csv_emails(lines):
+        if not value.strip():
+            continue
+        result.rows += 1
+        email = normalize_email(value)
+        if email is None:
+            result.invalid += 1
+            continue
+        if email in seen:
+            continue
+        seen.add(email)
+        batch.append(email)
+        if len(batch) >= batch_size:
+            write()
+    if batch:
+        write()
+
+    # Duplicates within the file and addresses that were already active
+    result.skipped = result.rows - result.invalid - result.inserted - result.reactivated
+    result.seconds = time.perf_counter() - started
+    return result
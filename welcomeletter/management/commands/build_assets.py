@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from welcomeletter.assets import build_assets
+
+
+class Command(BaseCommand):
+    help = 'Minify and content-hash the CSS/JS bundles and extract the critical CSS of every public page'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-pages', action='store_true',
+                            help='Only build the bundles, without rendering pages for critical CSS')
+        parser.add_argument('--host', type=str, default=None, help='Host name the pages are rendered for')
+
+    def handle(self, *args, **options):
+        try:
+            manifest = build_assets(pages=not options['no_pages'], host=options['host'])
+        except DatabaseError as exc:
+            raise CommandError(f'Could not render the pages ({exc}). Migrate the database, or pass --no-pages '
+                               'to build the bundles without critical CSS')
+
+        if options['verbosity'] < 1:
+            return
+        for source, entry in manifest['bundles'].items():
+            self.stdout.write(f'{source} -> {entry["name"]} ({entry["bytes"]} bytes)')
+        for page, css in sorted(manifest['critical'].items()):
+            self.stdout.write(f'{page}: {len(css.encode())} bytes of critical CSS')
+        self.stdout.write(self.style.SUCCESS(
+            f'Built {len(manifest["bundles"])} bundle(s) and critical CSS for {len(manifest["critical"])} page(s)'
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from welcomeletter.fonts import build_fonts
+
+
+class Command(BaseCommand):
+    help = 'Subset the brand fonts to the characters the site uses and convert them to WOFF2'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild every file even if it is up to date')
+        parser.add_argument('--no-content', action='store_true',
+                            help='Only scan the templates and scripts, not the database content')
+
+    def handle(self, *args, **options):
+        try:
+            import brotli  # noqa: F401 - fontTools needs it to write WOFF2
+            import fontTools  # noqa: F401
+        except ImportError:
+            raise CommandError('fonttools and brotli are required. Install with `pip install fonttools brotli`')
+
+        def progress(name, size, rebuilt):
+            if options['verbosity'] >= 1:
+                self.stdout.write(f'{"Built" if rebuilt else "Up to date"} {name} ({size // 1024} KB)')
+
+        results = build_fonts(include_content=not options['no_content'], force=options['force'], progress=progress)
+        total = sum(size for size, rebuilt in results.values())
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} font file(s), {total // 1024} KB in total'))
@@ -0,0 +1,144 @@
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.template import Template
+from django.test import RequestFactory
+from django.test.signals import template_rendered
+from django.test.utils import instrumented_test_render
+from django.urls import resolve
+from contextlib import contextmanager
+from pathlib import Path
+import gzip
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import time
+
+from welcomeletter.assets import get_assets
+from welcomeletter.compression import minify_html
+from welcomeletter.content import get_snapshot
+from welcomeletter.pagecache import public_pages
+
+
+MANIFEST_NAME = '.export-manifest.json'
+
+
+@contextmanager
+def record_templates():
+    """Collect the template files rendered inside the block"""
+    used = set()
+
+    def on_render(sender, template, **kwargs):
+        if template.origin and template.origin.name:
+            used.add(template.origin.name)
+
+    original = Template._render
+    Template._render = instrumented_test_render
+    template_rendered.connect(on_render)
+    try:
+        yield used
+    finally:
+        Template._render = original
+        template_rendered.disconnect(on_render)
+
+
+def write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+class Command(BaseCommand):
+    help = 'Pre-render the public pages to HTML (plus .gz/.br) files that nginx can serve directly'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', type=str, default=None, help='Output directory (default: BASE_DIR/site)')
+        parser.add_argument('--host', type=str, default=None, help='Host name the pages are rendered for')
+        parser.add_argument('--force', action='store_true', help='Rebuild every page, even unchanged ones')
+
+    def handle(self, *args, **options):
+        output = Path(options['output'] or Path(settings.BASE_DIR) / 'site')
+        host = options['host'] or next((h for h in settings.ALLOWED_HOSTS if h and not h.startswith('.') and h != '*'), 'localhost')
+        manifest_path = output / MANIFEST_NAME
+
+        try:
+            import brotli
+        except ImportError:
+            brotli = None
+            self.stderr.write('brotli is not installed, skipping .br files. Install with `pip install brotli`')
+
+        manifest = {}
+        if manifest_path.exists() and not options['force']:
+            manifest = json.loads(manifest_path.read_text())
+
+        snapshot = get_snapshot()
+        static_manifest = Path(settings.STATIC_ROOT) / 'staticfiles.json'
+        static_mtime = static_manifest.stat().st_mtime_ns if static_manifest.exists() else None
+        # The inlined critical CSS and bundle names come from static/dist/assets.json
+        build = {'assets': get_assets().build_id, 'minify': getattr(settings, 'HTML_MINIFY', True)}
+        factory = RequestFactory()
+        pages = {}
+        built = skipped = 0
+        started = time.perf_counter()
+
+        for url_path, callback in public_pages():
+            target = output / url_path.lstrip('/') / 'index.html'
+            previous = manifest.get('pages', {}).get(url_path)
+            if previous and target.exists() and self.is_current(previous, snapshot, static_mtime, build):
+                pages[url_path] = previous
+                skipped += 1
+                continue
+
+            request = factory.get(url_path, HTTP_HOST=host)
+            request.resolver_match = resolve(url_path)
+            # Render the undecorated view so the page cache and conditional GET stay out of the way
+            view = inspect.unwrap(callback)
+            with record_templates() as templates:
+                response = async_to_sync(view)(request) if iscoroutinefunction(view) else view(request)
+            if response.status_code != 200:
+                raise CommandError(f'{url_path} returned HTTP {response.status_code}')
+
+            content = response.content
+            if build['minify']:
+                content = minify_html(content, response.charset)
+            write_atomic(target, content)
+            write_atomic(target.with_name('index.html.gz'), gzip.compress(content, 9, mtime=0))
+            if brotli is not None:
+                write_atomic(target.with_name('index.html.br'), brotli.compress(content))
+
+            pages[url_path] = {
+                'content_version': snapshot.version,
+                'last_modified': snapshot.last_modified.isoformat() if snapshot.last_modified else None,
+                'static_manifest_mtime': static_mtime,
+                'build': build,
+                'templates': {name: os.stat(name).st_mtime_ns for name in sorted(templates)},
+                'sha256': hashlib.sha256(content).hexdigest(),
+            }
+            built += 1
+            self.stdout.write(f'Rendered {url_path} -> {target}')
+
+        write_atomic(manifest_path, json.dumps({'pages': pages}, indent=2).encode())
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {built} page(s), {skipped} unchanged, to {output} in {elapsed:.2f}s'
+        ))
+
+    def is_current(self, entry, snapshot, static_mtime, build):
+        """Return True if nothing the page was built from has changed"""
+        last_modified = snapshot.last_modified.isoformat() if snapshot.last_modified else None
+        if entry.get('content_version') != snapshot.version or entry.get('last_modified') != last_modified:
+            return False
+        if entry.get('static_manifest_mtime') != static_mtime or entry.get('build') != build:
+            return False
+        for name, mtime in entry.get('templates', {}).items():
+            try:
+                if os.stat(name).st_mtime_ns != mtime:
+                    return False
+            except FileNotFoundError:
+                return False
+        return True
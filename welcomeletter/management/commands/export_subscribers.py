@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from welcomeletter.exports import CHUNK_SIZE, FORMATS, filter_subscribers, iter_export
+
+
+def date_argument(value):
+    date = parse_date(value)
+    if date is None:
+        raise ValueError(value)
+    return date
+
+
+class Command(BaseCommand):
+    help = 'Stream mailing list subscribers as CSV or JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv', help='Output format (default: csv)')
+        status = parser.add_mutually_exclusive_group()
+        status.add_argument('--active', dest='active', action='store_const', const=True, help='Only active subscribers')
+        status.add_argument('--inactive', dest='active', action='store_const', const=False, help='Only unsubscribed addresses')
+        parser.add_argument('--since', type=date_argument, help='Subscribed on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--until', type=date_argument, help='Subscribed on or before this date (YYYY-MM-DD)')
+        parser.add_argument('--output', '-o', help='Write to this file instead of stdout')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows fetched per database round trip')
+
+    def handle(self, *args, **options):
+        if options['since'] and options['until'] and options['since'] > options['until']:
+            raise CommandError('--since must not be after --until')
+
+        queryset = filter_subscribers(active=options['active'], since=options['since'], until=options['until'])
+        lines = iter_export(queryset, options['format'], options['chunk_size'])
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+            f.writelines(lines)
+        self.stderr.write(self.style.SUCCESS(f'Exported subscribers to {options["output"]}'))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from welcomeletter.synthetic import BATCH_SIZE, PREFIX, clear_synthetic, generate_data, synthetic_querysets
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic links, restaurants, subscribers and users for capacity testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--links', type=int, default=0, help='External links to create')
+        parser.add_argument('--restaurants', type=int, default=0, help='Restaurants to create')
+        parser.add_argument('--subscribers', type=int, default=0, help='Mailing list subscribers to create')
+        parser.add_argument('--users', type=int, default=0, help='User accounts to create')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same rows')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per insert and transaction')
+        parser.add_argument('--days', type=int, default=730, help='Spread sign-up dates over this many days')
+        parser.add_argument('--inactive', type=float, default=0.1, help='Share of unsubscribed subscribers')
+        parser.add_argument('--clear', action='store_true', help=f'Delete earlier "{PREFIX}-" rows first')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted = clear_synthetic(options['batch_size'])
+            self.stdout.write('Deleted ' + ', '.join(f'{rows} {name}' for name, rows in deleted.items()))
+        else:
+            requested = [name for name in ('links', 'restaurants', 'subscribers', 'users') if options[name]]
+            existing = [name for name in requested if synthetic_querysets()[name].exists()]
+            if existing:
+                raise CommandError(
+                    f'Synthetic {", ".join(existing)} already exist; pass --clear to replace them'
+                )
+
+        def progress(name, rows, seconds):
+            rate = rows / seconds if seconds else 0
+            self.stdout.write(f'{name}: {rows} rows in {seconds:.1f}s ({rate:,.0f} rows/s)')
+
+        generate_data(
+            links=options['links'],
+            restaurants=options['restaurants'],
+            subscribers=options['subscribers'],
+            users=options['users'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            days=options['days'],
+            inactive=options['inactive'],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from welcomeletter.images import process_image_field
+from welcomeletter.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = 'Generate responsive image variants for restaurant images that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate variants even if they are up to date')
+
+    def handle(self, *args, **options):
+        restaurants = Restaurant.objects.exclude(image='').exclude(image__isnull=True)
+        if options['force']:
+            restaurants.update(image_variants={})
+
+        count = 0
+        for pk, name in restaurants.values_list('pk', 'name'):
+            process_image_field(Restaurant, pk, 'image')
+            count += 1
+            self.stdout.write(f'Processed {name}')
+
+        self.stdout.write(self.style.SUCCESS(f'Checked {count} restaurant image(s)'))
@@ -1,22 +1,44 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from pathlib import Path
 import os
+import time
 
 
 class Command(BaseCommand):
-    help = 'Generate an SVG QR code for the given URL and save it to static/images/'
+    help = (
+        'Generate an SVG QR code for the given URL and save it to static/images/, '
+        'or with --manifest one tracked code per room/table plus print sheets'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument('--url', type=str, default='https://ramseshilton.com', help='URL to encode')
         parser.add_argument('--output', type=str, default=None, help='Output file path (optional)')
         parser.add_argument('--scale', type=int, default=10, help='Scale for the SVG')
+        parser.add_argument('--background', action='store_true', help='Queue the work for the run_jobs worker')
+        batch = parser.add_argument_group('batch mode')
+        batch.add_argument('--manifest', type=str, help='CSV with kind,code[,label,path,formats] columns')
+        batch.add_argument('--output-dir', type=str, default=None, help='Where codes and sheets go (default: qr-codes/)')
+        batch.add_argument('--formats', type=str, help='Print layouts for rows without a formats column, e.g. "tent-card;poster-a5"')
+        batch.add_argument('--processes', type=int, default=None, help='Worker processes (default: all cores)')
+        batch.add_argument('--force', action='store_true', help='Render every code even if it did not change')
 
     def handle(self, *args, **options):
         url = options['url']
         scale = options['scale'] or 10
         out = options['output']
 
+        if options['background']:
+            if options['manifest']:
+                raise CommandError('--background only queues a single code; run --manifest in the foreground')
+            from welcomeletter.tasks import generate_qr
+            job = generate_qr.enqueue(url, out, scale)
+            self.stdout.write(self.style.SUCCESS(f'Queued QR generation for {url} as job {job.pk}'))
+            return
+
+        if options['manifest']:
+            return self.handle_manifest(url, scale, options)
+
         # Resolve default output to project's static/images
         base_static = Path(settings.BASE_DIR) / 'static' / 'images'
         base_static.mkdir(parents=True, exist_ok=True)
@@ -37,3 +59,38 @@ class Command(BaseCommand):
         qr.save(str(output_path), scale=scale)
 
         self.stdout.write(self.style.SUCCESS(f'QR for {url} saved to {output_path}'))
+
+    def handle_manifest(self, url, scale, options):
+        from welcomeletter.qr import generate_codes, read_manifest, write_sheets
+
+        output_dir = Path(options['output_dir'] or Path(settings.BASE_DIR) / 'qr-codes')
+        formats = tuple(filter(None, (options['formats'] or '').split(';'))) or None
+        processes = options['processes'] or os.cpu_count() or 1
+        started = time.perf_counter()
+
+        try:
+            with open(options['manifest'], encoding='utf-8-sig', newline='') as f:
+                codes = read_manifest(f, url, formats)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Could not read {options["manifest"]}: {exc}')
+        read_at = time.perf_counter()
+
+        rendered, skipped, render_seconds = generate_codes(
+            codes, output_dir, processes=processes, scale=scale, force=options['force'],
+        )
+        generated_at = time.perf_counter()
+
+        sheets = write_sheets(codes, output_dir)
+        finished_at = time.perf_counter()
+
+        for sheet in sheets:
+            self.stdout.write(f'  {sheet}')
+        wall = generated_at - read_at
+        self.stdout.write(
+            f'Manifest: {len(codes)} codes in {read_at - started:.2f}s\n'
+            f'Codes:    {rendered} rendered, {skipped} unchanged in {wall:.2f}s '
+            f'({processes} process(es), {rendered / wall if wall and rendered else 0:.0f} codes/s, '
+            f'{render_seconds:.2f}s of rendering)\n'
+            f'Sheets:   {len(sheets)} in {finished_at - generated_at:.2f}s'
+        )
+        self.stdout.write(self.style.SUCCESS(f'Done in {finished_at - started:.2f}s, output in {output_dir}'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from welcomeletter.imports import BATCH_SIZE, import_subscribers
+
+
+class Command(BaseCommand):
+    help = 'Import mailing list subscribers from a CSV file (reactivates unsubscribed addresses)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with an "email" column, or addresses in the first column')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Addresses written per batch')
+        parser.add_argument('--ip', dest='ip_address', help='IP address recorded for new subscribers')
+        parser.add_argument('--encoding', default='utf-8-sig', help='File encoding (default: utf-8-sig)')
+
+    def handle(self, *args, **options):
+        try:
+            f = open(options['path'], encoding=options['encoding'], newline='')
+        except OSError as exc:
+            raise CommandError(f'Could not open {options["path"]}: {exc}')
+        with f:
+            result = import_subscribers(f, batch_size=options['batch_size'], ip_address=options['ip_address'])
+        self.stdout.write(self.style.SUCCESS(f'Imported {result}'))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from welcomeletter.campaigns import BATCH_SIZE, CHUNK_SIZE, CampaignInProgress, send_campaign
+from welcomeletter.models import Campaign
+
+
+class Command(BaseCommand):
+    help = 'Send a newsletter campaign to all active subscribers; run it again to resume an interrupted send'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_id', type=int)
+        parser.add_argument('--workers', type=int, help='Parallel SMTP connections (default: NEWSLETTER_WORKERS)')
+        parser.add_argument('--rate', type=float, help='Messages per second, 0 for no limit (default: NEWSLETTER_RATE_LIMIT)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Subscribers claimed per database round trip')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Messages per worker batch')
+        parser.add_argument(
+            '--retry-unknown', action='store_true',
+            help='Also mail addresses whose delivery was interrupted by a crash (they may get the email twice)',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Take over a campaign left "sending" by a run that was killed (make sure it is not still running)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            campaign = Campaign.objects.get(pk=options['campaign_id'])
+        except Campaign.DoesNotExist:
+            raise CommandError(f'Campaign {options["campaign_id"]} does not exist')
+
+        self.stdout.write(f'Sending "{campaign}"...')
+        try:
+            result = send_campaign(
+                campaign,
+                workers=options['workers'],
+                rate=options['rate'],
+                chunk_size=options['chunk_size'],
+                batch_size=options['batch_size'],
+                retry_unknown=options['retry_unknown'],
+                force=options['force'],
+            )
+        except CampaignInProgress as exc:
+            raise CommandError(f'{exc}; pass --force if that run was killed')
+        if result.deferred:
+            raise CommandError(f'Incomplete: {result}')
+        self.stdout.write(self.style.SUCCESS(f'Done: {result}'))
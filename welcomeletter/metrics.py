@@ -0,0 +1,427 @@
+"""
+Per-request timings: the ``Server-Timing`` header and the ``/metrics`` endpoint.
+
+``RequestMetricsMiddleware`` measures every request: total time, number and
+time of ORM queries (an execute wrapper on every connection, which also sees
+the queries async views run in the ORM's thread), template rendering (through the ``TimedDjangoTemplates`` backend) and whether the page
+cache answered it. Staff, or everyone with ``SERVER_TIMING = 'all'``, get the
+numbers in a ``Server-Timing`` header that browser dev tools show next to the
+request.
+
+The same numbers are added to per-view latency histograms and counters kept
+in process memory. Each gunicorn worker writes its totals to
+``METRICS_DIR/metrics-<pid>.json`` every ``METRICS_WRITE_INTERVAL`` seconds
+and when it exits, and ``/metrics`` adds up all the files in the Prometheus
+text format, so whichever worker answers the scrape reports the whole server.
+Without ``METRICS_DIR`` only the answering process is counted. The files also
+carry the depth and flush counters of each worker's newsletter subscription
+buffer (``buffer.py``).
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import setting_changed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'hilton'
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+COUNTERS = {
+    'requests_total': 'Responses sent, by view and status code',
+    'db_queries_total': 'ORM queries run while answering requests',
+    'db_seconds_total': 'Time spent in ORM queries',
+    'template_seconds_total': 'Time spent rendering templates',
+    'page_cache_total': 'Page cache lookups, by result',
+    'subscribe_buffer_flushed_total': 'Buffered newsletter sign-ups written to the database',
+    'subscribe_buffer_flush_failures_total': 'Failed writes of buffered newsletter sign-ups',
+}
+# Added up over the workers like the counters
+GAUGES = {
+    'subscribe_buffer_depth': 'Newsletter sign-ups waiting in the buffers to be written',
+}
+# Rendered from the <name>_sum and <name>_count counters
+SUMMARIES = {
+    'subscribe_buffer_flush_seconds': 'Time spent writing buffered newsletter sign-ups, per flush',
+}
+HISTOGRAM = ('request_duration_seconds', 'Time spent answering requests, by view')
+
+_current = ContextVar('request_timing', default=None)
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+class RequestTiming:
+    """What one request spent its time on"""
+
+    __slots__ = ('total', 'queries', 'db', 'template', 'rendering', 'cache')
+
+    def __init__(self):
+        self.total = 0.0
+        self.queries = 0
+        self.db = 0.0
+        self.template = 0.0
+        self.rendering = False
+        self.cache = None
+
+    def __call__(self, execute, sql, params, many, context):
+        # Called by time_query() for the queries of this request
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+    def header(self):
+        parts = [
+            f'total;dur={self.total * 1000:.1f}',
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template * 1000:.1f}',
+        ]
+        if self.cache:
+            parts.append(f'cache;desc={self.cache}')
+        return ', '.join(parts)
+
+
+def time_query(execute, sql, params, many, context):
+    """Execute wrapper of every connection, timing the queries of the request being measured"""
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    return timing(execute, sql, params, many, context)
+
+
+def install_query_timer(connection, **kwargs):
+    # Connections belong to one thread and async views query from another, so
+    # the wrapper stays installed and finds the request through the context
+    if time_query not in connection.execute_wrappers:
+        # In front: execute_wrapper() blocks remove the last wrapper on exit
+        connection.execute_wrappers.insert(0, time_query)
+
+
+def record_page_cache(result):
+    """Note whether the page cache answered the current request (``hit`` or ``miss``)"""
+    timing = _current.get()
+    if timing is not None:
+        timing.cache = result
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        timing = _current.get()
+        # Templates rendered from inside another one are already being timed
+        if timing is None or timing.rendering:
+            return super().render(context, request)
+        timing.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timing.template += time.perf_counter() - started
+            timing.rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each render for the current request"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class Metrics:
+    """Per-process request histograms and counters, optionally shared through files"""
+
+    def __init__(self, directory='', interval=15.0, buckets=BUCKETS):
+        self.directory = Path(directory) if directory else None
+        self.interval = interval
+        self.buckets = tuple(buckets)
+        self._reset()
+
+    def _reset(self):
+        # Also called in a forked child: locks and threads do not survive fork()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+        self._counters = {}
+        self._histograms = {}
+
+    @property
+    def path(self):
+        return self.directory / f'metrics-{self._pid}.json'
+
+    def _inc(self, name, labels, value):
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, view, status, timing):
+        """Add one finished request"""
+        if self._pid != os.getpid():
+            self._reset()
+        bucket = bisect_left(self.buckets, timing.total)
+        labels = (('view', view),)
+        with self._lock:
+            histogram = self._histograms.get(view)
+            if histogram is None:
+                # Count per bucket (the last one is +Inf), then the sum
+                histogram = self._histograms[view] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[bucket] += 1
+            histogram[-1] += timing.total
+            self._inc('requests_total', (*labels, ('status', str(status))), 1)
+            self._inc('db_queries_total', labels, timing.queries)
+            self._inc('db_seconds_total', labels, timing.db)
+            self._inc('template_seconds_total', labels, timing.template)
+            if timing.cache:
+                self._inc('page_cache_total', (*labels, ('result', timing.cache)), 1)
+            if self.directory is not None and self._thread is None:
+                self._start()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name='metrics-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._wake.wait(self.interval):
+            self.write()
+
+    def snapshot(self):
+        """Return this process's totals as JSON-serialisable data"""
+        from .buffer import buffer_stats
+
+        with self._lock:
+            snapshot = {
+                'buckets': list(self.buckets),
+                'counters': [[name, [list(pair) for pair in labels], value]
+                             for (name, labels), value in self._counters.items()],
+                'histograms': [[view, list(values)] for view, values in self._histograms.items()],
+            }
+        stats = buffer_stats()
+        if stats is not None:
+            snapshot['counters'] += [
+                ['subscribe_buffer_depth', [], stats['depth']],
+                ['subscribe_buffer_flushed_total', [], stats['flushed']],
+                ['subscribe_buffer_flush_failures_total', [], stats['failures']],
+                ['subscribe_buffer_flush_seconds_count', [], stats['flushes']],
+                ['subscribe_buffer_flush_seconds_sum', [], stats['total_flush_seconds']],
+            ]
+        return snapshot
+
+    def write(self):
+        """Write this process's totals to its file in ``directory``"""
+        if self.directory is None:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            temporary = self.path.with_suffix('.tmp')
+            temporary.write_text(json.dumps(self.snapshot()))
+            # Readers never see a half-written file
+            os.replace(temporary, self.path)
+        except OSError:
+            logger.exception('Could not write metrics to %s', self.directory)
+
+    def collect(self):
+        """Return the totals of this process plus those written by the other workers"""
+        snapshots = [self.snapshot()]
+        if self.directory is not None and self.directory.is_dir():
+            for path in self.directory.glob('metrics-*.json'):
+                if path == self.path:
+                    continue
+                try:
+                    snapshots.append(json.loads(path.read_text()))
+                except (OSError, ValueError):
+                    logger.warning('Skipping unreadable metrics file %s', path)
+        return merge_snapshots(snapshots, self.buckets)
+
+    def close(self):
+        """Stop the writer thread and write the final totals"""
+        if self._pid != os.getpid() or self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.write()
+
+
+def merge_snapshots(snapshots, buckets=BUCKETS):
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        if tuple(snapshot.get('buckets', ())) != tuple(buckets):
+            # Written with other bucket bounds (an older deploy); cannot be added up
+            continue
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for view, values in snapshot['histograms']:
+            total = histograms.setdefault(view, [0] * len(values))
+            for index, value in enumerate(values):
+                total[index] += value
+    return counters, histograms
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in pairs
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def render_prometheus(collected, buckets=BUCKETS):
+    """Format collected totals in the Prometheus text exposition format"""
+    counters, histograms = collected
+    name, help_text = HISTOGRAM
+    lines = [f'# HELP {PREFIX}_{name} {help_text}', f'# TYPE {PREFIX}_{name} histogram']
+    for view, values in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip((*buckets, '+Inf'), values):
+            cumulative += count
+            lines.append(f'{PREFIX}_{name}_bucket{_labels([("view", view), ("le", bound)])} {cumulative}')
+        lines.append(f'{PREFIX}_{name}_sum{_labels([("view", view)])} {values[-1]}')
+        lines.append(f'{PREFIX}_{name}_count{_labels([("view", view)])} {cumulative}')
+    for kind, names in (('counter', COUNTERS), ('gauge', GAUGES)):
+        for counter, help_text in names.items():
+            samples = sorted((labels, value) for (name, labels), value in counters.items() if name == counter)
+            if not samples:
+                continue
+            lines += [f'# HELP {PREFIX}_{counter} {help_text}', f'# TYPE {PREFIX}_{counter} {kind}']
+            lines += [f'{PREFIX}_{counter}{_labels(labels)} {value}' for labels, value in samples]
+    for summary, help_text in SUMMARIES.items():
+        samples = sorted(
+            (name, labels, value) for (name, labels), value in counters.items()
+            if name in (f'{summary}_sum', f'{summary}_count')
+        )
+        if not samples:
+            continue
+        lines += [f'# HELP {PREFIX}_{summary} {help_text}', f'# TYPE {PREFIX}_{summary} summary']
+        lines += [f'{PREFIX}_{name}{_labels(labels)} {value}' for name, labels, value in samples]
+    return '\n'.join(lines) + '\n'
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match._func_path
+
+
+def needs_user(request):
+    """Whether showing Server-Timing depends on who is logged in"""
+    # Guests without a session are never staff; don't load a user for them
+    return getattr(settings, 'SERVER_TIMING', 'staff') == 'staff' and settings.SESSION_COOKIE_NAME in request.COOKIES
+
+
+def show_server_timing(request, user=None):
+    if getattr(settings, 'SERVER_TIMING', 'staff') == 'all':
+        return True
+    if not needs_user(request):
+        return False
+    if user is None:
+        user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_staff)
+
+
+class RequestMetricsMiddleware:
+    """Time each request; place it above SessionMiddleware so reading the user adds no Vary: Cookie"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timing = RequestTiming()
+        token = _current.set(timing)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timing, started)
+
+    async def __acall__(self, request):
+        timing = RequestTiming()
+        token = _current.set(timing)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        # request.user would load the user again, synchronously
+        user = await request.auser() if needs_user(request) and hasattr(request, 'auser') else None
+        return self.finish(request, response, timing, started, user)
+
+    def finish(self, request, response, timing, started, user=None):
+        timing.total = time.perf_counter() - started
+        get_metrics().observe(view_label(request), response.status_code, timing)
+        if show_server_timing(request, user):
+            response.headers['Server-Timing'] = timing.header()
+        return response
+
+
+def get_metrics():
+    """Return the process-wide metrics, creating them from the settings on first use"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics(
+                    directory=getattr(settings, 'METRICS_DIR', ''),
+                    interval=getattr(settings, 'METRICS_WRITE_INTERVAL', 15),
+                )
+    return _metrics
+
+
+def close_metrics():
+    """Write and drop the process-wide metrics (graceful worker shutdown)"""
+    global _metrics
+    with _metrics_lock:
+        metrics, _metrics = _metrics, None
+    if metrics is not None:
+        metrics.close()
+
+
+def reset_metrics(**kwargs):
+    if kwargs['setting'].startswith('METRICS_'):
+        close_metrics()
+
+
+atexit.register(close_metrics)
+setting_changed.connect(reset_metrics, dispatch_uid='welcomeletter_reset_metrics')
+connection_created.connect(install_query_timer, dispatch_uid='welcomeletter_install_query_timer')
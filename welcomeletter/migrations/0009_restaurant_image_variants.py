@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('welcomeletter', '0008_contentversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of the uploaded image'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:48
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def normalize_emails(apps, schema_editor):
+    """Lowercase emails, merging subscribers that only differ by case"""
+    MailingListSubscriber = apps.get_model('welcomeletter', 'MailingListSubscriber')
+    kept = {}
+    for subscriber in MailingListSubscriber.objects.order_by('subscribed_at', 'pk'):
+        email = subscriber.email.strip().lower()
+        first = kept.get(email)
+        if first is None:
+            kept[email] = subscriber
+            if subscriber.email != email:
+                subscriber.email = email
+                subscriber.save(update_fields=['email'])
+            continue
+        if subscriber.is_active and not first.is_active:
+            first.is_active = True
+            first.unsubscribed_at = None
+            first.save(update_fields=['is_active', 'unsubscribed_at'])
+        subscriber.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('welcomeletter', '0009_restaurant_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_emails, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='mailinglistsubscriber',
+            name='email',
+            field=models.EmailField(db_index=True, help_text='Stored in lowercase; unique regardless of case', max_length=254),
+        ),
+        migrations.AddConstraint(
+            model_name='mailinglistsubscriber',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), name='unique_subscriber_email_ci'),
+        ),
+    ]
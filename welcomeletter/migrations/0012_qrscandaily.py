@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('welcomeletter', '0011_campaigns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QRScanDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('source', models.CharField(help_text='Code that was scanned, e.g. room-1204', max_length=64)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'QR Scans (daily)',
+                'verbose_name_plural': 'QR Scans (daily)',
+                'ordering': ['-day', '-count'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'source'), name='unique_qr_scan_day_source')],
+            },
+        ),
+    ]
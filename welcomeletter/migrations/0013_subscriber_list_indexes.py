@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('welcomeletter', '0012_qrscandaily'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mailinglistsubscriber',
+            index=models.Index(fields=['subscribed_at', 'id'], name='subscriber_subscribed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mailinglistsubscriber',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['subscribed_at', 'id'], name='subscriber_active_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('welcomeletter', '0013_subscriber_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaigndelivery',
+            name='claim',
+            field=models.CharField(blank=True, editable=False, help_text='Token of the run that claimed the row', max_length=32),
+        ),
+    ]
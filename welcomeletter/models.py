@@ -1,4 +1,7 @@
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.db import connections, models, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
 
 
 class ExternalLink(models.Model):
@@ -47,6 +50,7 @@ class Restaurant(models.Model):
     description = models.TextField()
     image_url = models.URLField(max_length=500, blank=True, help_text="External image URL (for demo)")
     image = models.ImageField(upload_to='restaurants/', blank=True, null=True, help_text="Uploaded restaurant image")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized copies of the uploaded image")
     menu_link = models.ForeignKey(
         ExternalLink, 
         on_delete=models.SET_NULL, 
@@ -104,24 +108,185 @@ class TransferOption(models.Model):
         return self.name
 
 
+class MailingListSubscriberManager(models.Manager):
+    """Manager with a single-statement subscribe path"""
+    
+    CREATED = 'created'
+    REACTIVATED = 'reactivated'
+    ALREADY_ACTIVE = 'already_active'
+    
+    def subscribe(self, email, ip_address=None):
+        """
+        Create or reactivate a subscription in one atomic statement.
+        
+        Returns CREATED, REACTIVATED or ALREADY_ACTIVE. Concurrent calls for the
+        same address (in any letter case) never raise IntegrityError.
+        """
+        email = email.strip().lower()
+        connection = connections[self.db]
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            return self._subscribe_fallback(email, ip_address)
+        
+        meta = self.model._meta
+        qn = connection.ops.quote_name
+        table = qn(meta.db_table)
+        column = {name: qn(meta.get_field(name).column) for name in (
+            'email', 'is_active', 'subscribed_at', 'unsubscribed_at', 'ip_address',
+        )}
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        # The conflicting row is only updated (and returned) when it is inactive.
+        # A fresh insert is recognised by carrying our own subscribed_at value.
+        sql = (
+            f"INSERT INTO {table} ({column['email']}, {column['is_active']}, {column['subscribed_at']}, "
+            f"{column['unsubscribed_at']}, {column['ip_address']}) "
+            f"VALUES (%s, %s, %s, NULL, %s) "
+            f"ON CONFLICT (LOWER({column['email']})) DO UPDATE "
+            f"SET {column['is_active']} = %s, {column['unsubscribed_at']} = NULL "
+            f"WHERE {table}.{column['is_active']} = %s "
+            f"RETURNING {column['subscribed_at']} = %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [email, True, now, ip_address, True, False, now])
+            row = cursor.fetchone()
+        if row is None:
+            return self.ALREADY_ACTIVE
+        return self.CREATED if row[0] else self.REACTIVATED
+    
+    async def asubscribe(self, email, ip_address=None):
+        """``subscribe`` for async views"""
+        # Raw cursors have no async API; run it in the ORM's thread like Django's own a* methods
+        return await sync_to_async(self.subscribe)(email, ip_address)
+    
+    def _subscribe_fallback(self, email, ip_address):
+        with transaction.atomic(using=self.db):
+            subscriber, created = self.select_for_update().get_or_create(
+                email=email,
+                defaults={'ip_address': ip_address, 'is_active': True}
+            )
+            if created:
+                return self.CREATED
+            if subscriber.is_active:
+                return self.ALREADY_ACTIVE
+            subscriber.is_active = True
+            subscriber.unsubscribed_at = None
+            subscriber.save(update_fields=['is_active', 'unsubscribed_at'])
+            return self.REACTIVATED
+
+
 class MailingListSubscriber(models.Model):
     """Model for mailing list subscribers"""
     
-    email = models.EmailField(unique=True)
+    email = models.EmailField(db_index=True, help_text="Stored in lowercase; unique regardless of case")
     is_active = models.BooleanField(default=True)
     subscribed_at = models.DateTimeField(auto_now_add=True)
     unsubscribed_at = models.DateTimeField(null=True, blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     
+    objects = MailingListSubscriberManager()
+    
     class Meta:
         ordering = ['-subscribed_at']
         verbose_name = 'Mailing List Subscriber'
         verbose_name_plural = 'Mailing List Subscribers'
+        constraints = [
+            models.UniqueConstraint(Lower('email'), name='unique_subscriber_email_ci'),
+        ]
+        indexes = [
+            # Admin list order (keyset pagination) and date filters
+            models.Index(fields=['subscribed_at', 'id'], name='subscriber_subscribed_idx'),
+            # The same for the "active" filter and active-only exports, without the inactive rows
+            models.Index(fields=['subscribed_at', 'id'], condition=models.Q(is_active=True),
+                         name='subscriber_active_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.email = self.email.strip().lower()
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return self.email
 
 
+class Campaign(models.Model):
+    """Newsletter mailing sent to all active subscribers"""
+    
+    STATUS_CHOICES = [
+        ('draft', 'Draft'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+    ]
+    
+    subject = models.CharField(max_length=200)
+    body_text = models.TextField(help_text="Plain text version of the email")
+    body_html = models.TextField(blank=True, help_text="Optional HTML version of the email")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Campaign'
+        verbose_name_plural = 'Campaigns'
+    
+    def __str__(self):
+        return self.subject
+
+
+class CampaignDelivery(models.Model):
+    """One recipient of a campaign; the row is written before the email is handed to SMTP"""
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('unknown', 'Unknown (run interrupted)'),
+    ]
+    
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='deliveries')
+    subscriber = models.ForeignKey(MailingListSubscriber, on_delete=models.CASCADE, related_name='deliveries')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    claim = models.CharField(max_length=32, blank=True, editable=False, help_text="Token of the run that claimed the row")
+    
+    class Meta:
+        verbose_name = 'Campaign Delivery'
+        verbose_name_plural = 'Campaign Deliveries'
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'subscriber'], name='unique_campaign_delivery'),
+        ]
+        indexes = [
+            models.Index(fields=['campaign', 'status']),
+        ]
+    
+    def __str__(self):
+        return f"{self.campaign} -> {self.subscriber}"
+
+
+class QRScanDaily(models.Model):
+    """Number of scans of one printed QR code on one day"""
+    
+    day = models.DateField()
+    source = models.CharField(max_length=64, help_text="Code that was scanned, e.g. room-1204")
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-day', '-count']
+        verbose_name = 'QR Scans (daily)'
+        verbose_name_plural = 'QR Scans (daily)'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'source'], name='unique_qr_scan_day_source'),
+        ]
+    
+    @property
+    def kind(self):
+        return self.source.split('-', 1)[0]
+    
+    def __str__(self):
+        return f"{self.source} on {self.day}: {self.count}"
+
+
 class SiteSettings(models.Model):
     """Singleton model for site-wide settings"""
     
@@ -153,5 +318,24 @@ class SiteSettings(models.Model):
         obj, created = cls.objects.get_or_create(pk=1)
         return obj
     
+    @classmethod
+    async def aget_settings(cls):
+        obj, created = await cls.objects.aget_or_create(pk=1)
+        return obj
+    
     def __str__(self):
         return "Site Settings"
+
+
+class ContentVersion(models.Model):
+    """Singleton counter bumped whenever content shown on the public pages changes"""
+    
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Content Version'
+        verbose_name_plural = 'Content Version'
+    
+    def __str__(self):
+        return f"Content version {self.version}"
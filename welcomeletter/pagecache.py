@@ -0,0 +1,182 @@
+"""
+Full-page cache for the public welcome-letter pages.
+
+Every guest gets the same HTML for a given URL, so the rendered bytes are
+stored in the ``PAGE_CACHE_ALIAS`` cache under a key made of the URL, the
+active language, the content version and the asset build. The public pages
+take no parameters, so the query string (``?utm_source=...``, ``?fbclid=...``)
+is left out of the key and cannot fill the cache with copies. Hits are
+answered straight from the cache without running the view, the template
+engine or the ORM. A new content version or asset build makes old entries
+unreachable; ``purge_pages`` also frees their space when the pages have a
+cache of their own.
+
+Stored pages are marked ``Cache-Control: public`` so browsers and the reverse
+proxy can keep them too; they never carry cookies because the public
+templates do not touch the session, messages or CSRF token.
+
+Async views are wrapped the same way, reading and writing the cache through
+its async API.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.urls import URLPattern, get_resolver
+from django.utils import translation
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from .assets import get_assets
+from .compression import available_encodings, compress, is_html, minify_html, negotiate
+from .metrics import record_page_cache
+from .versioning import aget_content_version, get_content_version
+
+
+KEY_PREFIX = 'welcomeletter:page'
+
+
+def get_page_cache():
+    return caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'default')]
+
+
+def page_cache_key(request, version=None):
+    """Return the cache key of the page for this request"""
+    if version is None:
+        version = get_content_version()
+    # Not build_absolute_uri(): the query string does not change the page
+    url = f'{request.scheme}://{request.get_host()}{request.path}'
+    digest = hashlib.md5(url.encode('utf-8'), usedforsecurity=False).hexdigest()
+    return f'{KEY_PREFIX}:{version}:{get_assets().build_id}:{translation.get_language()}:{digest}'
+
+
+def is_shareable(request, response):
+    """Return True if the response holds nothing specific to the requesting guest"""
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    if response.has_header('Vary') or 'private' in response.get('Cache-Control', ''):
+        return False
+    # A CSRF token, session or flash message in the page ties it to one visitor
+    if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+        return False
+    session = getattr(request, 'session', None)
+    if session is not None and session.accessed:
+        return False
+    storage = getattr(request, '_messages', None)
+    return storage is None or not storage.used
+
+
+def page_encodings():
+    """Encodings stored with each cached page, best first"""
+    return available_encodings() if getattr(settings, 'PAGE_CACHE_COMPRESS', True) else ()
+
+
+def negotiate_encoding(request):
+    """Return the encoding a cached page is served with for this request"""
+    return negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''), page_encodings())
+
+
+def make_entry(response):
+    """Turn a rendered response into a picklable cache entry, minified and compressed once"""
+    content = response.content
+    if getattr(settings, 'HTML_MINIFY', True) and is_html(response):
+        content = minify_html(content, response.charset)
+    return {
+        'content': content,
+        'headers': [(k, v) for k, v in response.headers.items() if k.lower() != 'content-length'],
+        'encoded': {encoding: compress(content, encoding) for encoding in page_encodings()},
+    }
+
+
+def response_from_entry(request, entry):
+    """Build the response for a cached entry, choosing the encoding the client accepts"""
+    content = entry['content']
+    response = HttpResponse(headers=dict(entry['headers']))
+    response.html_minified = True
+    if entry['encoded']:
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate_encoding(request)
+        if encoding in entry['encoded']:
+            content = entry['encoded'][encoding]
+            response.headers['Content-Encoding'] = encoding
+    response.content = content
+    response.headers['Content-Length'] = str(len(content))
+    return response
+
+
+def share_page(response):
+    """Mark a shareable response public and return its cache entry"""
+    # Let browsers and the reverse proxy reuse the page as well
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'PAGE_CACHE_MAX_AGE', 60))
+    return make_entry(response)
+
+
+def purge_pages():
+    """Delete every cached page, if the pages have a cache to themselves
+
+    A shared cache is left alone: the content version and asset build in the
+    keys already make the old pages unreachable, and they expire there.
+    """
+    if getattr(settings, 'PAGE_CACHE_ALIAS', 'default') != 'default':
+        get_page_cache().clear()
+
+
+def cache_public_page(view_func):
+    """Serve a public view from the page cache, storing the page on a miss"""
+    if iscoroutinefunction(view_func):
+        async def _wrapped_view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view_func(request, *args, **kwargs)
+
+            cache = get_page_cache()
+            key = page_cache_key(request, await aget_content_version())
+            entry = await cache.aget(key)
+            if entry is not None:
+                record_page_cache('hit')
+                return response_from_entry(request, entry)
+
+            record_page_cache('miss')
+            response = await view_func(request, *args, **kwargs)
+            if not is_shareable(request, response):
+                return response
+            entry = share_page(response)
+            await cache.aset(key, entry, getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 60 * 24))
+            return response_from_entry(request, entry)
+    else:
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            cache = get_page_cache()
+            key = page_cache_key(request)
+            entry = cache.get(key)
+            if entry is not None:
+                record_page_cache('hit')
+                return response_from_entry(request, entry)
+
+            record_page_cache('miss')
+            response = view_func(request, *args, **kwargs)
+            if not is_shareable(request, response):
+                return response
+            entry = share_page(response)
+            cache.set(key, entry, getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 60 * 24))
+            return response_from_entry(request, entry)
+
+    _wrapped_view = wraps(view_func)(_wrapped_view)
+    # Lets public_pages() (export_static_site, build_assets) find the public pages
+    _wrapped_view.public_page = True
+    return _wrapped_view
+
+
+def public_pages():
+    """Yield (path, view) for every parameterless public page in the URLconf"""
+    def walk(patterns, prefix=''):
+        for pattern in patterns:
+            if isinstance(pattern, URLPattern):
+                if getattr(pattern.callback, 'public_page', False) and not pattern.pattern.converters:
+                    yield '/' + prefix + str(pattern.pattern), pattern.callback
+            else:
+                yield from walk(pattern.url_patterns, prefix + str(pattern.pattern))
+    yield from walk(get_resolver().url_patterns)
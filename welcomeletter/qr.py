@@ -0,0 +1,232 @@
+"""
+Batch generation of tracked QR codes and print sheets.
+
+A manifest (CSV) lists the rooms, tables and other places that need their own
+code. Every code points at the scan-counting redirect (``/q/room-1204/``, see
+``scans.py``) and is written as an SVG under ``svg/<kind>/``. Codes are
+rendered in a process pool, and a code whose content, size and error level
+are unchanged since the last run (recorded in ``.qr-manifest.json``) is not
+rendered again.
+
+The print sheets reuse the designs in ``static/print/``: the QR image of the
+design is replaced by each code (with its label underneath) and the pages are
+concatenated into one ready-to-print HTML file per kind and format, e.g.
+``sheets/room-tent-card.html``.
+"""
+import csv
+import hashlib
+import html
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.text import slugify
+
+
+STATE_FILE = '.qr-manifest.json'
+DESIGN_QR_SRC = '../images/ramseshilton_qr.svg'
+
+# Print designs in static/print/ and how many codes fit on one page
+LAYOUTS = {
+    'poster-a4': ('qr-poster-a4.html', 1),
+    'poster-a5': ('qr-poster-a5.html', 1),
+    'tent-card': ('qr-tent-card.html', 1),
+    'table-cards': ('qr-table-cards.html', 4),
+}
+DEFAULT_FORMATS = {
+    'room': ('tent-card',),
+    'table': ('table-cards',),
+}
+FALLBACK_FORMATS = ('poster-a4',)
+
+SHEET_CSS = """
+        body.qr-batch { display: block; min-height: 0; }
+        .sheet-page { display: flex; justify-content: center; break-after: page; page-break-after: always; }
+        .sheet-page:last-of-type { break-after: auto; page-break-after: auto; }
+        .qr-label {
+            font-family: 'Courier New', monospace;
+            font-weight: bold;
+            font-size: 11pt;
+            text-align: center;
+            margin-top: 2mm;
+        }
+"""
+
+
+@dataclass(frozen=True)
+class Code:
+    """One printed QR code"""
+
+    kind: str
+    code: str
+    label: str
+    url: str
+    formats: tuple = field(default=())
+
+    @property
+    def slug(self):
+        return code_slug(self.kind, self.code)
+
+    @property
+    def filename(self):
+        return f'svg/{slugify(self.kind)}/{slugify(self.code)}.svg'
+
+
+def code_slug(kind, code):
+    return f'{slugify(kind)}-{slugify(code)}'
+
+
+def tracked_url(base_url, path, slug):
+    """Return the URL a code points at: the redirect that counts the scan, then ``path``
+
+    A path instead of a query parameter keeps the page cache from holding a
+    copy of each page per printed code.
+    """
+    return f"{base_url.rstrip('/')}/q/{slug}/{(path or '').lstrip('/')}"
+
+
+def expand_codes(value):
+    """Expand ``1201-1230`` into the individual codes, keeping zero padding"""
+    match = re.fullmatch(r'\s*(\d+)\s*-\s*(\d+)\s*', value)
+    if not match:
+        return [value.strip()]
+    start, end = match.groups()
+    width = len(start)
+    return [str(number).zfill(width) for number in range(int(start), int(end) + 1)]
+
+
+def read_manifest(lines, base_url, formats=None):
+    """Read codes from a CSV with ``kind,code`` and optional ``label,path,formats`` columns
+
+    ``code`` may be a numeric range (``101-130``) and ``label`` may contain
+    ``{code}``; ``formats`` is a ``;``-separated list of layouts.
+    """
+    codes = []
+    for number, row in enumerate(csv.DictReader(lines), start=2):
+        row = {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+        kind, code = row.get('kind') or 'site', row.get('code')
+        if not code:
+            raise ValueError(f'Manifest line {number}: missing code')
+        row_formats = tuple(filter(None, row.get('formats', '').split(';'))) or formats
+        row_formats = row_formats or DEFAULT_FORMATS.get(kind, FALLBACK_FORMATS)
+        unknown = set(row_formats) - set(LAYOUTS)
+        if unknown:
+            raise ValueError(f'Manifest line {number}: unknown format {", ".join(sorted(unknown))}')
+        for value in expand_codes(code):
+            label = (row.get('label') or f'{kind.title()} {{code}}').replace('{code}', value)
+            url = tracked_url(base_url, row.get('path'), code_slug(kind, value))
+            codes.append(Code(kind, value, label, url, tuple(row_formats)))
+    return codes
+
+
+def content_hash(content, scale, error):
+    import segno
+    return hashlib.sha256(f'{content}|{scale}|{error}|{segno.__version__}'.encode('utf-8')).hexdigest()
+
+
+def render_svg(task):
+    """Write one QR code as SVG; runs in the worker processes"""
+    import segno
+    content, path, scale, error = task
+    started = time.perf_counter()
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    segno.make(content, error=error, micro=False).save(path, scale=scale)
+    return path, time.perf_counter() - started
+
+
+def generate_codes(codes, output_dir, processes=None, scale=10, error='H', force=False):
+    """Render the SVG of every code that changed; returns (rendered, skipped, seconds spent rendering)"""
+    output_dir = Path(output_dir)
+    state_path = output_dir / STATE_FILE
+    state = {} if force or not state_path.exists() else json.loads(state_path.read_text())
+
+    tasks, hashes, skipped = [], {}, 0
+    for code in codes:
+        digest = content_hash(code.url, scale, error)
+        hashes[code.filename] = digest
+        if state.get(code.filename) == digest and (output_dir / code.filename).exists():
+            skipped += 1
+            continue
+        tasks.append((code.url, str(output_dir / code.filename), scale, error))
+
+    processes = processes or os.cpu_count() or 1
+    render_seconds = 0.0
+    if processes > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            chunksize = max(1, len(tasks) // (processes * 4))
+            for _, seconds in executor.map(render_svg, tasks, chunksize=chunksize):
+                render_seconds += seconds
+    else:
+        for task in tasks:
+            render_seconds += render_svg(task)[1]
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    state.update(hashes)
+    state_path.write_text(json.dumps(state, indent=2, sort_keys=True))
+    return len(tasks), skipped, render_seconds
+
+
+def load_layout(name, sheet_dir):
+    """Split a static/print design into (head, page prefix, unit markup, trailer, codes per page)"""
+    filename, per_page = LAYOUTS[name]
+    static_dir = Path(settings.BASE_DIR) / 'static'
+    source = (static_dir / 'print' / filename).read_text(encoding='utf-8')
+    # Point the design's relative asset URLs (../images, ../fonts) at static/
+    assets = os.path.relpath(static_dir, sheet_dir).replace(os.sep, '/')
+    source = source.replace("url('../", f"url('{assets}/").replace('src="../images/logo', f'src="{assets}/images/logo')
+
+    head, rest = source.split('<body>', 1)
+    body = rest.rsplit('</body>', 1)[0]
+    head = head.replace('</style>', SHEET_CSS + '    </style>', 1)
+    trailer = ''
+    instructions = re.search(r'\s*<div class="print-instructions">.*?</div>', body, re.S)
+    if instructions:
+        trailer = instructions.group(0)
+        body = body.replace(trailer, '')
+
+    prefix = ''
+    if per_page > 1:
+        grid = body.index('<div class="cards-grid">')
+        prefix = body[:grid]
+        body = re.search(r'(<div class="card">.*?)\s*<!-- Card 2 -->', body[grid:], re.S).group(1)
+    return head, prefix, body.strip(), trailer, per_page
+
+
+def fill_unit(unit, code, src):
+    label = html.escape(code.label)
+    image = f'<img src="{html.escape(src)}" alt="QR code for {label}"><div class="qr-label">{label}</div>'
+    return re.sub(r'<img src="' + re.escape(DESIGN_QR_SRC) + r'"[^>]*>', lambda m: image, unit)
+
+
+def write_sheet(name, codes, output_dir):
+    """Write the print sheet of ``codes`` in layout ``name`` and return its path"""
+    sheet_dir = Path(output_dir) / 'sheets'
+    sheet_dir.mkdir(parents=True, exist_ok=True)
+    head, prefix, unit, trailer, per_page = load_layout(name, sheet_dir)
+    pages = []
+    for start in range(0, len(codes), per_page):
+        units = [
+            fill_unit(unit, code, os.path.relpath(Path(output_dir) / code.filename, sheet_dir).replace(os.sep, '/'))
+            for code in codes[start:start + per_page]
+        ]
+        if per_page > 1:
+            units = ['<div class="cards-grid">', *units, '</div>']
+        pages.append('<div class="sheet-page">\n' + '\n'.join(units) + '\n</div>')
+    path = sheet_dir / f'{slugify(codes[0].kind)}-{name}.html'
+    path.write_text(f'{head}<body class="qr-batch">{prefix}\n' + '\n'.join(pages) + f'{trailer}\n</body>\n</html>\n',
+                    encoding='utf-8')
+    return path
+
+
+def write_sheets(codes, output_dir):
+    """Write one sheet per kind and format; returns the written paths"""
+    groups = {}
+    for code in codes:
+        for name in code.formats:
+            groups.setdefault((code.kind, name), []).append(code)
+    return [write_sheet(name, group, output_dir) for (_, name), group in groups.items()]
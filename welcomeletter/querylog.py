@@ -0,0 +1,152 @@
+"""
+Find N+1 queries: which SQL a request runs, and from where.
+
+``QueryLog`` is installed with ``connection.execute_wrapper`` and records each
+query with its normalized SQL (parameters, literals and ``IN`` lists folded to
+``?``) and its call site: the template and line being rendered when the query
+ran, or else the innermost frame of project code. ``QueryLog.repeated()``
+groups the queries by SQL and call site and returns the groups that ran
+``threshold`` times or more, the signature of a loop doing one query per item.
+
+Views declare how many queries they may run with ``@query_budget(n)``. In
+development ``QueryLogMiddleware`` (enabled with ``QUERY_LOG = True``) logs a
+warning with the grouped report for requests that repeat a query or go over
+their view's budget. In tests ``QueryBudgetMixin.assertQueryBudget`` fails with
+the same report.
+"""
+import logging
+import re
+import sys
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends import utils as backend_utils
+from django.template.base import Node
+
+
+logger = logging.getLogger(__name__)
+
+REPEAT_THRESHOLD = 2
+
+_RENDER_NODE = Node.render_annotated.__code__
+_CURSOR_FILE = backend_utils.__file__
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDERS = re.compile(r'%s|%\(\w+\)s|\?')
+_LISTS = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+def query_budget(queries):
+    """Declare the most queries a view may run for one request (checked by tests and QUERY_LOG)"""
+    def decorator(view):
+        view.query_budget = queries
+        return view
+    return decorator
+
+
+def normalize_sql(sql):
+    """``sql`` with values replaced by ``?``, so queries that differ only in parameters compare equal"""
+    sql = _STRINGS.sub('?', sql)
+    sql = _NUMBERS.sub('?', sql)
+    sql = _PLACEHOLDERS.sub('?', sql)
+    sql = _LISTS.sub('(...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def call_site(frame):
+    """Where a query came from: ``template.html:12`` or ``app/module.py:34 in function``"""
+    base_dir = str(settings.BASE_DIR)
+    python = None
+    while frame is not None:
+        code = frame.f_code
+        if code is _RENDER_NODE:
+            # The innermost template node being rendered is the most precise site
+            node = frame.f_locals.get('self')
+            origin, token = getattr(node, 'origin', None), getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                return f'{origin.template_name or origin.name}:{token.lineno}'
+        elif python is None and code.co_filename.startswith(base_dir) and code.co_filename != __file__ \
+                and 'site-packages' not in code.co_filename:
+            filename = code.co_filename[len(base_dir):].lstrip('/\\')
+            python = f'{filename}:{frame.f_lineno} in {code.co_name}'
+        frame = frame.f_back
+    return python or '<unknown>'
+
+
+class QueryLog:
+    """Every query run while installed, with its normalized SQL and call site"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        # Start from the cursor, above any other execute wrappers
+        frame = sys._getframe(1)
+        while frame is not None and frame.f_code.co_filename != _CURSOR_FILE:
+            frame = frame.f_back
+        self.queries.append((normalize_sql(sql), call_site(frame)))
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+    @contextmanager
+    def record(self, using=None):
+        """Log the queries of ``using`` (a list of aliases; default every database) inside the block"""
+        with ExitStack() as stack:
+            for alias in using or connections:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+    def repeated(self, threshold=REPEAT_THRESHOLD):
+        """``[(count, sql, site)]`` of the queries run ``threshold`` or more times from one place"""
+        groups = Counter(self.queries)
+        return [(count, sql, site) for (sql, site), count in groups.most_common() if count >= threshold]
+
+    def report(self, budget=None, threshold=REPEAT_THRESHOLD):
+        """Readable summary: the query count against ``budget`` and the repeated groups"""
+        summary = f'{len(self)} queries'
+        if budget is not None:
+            summary += f' (budget {budget})'
+        lines = [summary]
+        repeated = self.repeated(threshold)
+        if repeated:
+            lines.append('Repeated:')
+            lines.extend(f'  {count}x {site}: {sql}' for count, sql, site in repeated)
+        lines.append('All, in order:')
+        lines.extend(f'  {site}: {sql}' for sql, site in self.queries)
+        return '\n'.join(lines)
+
+
+class QueryLogMiddleware:
+    """Warn about requests that repeat a query or run more than their view's ``query_budget``"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_LOG', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryLog().record() as log:
+            response = self.get_response(request)
+        budget = getattr(getattr(request.resolver_match, 'func', None), 'query_budget', None)
+        over = budget is not None and len(log) > budget
+        if over or log.repeated():
+            logger.warning('%s %s: %s', request.method, request.path, log.report(budget))
+        return response
+
+
+class QueryBudgetMixin:
+    """TestCase mixin with ``assertQueryBudget``, a stricter ``assertNumQueries``"""
+
+    @contextmanager
+    def assertQueryBudget(self, budget, threshold=REPEAT_THRESHOLD, using=None):
+        """Fail if the block runs more than ``budget`` queries or any query ``threshold`` times from one place"""
+        with QueryLog().record(using) as log:
+            yield log
+        if len(log) > budget or log.repeated(threshold):
+            self.fail(log.report(budget, threshold))
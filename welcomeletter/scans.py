@@ -0,0 +1,206 @@
+"""
+Counting QR code scans without a database write per scan.
+
+The ``qr_redirect`` view only bumps an in-memory counter keyed by day and
+source (``room-1204``) and redirects. Each worker process keeps its own
+counters; a background thread adds them to ``QRScanDaily`` every
+``QR_SCAN_FLUSH_INTERVAL`` seconds with one multi-row
+``INSERT ... ON CONFLICT DO UPDATE SET count = count + excluded.count``, so
+several workers flushing the same day and source simply add up. A day keeps
+at most ``QR_SCAN_MAX_SOURCES`` sources in the table; scans of further new
+sources that day (someone requesting random ``/q/<source>/`` URLs) are
+counted as ``other``, as are those beyond that many in one worker's memory
+between flushes. Counters are also flushed on graceful worker shutdown (``gunicorn.conf.py`` and
+``atexit``); a killed worker loses at most one interval of scans.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+OTHER_SOURCE = 'other'
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def cap_sources(counts, max_sources, using='default'):
+    """Count scans of sources that would take a day past ``max_sources`` rows as ``other``"""
+    from .models import QRScanDaily
+
+    capped = {}
+    for day in {day for day, _ in counts}:
+        sources = {source: count for (row_day, source), count in counts.items() if row_day == day}
+        rows = QRScanDaily.objects.using(using).filter(day=day)
+        known = set(rows.filter(source__in=sources).values_list('source', flat=True))
+        room = max_sources - rows.exclude(source=OTHER_SOURCE).count()
+        for source, count in sources.items():
+            if source not in known and source != OTHER_SOURCE:
+                if room <= 0:
+                    source = OTHER_SOURCE
+                else:
+                    room -= 1
+            capped[day, source] = capped.get((day, source), 0) + count
+    return capped
+
+
+def write_counts(counts, using='default'):
+    """Add ``{(day, source): count}`` to the daily totals with one multi-row upsert"""
+    from .models import QRScanDaily
+
+    if not counts:
+        return
+    counts = cap_sources(counts, getattr(settings, 'QR_SCAN_MAX_SOURCES', 5000), using)
+    connection = connections[using]
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        with transaction.atomic(using=using):
+            for (day, source), count in counts.items():
+                updated = QRScanDaily.objects.using(using).filter(day=day, source=source).update(
+                    count=F('count') + count,
+                )
+                if not updated:
+                    QRScanDaily.objects.using(using).create(day=day, source=source, count=count)
+        return
+
+    meta = QRScanDaily._meta
+    qn = connection.ops.quote_name
+    table = qn(meta.db_table)
+    day, source, count = (qn(meta.get_field(name).column) for name in ('day', 'source', 'count'))
+    items = list(counts.items())
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        # Stay well below SQLite's limit on query parameters
+        for start in range(0, len(items), 1000):
+            chunk = items[start:start + 1000]
+            params = []
+            for (row_day, row_source), row_count in chunk:
+                params.extend([connection.ops.adapt_datefield_value(row_day), row_source, row_count])
+            cursor.execute(
+                f"INSERT INTO {table} ({day}, {source}, {count}) VALUES {', '.join(['(%s, %s, %s)'] * len(chunk))} "
+                f"ON CONFLICT ({day}, {source}) DO UPDATE SET {count} = {table}.{count} + excluded.{count}",
+                params,
+            )
+
+
+class ScanCounter:
+    """Per-process scan counts, flushed to the database by a background thread"""
+
+    def __init__(self, interval=60.0, max_sources=5000, writer=write_counts):
+        self.interval = interval
+        self.max_sources = max_sources
+        self.writer = writer
+        self._reset()
+
+    def _reset(self):
+        # Also called in a forked child: locks and threads do not survive fork()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._counts = {}
+        self._thread = None
+        self._closed = False
+        self._stats = {'scans': 0, 'flushes': 0, 'failures': 0, 'last_flush_rows': 0, 'last_flush_seconds': 0.0}
+
+    def add(self, source, day=None):
+        """Count one scan of ``source``"""
+        if self._pid != os.getpid():
+            self._reset()
+        key = (day or timezone.localdate(), source)
+        with self._lock:
+            if key not in self._counts and len(self._counts) >= self.max_sources:
+                # Bound memory if someone scripts random sources; write_counts bounds the table
+                key = (key[0], OTHER_SOURCE)
+            self._counts[key] = self._counts.get(key, 0) + 1
+            self._stats['scans'] += 1
+            if self._thread is None:
+                self._start()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name='qr-scan-counter', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._wake.wait(self.interval):
+            try:
+                self.flush()
+            finally:
+                connections.close_all()
+
+    def flush(self):
+        """Write the counts gathered so far; returns the number of (day, source) rows written"""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts = self._counts, {}
+            if not counts:
+                return 0
+            started = time.perf_counter()
+            try:
+                self.writer(counts)
+            except Exception:
+                logger.exception('Could not write %d QR scan counters, keeping them', len(counts))
+                with self._lock:
+                    for key, count in counts.items():
+                        self._counts[key] = self._counts.get(key, 0) + count
+                    self._stats['failures'] += 1
+                return 0
+            with self._lock:
+                self._stats['flushes'] += 1
+                self._stats['last_flush_rows'] = len(counts)
+                self._stats['last_flush_seconds'] = time.perf_counter() - started
+            return len(counts)
+
+    def close(self):
+        """Stop the background thread and write what is left"""
+        if self._pid != os.getpid() or self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        """Return a copy of the counters about the counter itself"""
+        with self._lock:
+            return {**self._stats, 'pending_rows': len(self._counts)}
+
+
+def get_counter():
+    """Return the process-wide counter, creating it from the settings on first use"""
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                _counter = ScanCounter(
+                    interval=getattr(settings, 'QR_SCAN_FLUSH_INTERVAL', 60),
+                    max_sources=getattr(settings, 'QR_SCAN_MAX_SOURCES', 5000),
+                )
+    return _counter
+
+
+def close_counter():
+    """Flush and drop the process-wide counter (graceful worker shutdown)"""
+    global _counter
+    with _counter_lock:
+        counter, _counter = _counter, None
+    if counter is not None:
+        counter.close()
+
+
+def reset_counter(**kwargs):
+    if kwargs['setting'].startswith('QR_SCAN_'):
+        close_counter()
+
+
+atexit.register(close_counter)
+setting_changed.connect(reset_counter, dispatch_uid='welcomeletter_reset_scan_counter')
@@ -0,0 +1,30 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from .images import schedule_image_processing
+from .models import ExternalLink, Restaurant, TransferOption, SiteSettings
+from .pagecache import purge_pages
+from .versioning import bump_content_version
+
+
+# Models whose rows end up on the public pages
+CONTENT_MODELS = (ExternalLink, Restaurant, TransferOption, SiteSettings)
+
+
+def content_changed(sender, **kwargs):
+    """Bump the shared content version and drop cached pages once the change is committed"""
+    transaction.on_commit(bump_content_version, using=kwargs.get('using'))
+    transaction.on_commit(purge_pages, using=kwargs.get('using'))
+
+
+for model in CONTENT_MODELS:
+    post_save.connect(content_changed, sender=model, dispatch_uid=f'content_changed_save_{model.__name__}')
+    post_delete.connect(content_changed, sender=model, dispatch_uid=f'content_changed_delete_{model.__name__}')
+
+
+def restaurant_saved(sender, instance, **kwargs):
+    """Build responsive copies of a newly uploaded restaurant image"""
+    schedule_image_processing(instance, 'image')
+
+
+post_save.connect(restaurant_saved, sender=Restaurant, dispatch_uid='restaurant_image_variants')
@@ -0,0 +1,183 @@
+"""
+Static files storage: hashed and compressed like WhiteNoise's, plus optimized image variants.
+
+During ``collectstatic`` every PNG, JPEG and WebP image is re-encoded as AVIF
+(when Pillow has an AVIF encoder, 11.2 and later), WebP and its own format at each of ``STATIC_IMAGE_WIDTHS`` up to its own
+width (``images/logo/crest.png`` -> ``images/logo/crest-320w.avif``). The
+variants are collected, hashed and compressed like any other file, and
+``STATIC_ROOT/images.json`` describes them in the shape of the upload variants
+of ``images.py``, so ``{% static_image %}`` can build a ``<picture>`` from it.
+
+Images are encoded in ``STATIC_IMAGE_WORKERS`` processes (default: one per
+core). Results are kept in ``STATIC_IMAGE_CACHE`` under a hash of the image
+and the encoder settings, so a repeat run only encodes new or changed images.
+
+As with ``ManifestStaticFilesStorage``, a file missing from the manifest is an
+error outside ``DEBUG``: run ``collectstatic`` before serving the site.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path, PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+from .images import variant_name
+
+
+logger = logging.getLogger(__name__)
+
+IMAGE_MANIFEST = 'images.json'
+DEFAULT_WIDTHS = (160, 320, 640, 1280, 1920)
+IMAGE_EXTENSIONS = {'.png': 'png', '.jpg': 'jpg', '.jpeg': 'jpg', '.webp': 'webp'}
+# Tried in this order by the browser; the image's own format is the fallback
+PREFERRED = ('avif', 'webp')
+FORMATS = {
+    'avif': ('AVIF', {'quality': 55, 'speed': 6}),
+    'webp': ('WEBP', {'quality': 78, 'method': 6}),
+    'png': ('PNG', {'optimize': True}),
+    'jpg': ('JPEG', {'quality': 80, 'optimize': True, 'progressive': True}),
+}
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'png': 'image/png', 'jpg': 'image/jpeg'}
+# Bump to re-encode every cached image after changing the encoder
+CACHE_VERSION = 1
+
+
+def preferred_formats():
+    """The formats of ``PREFERRED`` this Pillow can encode"""
+    from PIL import features
+
+    # features.check() warns about features older Pillows do not know
+    return tuple(fmt for fmt in PREFERRED if fmt in features.modules and features.check_module(fmt))
+
+
+def encode_variants(data, ext, widths):
+    """Re-encode image bytes at ``widths`` (never upscaled); runs in a worker process
+
+    Returns ``(width, height, [(format, width, bytes)])``.
+    """
+    from PIL import Image, ImageOps
+
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    original_width, original_height = image.size
+    preferred = preferred_formats()
+    formats = preferred if ext in preferred else (*preferred, ext)
+    files = []
+    for width in sorted({min(width, original_width) for width in widths}):
+        height = round(original_height * width / original_width)
+        resized = image.resize((width, height), Image.LANCZOS) if width != original_width else image
+        for fmt in formats:
+            pil_format, options = FORMATS[fmt]
+            output = resized.convert('RGB') if fmt == 'jpg' and resized.mode != 'RGB' else resized
+            buffer = io.BytesIO()
+            output.save(buffer, pil_format, **options)
+            files.append((fmt, width, buffer.getvalue()))
+    return original_width, original_height, files
+
+
+class ImageCache:
+    """Encoded variants on disk, keyed by a hash of the source image and the encoder settings"""
+
+    def __init__(self, directory, widths):
+        self.directory = Path(directory)
+        self.settings = json.dumps([CACHE_VERSION, widths, FORMATS, preferred_formats()], sort_keys=True).encode()
+
+    def key(self, data):
+        return hashlib.sha256(self.settings + data).hexdigest()
+
+    def get(self, key):
+        meta = self.directory / f'{key}.json'
+        if not meta.exists():
+            return None
+        width, height, files = json.loads(meta.read_text())
+        try:
+            return width, height, [(fmt, w, (self.directory / f'{key}-{w}w.{fmt}').read_bytes()) for fmt, w in files]
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, result):
+        width, height, files = result
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for fmt, w, data in files:
+            (self.directory / f'{key}-{w}w.{fmt}').write_bytes(data)
+        (self.directory / f'{key}.json').write_text(json.dumps([width, height, [(fmt, w) for fmt, w, data in files]]))
+
+
+class OptimizedStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """CompressedManifestStaticFilesStorage that also writes AVIF/WebP/resized variants of the images"""
+
+    _image_variants = None
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            self.optimize_images(paths)
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+    def optimize_images(self, paths):
+        """Write the variants of the images among ``paths`` and add them to ``paths`` for hashing"""
+        widths = tuple(getattr(settings, 'STATIC_IMAGE_WIDTHS', DEFAULT_WIDTHS))
+        cache = ImageCache(
+            getattr(settings, 'STATIC_IMAGE_CACHE', None) or Path(settings.BASE_DIR) / '.cache' / 'static-images', widths,
+        )
+        images = {}
+        for name, (storage, path) in paths.items():
+            ext = IMAGE_EXTENSIONS.get(PurePosixPath(name).suffix.lower())
+            if ext is not None:
+                with storage.open(path) as f:
+                    images[name] = (ext, f.read())
+
+        results, missing = {}, []
+        for name, (ext, data) in images.items():
+            key = cache.key(data)
+            results[name] = cache.get(key)
+            if results[name] is None:
+                missing.append((name, key))
+
+        workers = getattr(settings, 'STATIC_IMAGE_WORKERS', None) or os.cpu_count() or 1
+        jobs = [(images[name][1], images[name][0], widths) for name, key in missing]
+        if workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+                encoded = list(executor.map(encode_variants, *zip(*jobs)))
+        else:
+            encoded = [encode_variants(*job) for job in jobs]
+        for (name, key), result in zip(missing, encoded):
+            cache.set(key, result)
+            results[name] = result
+        logger.info('Image variants: %d image(s), %d encoded, %d from cache', len(images), len(missing),
+                    len(images) - len(missing))
+
+        manifest = {}
+        for name, (width, height, files) in results.items():
+            ext, data = images[name]
+            sources = {}
+            for fmt, w, encoded_data in files:
+                if fmt == ext and w == width and len(encoded_data) >= len(data):
+                    # The original is already smaller than a re-encode
+                    sources.setdefault(fmt, []).append({'name': name, 'width': w, 'bytes': len(data)})
+                    continue
+                variant = variant_name(name, w, fmt)
+                if self.exists(variant):
+                    self.delete(variant)
+                self._save(variant, ContentFile(encoded_data))
+                paths[variant] = (self, variant)
+                sources.setdefault(fmt, []).append({'name': variant, 'width': w, 'bytes': len(encoded_data)})
+            manifest[name] = {'source': name, 'width': width, 'height': height, 'fallback': ext, 'sources': sources}
+
+        if self.exists(IMAGE_MANIFEST):
+            self.delete(IMAGE_MANIFEST)
+        self._save(IMAGE_MANIFEST, ContentFile(json.dumps(manifest, indent=2, sort_keys=True).encode()))
+        self._image_variants = manifest
+
+    def image_variants(self, name):
+        """The collected variants of the static image ``name``, or None"""
+        if self._image_variants is None:
+            self._image_variants = {}
+            if self.exists(IMAGE_MANIFEST):
+                with self.open(IMAGE_MANIFEST) as f:
+                    self._image_variants = json.load(f)
+        return self._image_variants.get(name)
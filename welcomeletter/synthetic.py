@@ -0,0 +1,200 @@
+"""
+Synthetic data at production scale for capacity testing.
+
+``generate_data`` fills the database with external links, restaurants,
+newsletter subscribers and user accounts whose values come from a seeded
+``random.Random`` (one per model), so the same seed always gives the same rows
+and changing one volume leaves the other models' rows alone. Rows are built
+one batch at a time and written with ``bulk_create``, one transaction per
+batch, so memory stays flat for millions of rows.
+
+Every generated row carries the ``synthetic`` prefix in its slug or email, so
+``clear_synthetic`` removes exactly these rows and never real content.
+"""
+import random
+import time
+from datetime import timedelta
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ExternalLink, MailingListSubscriber, Restaurant
+from .pagecache import purge_pages
+from .versioning import bump_content_version
+
+
+PREFIX = 'synthetic'
+BATCH_SIZE = 5000
+PASSWORD = 'synthetic-password'
+
+FIRST_NAMES = [
+    'ahmed', 'amira', 'anna', 'carlos', 'chen', 'david', 'elena', 'fatima', 'hana', 'ibrahim', 'james', 'julia',
+    'karim', 'laila', 'lucas', 'maria', 'mohamed', 'nour', 'olga', 'omar', 'priya', 'sara', 'tom', 'yusuf',
+]
+LAST_NAMES = [
+    'ali', 'brown', 'costa', 'dubois', 'farouk', 'garcia', 'hassan', 'ivanova', 'kim', 'mansour', 'muller',
+    'nakamura', 'rossi', 'said', 'schmidt', 'silva', 'smith', 'tanaka', 'wang', 'yilmaz',
+]
+DOMAINS = ['example.com', 'example.net', 'example.org', 'mail.example.com', 'guests.example.com']
+CUISINES = ['Egyptian', 'Italian', 'Lebanese', 'Japanese', 'Indian', 'French', 'Grill', 'Seafood', 'Cafe']
+ADJECTIVES = ['Golden', 'Nile', 'Royal', 'Garden', 'Terrace', 'Lotus', 'Pharaoh', 'Sunset', 'Desert']
+WORDS = (
+    'fresh seasonal dishes served with a view of the river prepared by our chefs using local '
+    'ingredients and classic recipes in a relaxed setting for breakfast lunch and dinner'
+).split()
+
+
+def batched(objects, size):
+    iterator = iter(objects)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def sentence(rng, words=20):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def insert(model, objects, batch_size, after_batch=None):
+    """Write ``objects`` with one bulk insert and transaction per batch; returns the row count"""
+    total = 0
+    for number, batch in enumerate(batched(objects, batch_size)):
+        with transaction.atomic():
+            created = model.objects.bulk_create(batch, batch_size=batch_size)
+            if after_batch is not None:
+                after_batch(number, created)
+        total += len(batch)
+    return total
+
+
+def build_links(count, rng):
+    categories = [key for key, _ in ExternalLink.CATEGORY_CHOICES]
+    for n in range(count):
+        category = rng.choice(categories)
+        yield ExternalLink(
+            name=f'{rng.choice(ADJECTIVES)} {category.replace("_", " ").title()} {n}',
+            slug=f'{PREFIX}-link-{n}',
+            category=category,
+            url=f'https://example.com/{PREFIX}/{category}/{n}.pdf',
+            description=sentence(rng, 12),
+            is_active=rng.random() < 0.95,
+        )
+
+
+def build_restaurants(count, rng, menu_ids):
+    for n in range(count):
+        yield Restaurant(
+            name=f'{rng.choice(ADJECTIVES)} {rng.choice(CUISINES)} {n}',
+            slug=f'{PREFIX}-restaurant-{n}',
+            description=sentence(rng, 40),
+            menu_link_id=rng.choice(menu_ids) if menu_ids else None,
+            email=f'{PREFIX}-reservations{n}@example.com',
+            opening_hours=f'{rng.randint(6, 12)}:00 AM - {rng.randint(9, 11)}:00 PM',
+            location=f'Floor {rng.randint(1, 30)}',
+            order=n,
+            is_active=rng.random() < 0.9,
+        )
+
+
+def build_subscribers(count, rng, inactive):
+    for n in range(count):
+        active = rng.random() >= inactive
+        yield MailingListSubscriber(
+            email=f'{PREFIX}-{rng.choice(FIRST_NAMES)}.{rng.choice(LAST_NAMES)}{n}@{rng.choice(DOMAINS)}',
+            is_active=active,
+            ip_address=f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}'
+            if rng.random() < 0.7 else None,
+        )
+
+
+def build_users(count, rng, days):
+    # Hashing is deliberately slow; every synthetic account shares one hash
+    password = make_password(PASSWORD)
+    now = timezone.now()
+    for n in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        email = f'{PREFIX}-user{n}@{rng.choice(DOMAINS)}'
+        yield get_user_model()(
+            email=email,
+            username=email,
+            first_name=first.title(),
+            last_name=last.title(),
+            password=password,
+            newsletter_subscription=rng.random() < 0.3,
+            is_staff=rng.random() < 0.01,
+            date_joined=now - timedelta(seconds=rng.randint(0, days * 86400)),
+        )
+
+
+def generate_data(links=0, restaurants=0, subscribers=0, users=0, seed=0, batch_size=BATCH_SIZE, days=730,
+                  inactive=0.1, progress=None):
+    """Insert the requested numbers of synthetic rows; returns ``{model: (rows, seconds)}``"""
+    results = {}
+
+    def run(name, model, objects, after_batch=None):
+        started = time.perf_counter()
+        rows = insert(model, objects, batch_size, after_batch)
+        results[name] = (rows, time.perf_counter() - started)
+        if progress is not None:
+            progress(name, *results[name])
+
+    if links:
+        run('links', ExternalLink, build_links(links, random.Random(f'{seed}:links')))
+    if restaurants:
+        menu_ids = list(ExternalLink.objects.filter(category='restaurant').values_list('pk', flat=True))
+        run('restaurants', Restaurant, build_restaurants(restaurants, random.Random(f'{seed}:restaurants'), menu_ids))
+    if subscribers:
+        # subscribed_at is auto_now_add, so bulk_create stamps every row with
+        # "now"; spread the batches over the last ``days`` days afterwards
+        batches = -(-subscribers // batch_size)
+        now = timezone.now()
+
+        def backdate(number, created):
+            subscribed_at = now - timedelta(days=days) * (1 - number / batches)
+            rows = MailingListSubscriber.objects.filter(
+                pk__range=(created[0].pk, created[-1].pk), email__startswith=f'{PREFIX}-',
+            )
+            rows.update(subscribed_at=subscribed_at)
+            rows.filter(is_active=False).update(
+                unsubscribed_at=subscribed_at + min(timedelta(days=30), (now - subscribed_at) / 2),
+            )
+
+        run('subscribers', MailingListSubscriber,
+            build_subscribers(subscribers, random.Random(f'{seed}:subscribers'), inactive), backdate)
+    if users:
+        run('users', get_user_model(), build_users(users, random.Random(f'{seed}:users'), days))
+
+    if links or restaurants:
+        # bulk_create sends no post_save, so announce the new content ourselves
+        bump_content_version()
+        purge_pages()
+    return results
+
+
+def synthetic_querysets():
+    # Restaurants before the links their menus point at
+    return {
+        'restaurants': Restaurant.objects.filter(slug__startswith=f'{PREFIX}-'),
+        'links': ExternalLink.objects.filter(slug__startswith=f'{PREFIX}-'),
+        'subscribers': MailingListSubscriber.objects.filter(email__startswith=f'{PREFIX}-'),
+        'users': get_user_model().objects.filter(email__startswith=f'{PREFIX}-'),
+    }
+
+
+def clear_synthetic(batch_size=BATCH_SIZE):
+    """Delete every generated row in batches; returns ``{model: rows deleted}``"""
+    deleted = {}
+    for name, queryset in synthetic_querysets().items():
+        deleted[name], last_pk = 0, 0
+        # Walk forward by primary key so each batch does not rescan deleted ground
+        while pks := list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]):
+            with transaction.atomic():
+                queryset.model.objects.filter(pk__in=pks).delete()
+            deleted[name] += len(pks)
+            last_pk = pks[-1]
+    if deleted['links'] or deleted['restaurants']:
+        bump_content_version()
+        purge_pages()
+    return deleted
@@ -0,0 +1,28 @@
+from django.apps import apps
+from django.core.management import call_command
+from jobs.queue import task
+
+from .campaigns import send_campaign
+from .images import process_image_field
+from .models import Campaign
+
+
+@task(queue='images', max_attempts=5)
+def process_image(model_label, pk, field_name):
+    """Build the responsive variants of an uploaded image"""
+    process_image_field(apps.get_model(model_label), pk, field_name)
+
+
+@task
+def generate_qr(url, output=None, scale=10):
+    """Write the SVG QR code for ``url``"""
+    call_command('generate_qr', url=url, output=output, scale=scale)
+
+
+@task(queue='campaigns')
+def send_campaign_job(campaign_id):
+    """Send a newsletter campaign; a retried job resumes where the last attempt stopped"""
+    result = send_campaign(Campaign.objects.get(pk=campaign_id))
+    if result.deferred:
+        # Fail the attempt so the job is retried (with backoff) for the released addresses
+        raise RuntimeError(f'Campaign {campaign_id}: {result}')
@@ -0,0 +1,36 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from welcomeletter.assets import CRITICAL_SOURCE, get_assets
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def bundle(source):
+    """URL of the minified, content-hashed build of a static file (the file itself until build_assets has run)"""
+    return static(get_assets().bundle(source))
+
+
+@register.simple_tag(takes_context=True)
+def page_css(context):
+    """
+    Inline this page's critical CSS and load the full stylesheet without blocking rendering.
+
+    Pages without critical CSS (or before build_assets has run) link the stylesheet as usual.
+    """
+    assets = get_assets()
+    href = static(assets.bundle(CRITICAL_SOURCE))
+    match = getattr(context.get('request'), 'resolver_match', None)
+    critical = assets.critical_css(getattr(match, 'url_name', None))
+    if critical is None:
+        return format_html('<link rel="stylesheet" href="{}">', href)
+    return format_html(
+        '<style>{}</style>\n'
+        '    <link rel="preload" href="{}" as="style" onload="this.onload=null;this.rel=\'stylesheet\'">\n'
+        '    <noscript><link rel="stylesheet" href="{}"></noscript>',
+        mark_safe(critical.replace('</', '<\\/')), href, href,
+    )
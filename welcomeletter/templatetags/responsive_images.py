@@ -0,0 +1,101 @@
+from django import template
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.storage import default_storage
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from welcomeletter.storage import MIME_TYPES, PREFERRED
+
+
+register = template.Library()
+
+DEFAULT_SIZES = '(min-width: 992px) 380px, (min-width: 768px) 50vw, 100vw'
+
+
+def _srcset(items):
+    return ', '.join(f"{default_storage.url(item['name'])} {item['width']}w" for item in items)
+
+
+@register.simple_tag
+def responsive_image(field_file, alt='', sizes=DEFAULT_SIZES, loading='lazy'):
+    """
+    Render an uploaded image with WebP/JPEG srcsets and a blurred placeholder.
+
+    Falls back to a plain lazy <img> until the derivatives have been generated.
+    """
+    if not field_file:
+        return ''
+    variants = getattr(field_file.instance, f'{field_file.field.name}_variants', None) or {}
+    if variants.get('source') != field_file.name:
+        return format_html('<img src="{}" alt="{}" loading="{}" decoding="async">', field_file.url, alt, loading)
+
+    jpegs = variants['sources']['jpg']
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="{}" decoding="async"'
+        ' style="background: url({}) center / cover no-repeat;">'
+        '</picture>',
+        _srcset(variants['sources']['webp']), sizes,
+        default_storage.url(jpegs[-1]['name']), _srcset(jpegs), sizes,
+        variants['width'], variants['height'], alt, loading,
+        variants['placeholder'],
+    )
+
+
+def _static_variants(name):
+    """Variants collected for a static image by OptimizedStaticFilesStorage, or None"""
+    image_variants = getattr(staticfiles_storage, 'image_variants', None)
+    return image_variants(name) if image_variants is not None else None
+
+
+def _static_srcset(items):
+    return ', '.join(f"{static(item['name'])} {item['width']}w" for item in items)
+
+
+@register.simple_tag
+def static_image(name, alt='', sizes='100vw', loading='lazy', css_class=''):
+    """
+    Render a static image as a <picture> of its AVIF, WebP and original-format variants.
+
+    The browser takes the first format it supports and the smallest width that fills
+    ``sizes``. Falls back to a plain <img> when collectstatic has not made variants.
+    """
+    variants = _static_variants(name)
+    if not variants:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">', static(name), alt, css_class, loading,
+        )
+
+    fallback = variants['sources'][variants['fallback']]
+    sources = format_html_join('', '<source type="{}" srcset="{}" sizes="{}">', (
+        (MIME_TYPES[fmt], _static_srcset(variants['sources'][fmt]), sizes)
+        for fmt in PREFERRED if fmt != variants['fallback'] and fmt in variants['sources']
+    ))
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}"'
+        ' loading="{}" decoding="async"></picture>',
+        sources, static(fallback[-1]['name']), _static_srcset(fallback), sizes,
+        variants['width'], variants['height'], alt, css_class, loading,
+    )
+
+
+@register.simple_tag
+def static_image_set(name, width=1920):
+    """
+    CSS ``image-set()`` of a static image's variants for ``background-image``.
+
+    Lists the largest variant up to ``width`` pixels of each format, best first,
+    after a plain ``url()`` for browsers without ``image-set`` type support.
+    """
+    variants = _static_variants(name)
+    url = format_html("url('{}')", static(name))
+    if not variants:
+        return url
+    candidates = []
+    for fmt in (*PREFERRED, variants['fallback']):
+        items = [item for item in variants['sources'].get(fmt, []) if item['width'] <= width]
+        if items and fmt not in [c[0] for c in candidates]:
+            candidates.append((fmt, static(items[-1]['name'])))
+    image_set = format_html_join(', ', "url('{}') type('{}')", ((href, MIME_TYPES[fmt]) for fmt, href in candidates))
+    return format_html('{}; background-image: image-set({})', url, image_set)
@@ -1,3 +1,1605 @@
-from django.test import TestCase
+import gzip
+import json
+import multiprocessing
+import posixpath
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.mail.backends.locmem import EmailBackend as LocMemEmailBackend
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.template import Context, Template
+from django.template.loader import render_to_string
+
+from django.db import connections
+from django.test import (
+    AsyncClient, Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from jobs.models import Job
+from jobs.worker import claim_job, run_job
+
+from . import assets, async_views, compression, fonts, views
+from .buffer import SubscriptionBuffer, get_buffer
+from .campaigns import CampaignInProgress, RateLimiter, send_campaign
+from .content import clear_snapshot, get_snapshot
+from .exports import export_response
+from .imports import import_subscribers
+from .images import process_image_field
+from .metrics import BUCKETS, Metrics, RequestTiming, close_metrics, get_metrics, render_prometheus
+from .models import (
+    ExternalLink, Restaurant, TransferOption, MailingListSubscriber, SiteSettings, ContentVersion, Campaign,
+    CampaignDelivery, QRScanDaily,
+)
+from .pagecache import get_page_cache, page_cache_key
+from .qr import generate_codes, read_manifest, write_sheets
+from .querylog import QueryBudgetMixin, QueryLog, normalize_sql
+from .synthetic import clear_synthetic, generate_data
+from .tasks import send_campaign_job
+from .urls import view_patterns
+from .scans import OTHER_SOURCE, ScanCounter, close_counter, get_counter, write_counts
+from .views import home, qr_redirect
+from .versioning import DatabaseVersionBackend, FileVersionBackend, VersionTracker, bump_content_version, reset_tracker
+
+
+PUBLIC_URL_NAMES = [
+    'home', 'transfers', 'info', 'restaurants', 'kids', 'spa', 'board_menus', 'hilton_honors',
+]
+
+
+class ContentFixtureMixin:
+    """Seed a small but complete set of public content"""
+
+    @classmethod
+    def setUpTestData(cls):
+        SiteSettings.get_settings()
+        cls.menu = ExternalLink.objects.create(
+            name='Villa Verona Menu', slug='villa-verona-menu', category='restaurant',
+            url='https://example.com/villa.pdf',
+        )
+        ExternalLink.objects.create(
+            name='In-Room Dining Menu', slug='room-dining-menu', category='room_dining',
+            url='https://example.com/ird.pdf',
+        )
+        ExternalLink.objects.create(
+            name='Spa Menu', slug='spa-menu', category='other', url='https://example.com/spa.pdf',
+        )
+        for order in range(3):
+            Restaurant.objects.create(
+                name=f'Restaurant {order}', slug=f'restaurant-{order}', description='Food',
+                menu_link=cls.menu, order=order,
+            )
+        TransferOption.objects.create(name='Sedan', price_to_hotel=235, order=1)
+
+    def setUp(self):
+        # The test database is rolled back, so forget versions seen by earlier tests
+        reset_tracker()
+        clear_snapshot()
+        get_page_cache().clear()
+
+
+class ContentSnapshotTests(ContentFixtureMixin, TestCase):
+
+    def test_snapshot_indexes_links(self):
+        snapshot = get_snapshot()
+        self.assertEqual(snapshot.links_by_slug['spa-menu'].name, 'Spa Menu')
+        self.assertEqual(snapshot.first_link('room_dining').slug, 'room-dining-menu')
+        self.assertIsNone(snapshot.first_link('info'))
+        self.assertEqual(len(snapshot.restaurants), 3)
+
+    def test_snapshot_is_reused_without_queries(self):
+        get_snapshot()
+        with self.assertNumQueries(0):
+            snapshot = get_snapshot()
+            # menu_link is loaded with the restaurants
+            [restaurant.menu_link.url for restaurant in snapshot.restaurants]
+
+    def test_snapshot_rebuilt_after_content_change(self):
+        first = get_snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            TransferOption.objects.create(name='Tesla Model 3', order=2)
+        second = get_snapshot()
+        self.assertIsNot(first, second)
+        self.assertEqual(len(second.transfer_options), 2)
+
+    @override_settings(CONTENT_VERSION_POLL_INTERVAL=60)
+    def test_public_pages_hit_no_queries_once_warm(self):
+        for name in PUBLIC_URL_NAMES:
+            self.client.get(reverse(name))
+        for name in PUBLIC_URL_NAMES:
+            with self.subTest(page=name), self.assertNumQueries(0):
+                response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+
+
+class PageCacheTestsMixin(ContentFixtureMixin):
+
+    def test_second_request_served_from_cache(self):
+        first = self.client.get(reverse('restaurants'))
+        self.assertTemplateUsed(first, 'restaurants.html')
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('restaurants'))
+        self.assertEqual(second.templates, [])
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], first['Content-Type'])
+
+    def test_pages_cached_per_url(self):
+        home = self.client.get(reverse('home'))
+        spa = self.client.get(reverse('spa'))
+        self.assertNotEqual(home.content, spa.content)
+        self.assertContains(self.client.get(reverse('spa')), 'https://example.com/spa.pdf')
+
+    def test_gzip_variant_for_clients_that_accept_it(self):
+        plain = self.client.get(reverse('home'))
+        compressed = self.client.get(reverse('home'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+    def test_content_change_purges_cached_pages(self):
+        request = RequestFactory().get(reverse('transfers'))
+        self.client.get(reverse('transfers'))
+        key = page_cache_key(request)
+        self.assertIsNotNone(get_page_cache().get(key))
+        with self.captureOnCommitCallbacks(execute=True):
+            TransferOption.objects.create(name='Tesla Model 3', order=2)
+        self.assertIsNone(get_page_cache().get(key))
+        self.assertNotEqual(page_cache_key(request), key)
+        response = self.client.get(reverse('transfers'))
+        self.assertTemplateUsed(response, 'transfers.html')
+        self.assertContains(response, 'Tesla Model 3')
+
+    def test_query_string_does_not_change_the_key(self):
+        first = self.client.get(reverse('restaurants'), {'utm_source': 'qr'})
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('restaurants'), {'fbclid': 'abc123'})
+        self.assertEqual(second.templates, [])
+        self.assertEqual(second.content, first.content)
+
+    def test_pages_do_not_set_cookies(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.cookies, {})
+
+
+@override_settings(
+    PAGE_CACHE_ALIAS='pages',
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-pages'},
+    },
+)
+class LocMemPageCacheTests(PageCacheTestsMixin, TestCase):
+    pass
+
+
+_page_cache_dir = tempfile.mkdtemp()
+
+
+@override_settings(
+    PAGE_CACHE_ALIAS='pages',
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'pages': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': _page_cache_dir},
+    },
+)
+class FileBasedPageCacheTests(PageCacheTestsMixin, TestCase):
+    pass
+
+
+class CookieFreePagesTests(ContentFixtureMixin, TestCase):
+
+    def test_public_pages_are_shareable(self):
+        for name in PUBLIC_URL_NAMES:
+            with self.subTest(page=name):
+                # Run twice to cover both the rendered and the cached response
+                for _ in range(2):
+                    response = self.client.get(reverse(name))
+                    self.assertEqual(response.cookies, {})
+                    self.assertNotIn('Cookie', response.get('Vary', ''))
+                    self.assertIn('public', response['Cache-Control'])
+                    self.assertNotContains(response, 'csrfmiddlewaretoken')
+
+    def test_token_endpoint_hands_out_csrf_cookie(self):
+        client = Client(enforce_csrf_checks=True)
+        response = client.get(reverse('newsletter_token'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('csrftoken', response.cookies)
+        token = response.json()['csrfToken']
+
+        response = client.post(
+            reverse('subscribe_newsletter'), {'email': 'Guest@Example.com'},
+            HTTP_X_CSRFTOKEN=token, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.json(), {
+            'success': True, 'message': 'Thank you for subscribing to our mailing list!',
+        })
+        self.assertTrue(MailingListSubscriber.objects.filter(email='guest@example.com').exists())
+
+    def test_subscribe_without_token_is_rejected(self):
+        client = Client(enforce_csrf_checks=True)
+        response = client.post(reverse('subscribe_newsletter'), {'email': 'guest@example.com'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_subscribe_answers_json_without_flash_messages(self):
+        response = self.client.post(reverse('subscribe_newsletter'), {'email': 'not-an-email'})
+        self.assertEqual(response.json(), {'success': False, 'message': 'Please enter a valid email address.'})
+        self.assertEqual(response.templates, [])
+        self.assertNotIn('messages', response.cookies)
+
+
+
+class RequestMetricsTests(ContentFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        close_metrics()
+        self.addCleanup(close_metrics)
+
+    def test_staff_see_server_timing(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin@example.com', 'secret'))
+        first, second = self.client.get(reverse('home')), self.client.get(reverse('home'))
+        self.assertRegex(first['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+')
+        self.assertIn('cache;desc=miss', first['Server-Timing'])
+        self.assertIn('cache;desc=hit', second['Server-Timing'])
+        self.assertIn('tpl;dur=0.0', second['Server-Timing'])
+
+    def test_guests_get_no_header_and_no_vary_cookie(self):
+        response = self.client.get(reverse('home'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        with override_settings(SERVER_TIMING='all'):
+            self.assertIn('Server-Timing', self.client.get(reverse('spa')))
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('hilton_request_duration_seconds_bucket{view="home",le="+Inf"} 2\n', body)
+        self.assertIn('hilton_page_cache_total{view="home",result="hit"} 1\n', body)
+        self.assertIn('hilton_requests_total{view="home",status="200"} 2\n', body)
+
+    @override_settings(METRICS_TOKEN='scrape-me', SUBSCRIBE_BUFFER_SIZE=100, SUBSCRIBE_BUFFER_MAX_DELAY=60)
+    def test_subscription_buffer_is_exported(self):
+        buffer = get_buffer()
+        buffer.add('a@example.com')
+        buffer.add('b@example.com')
+        buffer.flush()
+        buffer.add('c@example.com')
+        body = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-me').content.decode()
+        self.assertIn('# TYPE hilton_subscribe_buffer_depth gauge\nhilton_subscribe_buffer_depth 1\n', body)
+        self.assertIn('hilton_subscribe_buffer_flushed_total 2\n', body)
+        self.assertIn('# TYPE hilton_subscribe_buffer_flush_seconds summary\n', body)
+        self.assertIn('hilton_subscribe_buffer_flush_seconds_count 1\n', body)
+        self.assertRegex(body, r'hilton_subscribe_buffer_flush_seconds_sum [\d.e-]+\n')
+
+    def test_workers_are_added_up(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        other = Metrics(directory=tmp.name)
+        timing = RequestTiming()
+        timing.total = 0.02
+        other.observe('home', 200, timing)
+        other._pid = 1  # as if written by another worker
+        other.write()
+        other.close()
+
+        with override_settings(METRICS_DIR=tmp.name):
+            timing.total = 3.0
+            get_metrics().observe('home', 200, timing)
+            counters, histograms = get_metrics().collect()
+        self.assertEqual(counters[('requests_total', (('view', 'home'), ('status', '200')))], 2)
+        self.assertEqual(sum(histograms['home'][:-1]), 2)
+        self.assertAlmostEqual(histograms['home'][-1], 3.02)
+
+    def test_histogram_buckets_are_cumulative(self):
+        values = [0] * (len(BUCKETS) + 1) + [0.0]
+        values[BUCKETS.index(0.025)] = 2
+        values[-2] = 1
+        text = render_prometheus(({}, {'spa': values}))
+        self.assertIn('hilton_request_duration_seconds_bucket{view="spa",le="0.01"} 0\n', text)
+        self.assertIn('hilton_request_duration_seconds_bucket{view="spa",le="0.025"} 2\n', text)
+        self.assertIn('hilton_request_duration_seconds_bucket{view="spa",le="10.0"} 2\n', text)
+        self.assertIn('hilton_request_duration_seconds_count{view="spa"} 3\n', text)
+
+
+class ViewsURLConf:
+    """Root URLconf serving the public pages from ``views`` or ``async_views``"""
+
+    def __init__(self, module):
+        self.urlpatterns = view_patterns(module)
+
+
+class QueryBudgetTests(QueryBudgetMixin, ContentFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        close_counter()
+        self.addCleanup(close_counter)
+
+    def request(self, pattern, staff):
+        """The most expensive request each view answers on cold caches, as a callable"""
+        name = pattern.name
+        get, post = self.client.get, self.client.post
+        if isinstance(self.client, AsyncClient):
+            get, post = async_to_sync(get), async_to_sync(post)
+        if name == 'subscribe_newsletter':
+            return lambda: post(reverse(name), {'email': 'guest@example.com'})
+        if name == 'metrics':
+            self.client.force_login(staff)
+        elif name == 'qr_redirect':
+            return lambda: get(reverse(name, kwargs=dict.fromkeys(pattern.pattern.converters, 'room-1204')))
+        return lambda: get(reverse(name))
+
+    def test_every_view_stays_within_its_budget(self):
+        staff = get_user_model().objects.create_user('staff@example.com', 'secret', is_staff=True)
+        # Each set of views served the way it is deployed
+        for module, client_class in ((views, Client), (async_views, AsyncClient)):
+            with override_settings(ROOT_URLCONF=ViewsURLConf(module)):
+                for pattern in view_patterns(module):
+                    view = pattern.callback
+                    with self.subTest(views=module.__name__, view=pattern.name):
+                        self.assertTrue(hasattr(view, 'query_budget'), f'{view.__name__} has no @query_budget')
+                        self.setUp()
+                        self.client = client_class()
+                        send = self.request(pattern, staff)
+                        with self.assertQueryBudget(view.query_budget):
+                            response = send()
+                        self.assertLess(response.status_code, 400)
+
+    def test_repeated_queries_point_at_the_template_line(self):
+        # Without select_related('menu_link') every card loads its menu link
+        restaurants = Restaurant.objects.order_by('order')
+        with QueryLog().record() as log:
+            render_to_string('restaurants.html', {'restaurants': restaurants, 'settings': SiteSettings.get_settings()})
+        (count, sql, site), = log.repeated()
+        self.assertEqual(count, 3)
+        self.assertTrue(site.startswith('restaurants.html:'), site)
+        self.assertIn('FROM "welcomeletter_externallink"', sql)
+        with self.assertRaisesMessage(AssertionError, f'3x {site}'):
+            with self.assertQueryBudget(10):
+                render_to_string('restaurants.html', {'restaurants': restaurants.all()})
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql('SELECT "t1"."id" FROM "t1"  WHERE "id" IN (%s, %s, %s) AND name = \'x\' LIMIT 21'),
+            'SELECT "t1"."id" FROM "t1" WHERE "id" IN (...) AND name = ? LIMIT ?',
+        )
+
+    @override_settings(QUERY_LOG=True)
+    def test_middleware_warns_about_views_over_budget(self):
+        with self.assertLogs('welcomeletter.querylog', 'WARNING') as logs, mock.patch.object(home, 'query_budget', 1):
+            self.client.get(reverse('home'))
+        self.assertIn('GET /: 6 queries (budget 1)', logs.output[0])
+
+
+@override_settings(ROOT_URLCONF=ViewsURLConf(async_views))
+class AsyncViewTests(ContentFixtureMixin, TestCase):
+
+    async def test_pages_match_the_sync_views(self):
+        for name in PUBLIC_URL_NAMES:
+            with self.subTest(page=name):
+                response = await self.async_client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+                with override_settings(ROOT_URLCONF=ViewsURLConf(views)):
+                    expected = await sync_to_async(self.client.get)(reverse(name))
+                self.assertEqual(response.content, expected.content)
+
+    def test_cache_hits_and_revalidation_skip_the_database(self):
+        get = async_to_sync(self.async_client.get)
+        first = get(reverse('restaurants'))
+        self.assertContains(first, 'Restaurant 2')
+        with self.assertNumQueries(0):
+            second = get(reverse('restaurants'))
+            revalidated = get(reverse('restaurants'), headers={'If-None-Match': first['ETag']})
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(revalidated.status_code, 304)
+
+    async def test_content_change_is_picked_up(self):
+        await self.async_client.get(reverse('transfers'))
+        await sync_to_async(bump_content_version)()
+        await TransferOption.objects.acreate(name='Limousine', order=3)
+        self.assertContains(await self.async_client.get(reverse('transfers')), 'Limousine')
+
+    async def test_subscribe(self):
+        url = reverse('subscribe_newsletter')
+        headers = {'X-Requested-With': 'XMLHttpRequest'}
+        first = await self.async_client.post(url, {'email': 'Guest@Example.com'}, headers=headers)
+        again = await self.async_client.post(url, {'email': 'guest@example.com'}, headers=headers)
+        self.assertEqual(first.json(), {'success': True, 'message': 'Thank you for subscribing to our mailing list!'})
+        self.assertEqual(again.json()['message'], 'You are already subscribed to our mailing list!')
+        self.assertTrue(await MailingListSubscriber.objects.filter(email='guest@example.com', is_active=True).aexists())
+        invalid = await self.async_client.post(url, {'email': 'nope'})
+        self.assertEqual(invalid.json(), {'success': False, 'message': 'Please enter a valid email address.'})
+
+    @override_settings(SERVER_TIMING='all')
+    async def test_server_timing_counts_async_queries(self):
+        response = await self.async_client.get(reverse('home'))
+        self.assertIn('desc="6 queries"', response['Server-Timing'])
+
+
+class ConditionalGetTests(ContentFixtureMixin, TestCase):
+
+    def test_etag_revalidation_returns_304_without_rendering(self):
+        response = self.client.get(reverse('restaurants'))
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('restaurants'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.templates, [])
+        self.assertEqual(response['ETag'], etag)
+
+    def test_if_modified_since_returns_304(self):
+        response = self.client.get(reverse('home'))
+        response = self.client.get(reverse('home'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_content_change_changes_validators(self):
+        etag = self.client.get(reverse('transfers'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            TransferOption.objects.create(name='Tesla Model 3', order=2)
+        response = self.client.get(reverse('transfers'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_encoding(self):
+        plain = self.client.get(reverse('home'))
+        compressed = self.client.get(reverse('home'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotEqual(plain['ETag'], compressed['ETag'])
+        response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=plain['ETag'], HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+
+
+class CompressionTests(ContentFixtureMixin, TestCase):
+
+    def decode(self, response):
+        encoding = response.get('Content-Encoding')
+        if encoding == 'br':
+            return compression.brotli.decompress(response.content)
+        if encoding == 'gzip':
+            return gzip.decompress(response.content)
+        return response.content
+
+    def test_accept_encoding_matrix(self):
+        best = 'br' if compression.brotli is not None else 'gzip'
+        matrix = [
+            ('', None),
+            ('identity', None),
+            ('deflate', None),
+            ('gzip', 'gzip'),
+            ('br', 'br' if best == 'br' else None),
+            ('gzip, deflate, br', best),
+            ('br;q=0, gzip', 'gzip'),
+            ('br;q=0.5, gzip', 'gzip'),
+            ('*', best),
+            ('*;q=0', None),
+        ]
+        plain = self.client.get(reverse('home'))
+        etags = {}
+        for header, expected in matrix:
+            with self.subTest(accept_encoding=header):
+                response = self.client.get(reverse('home'), HTTP_ACCEPT_ENCODING=header)
+                self.assertEqual(response.get('Content-Encoding'), expected)
+                self.assertIn('Accept-Encoding', response['Vary'])
+                self.assertEqual(self.decode(response), plain.content)
+                self.assertEqual(int(response['Content-Length']), len(response.content))
+                etags.setdefault(expected, set()).add(response['ETag'])
+        # One validator per representation
+        self.assertTrue(all(len(values) == 1 for values in etags.values()))
+        self.assertEqual(len(set.union(*etags.values())), len(etags))
+
+    def test_pages_compressed_once_per_content_version(self):
+        with mock.patch('welcomeletter.pagecache.compress', wraps=compression.compress) as compress:
+            for header in ('gzip', 'br', '', 'gzip, br'):
+                self.client.get(reverse('restaurants'), HTTP_ACCEPT_ENCODING=header)
+            self.assertEqual(compress.call_count, len(compression.available_encodings()))
+            with self.captureOnCommitCallbacks(execute=True):
+                TransferOption.objects.create(name='Tesla Model 3', order=2)
+            self.client.get(reverse('restaurants'), HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(compress.call_count, 2 * len(compression.available_encodings()))
+
+    def test_cached_pages_are_minified(self):
+        response = self.client.get(reverse('home'))
+        self.assertNotIn(b'\n\n', response.content)
+        with override_settings(HTML_MINIFY=False):
+            get_page_cache().clear()
+            self.assertGreater(len(self.client.get(reverse('home')).content), len(response.content))
+
+    def test_private_responses_only_get_padded_gzip(self):
+        # The admin login form carries a CSRF token
+        responses = [self.client.get(reverse('admin:login'), HTTP_ACCEPT_ENCODING='br, gzip') for _ in range(2)]
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertEqual(responses[0]['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', responses[0]['Vary'])
+        self.assertIn(b'csrfmiddlewaretoken', self.decode(responses[0]))
+        # Random padding against BREACH
+        self.assertNotEqual(responses[0].content, responses[1].content)
+
+    def test_minify_html(self):
+        html = (
+            '<!DOCTYPE html>\n<html>\n  <!-- note -->\n  <body class="a  b">\n'
+            '    <p>Hello\n\n      world</p>   <span>x</span>\n'
+            '    <pre>  keep\n    this </pre>\n'
+            '    <textarea name="t">  a\n  b</textarea>\n'
+            '    <script>if (a  <  b) { x(); }  // <!-- no -->\n</script>\n'
+            '    <!--[if IE]><p>old</p><![endif]-->\n'
+            '  </body>\n</html>\n'
+        )
+        self.assertEqual(
+            compression.minify_html(html.encode()).decode(),
+            '<!DOCTYPE html>\n<html>\n<body class="a  b">\n'
+            '<p>Hello\nworld</p> <span>x</span>\n'
+            '<pre>  keep\n    this </pre>\n'
+            '<textarea name="t">  a\n  b</textarea>\n'
+            '<script>if (a  <  b) { x(); }  // <!-- no -->\n</script>\n'
+            '<!--[if IE]><p>old</p><![endif]-->\n'
+            '</body>\n</html>',
+        )
+
+    def test_brotli_quality_is_moderate_on_the_request_path(self):
+        if compression.brotli is None:
+            self.skipTest('brotli is not installed')
+        with mock.patch.object(compression.brotli, 'compress', wraps=compression.brotli.compress) as compress:
+            self.client.get(reverse('home'), HTTP_ACCEPT_ENCODING='br')
+        self.assertTrue(compress.call_args_list)
+        for call in compress.call_args_list:
+            self.assertLessEqual(call.kwargs['quality'], 6)
+
+    def test_negotiate(self):
+        self.assertEqual(compression.negotiate('gzip;q=1, br;q=0.8', ('br', 'gzip')), 'gzip')
+        self.assertEqual(compression.negotiate('GZIP', ('br', 'gzip')), 'gzip')
+        self.assertEqual(compression.negotiate('gzip;q=0', ('br', 'gzip')), 'identity')
+        self.assertEqual(compression.negotiate('br', ('gzip',)), 'identity')
+
+
+class ExportStaticSiteTests(ContentFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.output = Path(tmp.name)
+
+    def export(self):
+        out = StringIO()
+        call_command('export_static_site', output=str(self.output), host='localhost', stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_exports_every_public_page(self):
+        self.export()
+        for name in PUBLIC_URL_NAMES:
+            page = self.output / reverse(name).lstrip('/') / 'index.html'
+            self.assertTrue(page.exists(), page)
+            self.assertEqual(gzip.decompress(page.with_name('index.html.gz').read_bytes()), page.read_bytes())
+        self.assertFalse((self.output / 'subscribe').exists())
+        manifest = json.loads((self.output / '.export-manifest.json').read_text())
+        self.assertTrue(any(name.endswith('base.html') for name in manifest['pages']['/']['templates']))
+
+    def test_only_changed_pages_are_rebuilt(self):
+        self.export()
+        self.assertIn('0 page(s), 8 unchanged', self.export())
+        with self.captureOnCommitCallbacks(execute=True):
+            TransferOption.objects.create(name='Tesla Model 3', order=2)
+        self.assertIn('8 page(s), 0 unchanged', self.export())
+        self.assertIn('Tesla Model 3', (self.output / 'transfers' / 'index.html').read_text())
+
+    def test_asset_build_and_minify_setting_rebuild_the_pages(self):
+        self.export()
+        with override_settings(HTML_MINIFY=not getattr(settings, 'HTML_MINIFY', True)):
+            self.assertIn('8 page(s), 0 unchanged', self.export())
+        self.assertIn('8 page(s), 0 unchanged', self.export())
+        rebuilt = mock.Mock(build_id='rebuilt0')
+        with mock.patch('welcomeletter.management.commands.export_static_site.get_assets', return_value=rebuilt):
+            self.assertIn('8 page(s), 0 unchanged', self.export())
+
+    @override_settings(ROOT_URLCONF=ViewsURLConf(async_views))
+    def test_exports_async_views(self):
+        self.assertIn('8 page(s), 0 unchanged', self.export())
+        self.assertIn('Ramses Hilton', (self.output / 'index.html').read_text())
+
+
+class AssetBuildTests(ContentFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.static = Path(tmp.name)
+        for source in assets.BUNDLES:
+            (self.static / source).parent.mkdir(parents=True, exist_ok=True)
+            (self.static / source).write_bytes((assets.static_dir() / source).read_bytes())
+        # Plain storage, in case collectstatic has written a manifest locally
+        override = override_settings(STATICFILES_DIRS=[tmp.name], STORAGES={
+            **settings.STORAGES, 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_minify_css(self):
+        css = '/* note */\n.a > .b ,\n.c {\n    content: "/* kept */";\n    margin: 0 auto;\n}\n'
+        self.assertEqual(assets.minify_css(css), '.a>.b,.c{content:"/* kept */";margin:0 auto}')
+
+    def test_minify_js_keeps_strings_and_regular_expressions(self):
+        script = (
+            'function f(a) {\n    // comment\n    const url = "http://example.com"; /* block */\n\n'
+            '    const pattern = /^[^/]+\\/\\/$/;\n    return `line one\n    line two` + a / 2;\n}\n'
+        )
+        self.assertEqual(assets.minify_js(script), (
+            'function f(a) {\nconst url = "http://example.com";\nconst pattern = /^[^/]+\\/\\/$/;\n'
+            'return `line one\n    line two` + a / 2;\n}\n'
+        ))
+
+    def test_critical_css_keeps_rules_of_the_first_screen(self):
+        rules = assets.parse_css(assets.minify_css(
+            ':root{--c:red}.hero h1,.footer h1{color:var(--c)}.hero:hover{color:blue}'
+            '@media (min-width:768px){.hero{padding:2rem}.footer{padding:1rem}}'
+            '.hero{animation:fadeIn 1s}@keyframes fadeIn{from{opacity:0}to{opacity:1}}@keyframes unused{}'
+        ))
+        fold = assets.FoldParser(sections=1)
+        fold.feed('<body><section class="hero"><h1>Hi</h1></section><footer class="footer"></footer></body>')
+        self.assertEqual(
+            assets.critical_css(rules, fold.tags, fold.classes, fold.ids),
+            ':root{--c:red}.hero h1{color:var(--c)}@media (min-width:768px){.hero{padding:2rem}}'
+            '.hero{animation:fadeIn 1s}@keyframes fadeIn{from{opacity:0}to{opacity:1}}',
+        )
+
+    def test_pages_inline_critical_css(self):
+        manifest = assets.build_assets()
+        css_bundle = manifest['bundles']['css/main.css']['name']
+        self.assertRegex(css_bundle, r'^dist/main\.[0-9a-f]{8}\.css$')
+        self.assertTrue((self.static / css_bundle).exists())
+        self.assertEqual(set(manifest['critical']), set(PUBLIC_URL_NAMES))
+        self.assertIn('.header{', manifest['critical']['home'])
+        self.assertNotIn('.footer-bottom', manifest['critical']['home'])
+
+        html = self.client.get(reverse('home')).content.decode()
+        head = html.split('</head>')[0]
+        self.assertIn('<style>', head)
+        self.assertIn("url('fonts/woff2/", manifest['critical']['home'])
+        self.assertIn("url('/static/fonts/woff2/", head)
+        self.assertIn(f'<link rel="preload" href="/static/{css_bundle}" as="style"', head)
+        self.assertNotIn('rel="stylesheet" href="/static/', head.split('<noscript>')[0])
+        self.assertIn(f'src="/static/{manifest["bundles"]["js/main.js"]["name"]}"', html)
+        self.assertLess(assets.first_render_bytes(html), 10 * 1024)
+
+        # Pages without critical CSS link the bundle as a stylesheet
+        html = Template('{% load assets %}{% page_css %}').render(Context())
+        self.assertIn(f'<link rel="stylesheet" href="/static/{css_bundle}">', html)
+
+    def test_critical_css_urls_resolve_through_the_storage(self):
+        css = assets.static_paths("@font-face{src:url('../fonts/a.woff2')}.x{background:url(data:x)}", 'css/main.css')
+        self.assertEqual(css, "@font-face{src:url('fonts/a.woff2')}.x{background:url(data:x)}")
+        with mock.patch.object(assets.staticfiles_storage, 'url', side_effect=lambda path: f'/static/{path}?h=1'):
+            self.assertEqual(
+                assets.static_urls(css), "@font-face{src:url('/static/fonts/a.woff2?h=1')}.x{background:url(data:x)}",
+            )
+
+    def test_stale_build_falls_back_to_sources(self):
+        assets.build_assets(pages=False)
+        with open(self.static / 'css' / 'main.css', 'a') as f:
+            f.write('.new { color: red; }\n')
+        assets.reset_assets()
+        with self.assertLogs('welcomeletter.assets', 'WARNING'):
+            self.assertEqual(assets.get_assets().bundle('css/main.css'), 'css/main.css')
+        self.assertRegex(assets.get_assets().bundle('js/main.js'), r'^dist/main\.[0-9a-f]{8}\.js$')
+
+    def test_rebuild_removes_superseded_bundles(self):
+        first = assets.build_assets(pages=False)['bundles']['js/main.js']['name']
+        with open(self.static / 'js' / 'main.js', 'a') as f:
+            f.write('console.log("new");\n')
+        second = assets.build_assets(pages=False)['bundles']['js/main.js']['name']
+        self.assertNotEqual(first, second)
+        self.assertEqual(
+            sorted(path.name for path in (self.static / 'dist').iterdir()),
+            sorted(['assets.json', *(posixpath.basename(name) for name in assets.get_assets().bundles.values())]),
+        )
+        self.assertFalse((self.static / first).exists())
+
+
+class FontBuildTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.static = Path(tmp.name) / 'static'
+        (self.static / 'fonts').mkdir(parents=True)
+        (self.static / 'css').mkdir()
+        source = fonts.static_dir() / 'fonts' / 'HiltonSans-Regular.ttf'
+        (self.static / 'fonts' / source.name).write_bytes(source.read_bytes())
+        (self.static / 'css' / 'main.css').write_text('/* fonts:start */\n@font-face {}\n/* fonts:end */\nbody {}\n')
+        override = override_settings(STATICFILES_DIRS=[str(self.static)])
+        override.enable()
+        self.addCleanup(override.disable)
+        for patch in (
+            mock.patch.object(fonts, 'FACES', [('Hilton Sans', 400, source.name)]),
+            mock.patch.object(fonts, 'template_dir', return_value=Path(tmp.name)),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        (Path(tmp.name) / 'includes').mkdir()
+        Restaurant.objects.create(name='Brasserie Zürich', slug='zurich', description='Fondue \u2013 Raclette')
+
+    def test_subsets_to_used_characters(self):
+        results = fonts.build_fonts()
+        self.assertEqual(set(results), {'HiltonSans-Regular-latin.woff2', 'HiltonSans-Regular-extra.woff2'})
+        latin = self.static / 'fonts' / 'woff2' / 'HiltonSans-Regular-latin.woff2'
+        self.assertEqual(latin.read_bytes()[:4], b'wOF2')
+        self.assertLess(latin.stat().st_size, 30 * 1024)
+
+        css = (self.static / 'css' / 'main.css').read_text()
+        self.assertIn("url('../fonts/woff2/HiltonSans-Regular-latin.woff2') format('woff2')", css)
+        # ü from the database and the en dash are in the latin range
+        self.assertRegex(css, r'unicode-range: U\+20-7E, .*U\+FC.*U\+2013')
+        self.assertIn('font-display: swap', css)
+        self.assertTrue(css.endswith('/* fonts:end */\nbody {}\n'))
+        self.assertNotIn('@font-face {}', css)
+        preload = (fonts.template_dir() / 'includes' / 'font_preload.html').read_text()
+        self.assertIn('HiltonSans-Regular-latin.woff2', preload)
+        self.assertNotIn('extra', preload)
+
+    def test_rebuilds_only_when_characters_change(self):
+        fonts.build_fonts()
+        self.assertFalse(any(rebuilt for size, rebuilt in fonts.build_fonts().values()))
+        Restaurant.objects.create(name='Weißbräu', slug='weissbrau', description='')
+        rebuilt = {name for name, (size, rebuilt) in fonts.build_fonts().items() if rebuilt}
+        self.assertEqual(rebuilt, {'HiltonSans-Regular-latin.woff2'})
+
+    def test_unicode_range(self):
+        self.assertEqual(fonts.unicode_range({0x41, 0x42, 0x43, 0xE9, 0x2013, 0x2014}), 'U+41-43, U+E9, U+2013-2014')
+
+
+class ResponsiveImageTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media_root = Path(tmp.name)
+        override = override_settings(MEDIA_ROOT=tmp.name, RESPONSIVE_IMAGE_WIDTHS=(320, 640, 960))
+        override.enable()
+        self.addCleanup(override.disable)
+
+        from PIL import Image
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), 'navy').save(buffer, 'JPEG')
+        self.restaurant = Restaurant(name='Villa Verona', slug='villa-verona', description='Italian')
+        self.restaurant.image.save('villa.jpg', ContentFile(buffer.getvalue()), save=False)
+        self.restaurant.save()
+        # The upload queues a background job
+        job = Job.objects.get()
+        self.assertEqual(job.task, 'welcomeletter.tasks.process_image')
+        self.assertEqual(job.args, ['welcomeletter.Restaurant', self.restaurant.pk, 'image'])
+
+    def render(self):
+        self.restaurant.refresh_from_db()
+        return Template('{% load responsive_images %}{% responsive_image restaurant.image "Villa" %}').render(
+            Context({'restaurant': self.restaurant})
+        )
+
+    def test_plain_lazy_image_until_variants_exist(self):
+        html = self.render()
+        self.assertIn('loading="lazy"', html)
+        self.assertNotIn('srcset', html)
+
+    def test_variants_written_next_to_original(self):
+        run_job(claim_job('test'))
+        self.restaurant.refresh_from_db()
+        variants = self.restaurant.image_variants
+        self.assertEqual(variants['source'], 'restaurants/villa.jpg')
+        # Widths are capped at the original size
+        self.assertEqual([item['width'] for item in variants['sources']['webp']], [320, 640, 800])
+        self.assertTrue((self.media_root / 'restaurants' / 'villa-640w.webp').exists())
+        self.assertTrue((self.media_root / 'restaurants' / 'villa-640w.jpg').exists())
+        self.assertTrue(variants['placeholder'].startswith('data:image/jpeg;base64,'))
+
+    def test_tag_emits_srcset_and_sizes(self):
+        process_image_field(Restaurant, self.restaurant.pk, 'image')
+        html = self.render()
+        self.assertIn('<source type="image/webp" srcset="/media/restaurants/villa-320w.webp 320w', html)
+        self.assertIn('sizes="(min-width: 992px) 380px', html)
+        self.assertIn('src="/media/restaurants/villa-800w.jpg"', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn('width="800" height="600"', html)
+
+
+@override_settings(
+    STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+    STORAGES={**settings.STORAGES, 'staticfiles': {'BACKEND': 'welcomeletter.storage.OptimizedStaticFilesStorage'}},
+    STATIC_IMAGE_WIDTHS=(100, 200, 1000),
+    STATIC_IMAGE_WORKERS=2,
+)
+class StaticImageStorageTests(SimpleTestCase):
+
+    def setUp(self):
+        from PIL import Image
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        source, self.root = Path(tmp.name) / 'static', Path(tmp.name) / 'root'
+        (source / 'images').mkdir(parents=True)
+        Image.new('RGBA', (400, 200), (0, 47, 97, 255)).save(source / 'images' / 'logo.png')
+        Image.effect_noise((300, 300), 32).convert('RGB').save(source / 'images' / 'photo.jpg', quality=95)
+        (source / 'site.css').write_text('.hero { background: url("images/photo.jpg"); }')
+        override = override_settings(
+            STATICFILES_DIRS=[str(source)], STATIC_ROOT=str(self.root), STATIC_IMAGE_CACHE=str(Path(tmp.name) / 'cache'),
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def collect(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        return json.loads((self.root / 'images.json').read_text())
+
+    def test_variants_are_collected_and_hashed(self):
+        variants = self.collect()
+        logo = variants['images/logo.png']
+        self.assertEqual((logo['width'], logo['height'], logo['fallback']), (400, 200, 'png'))
+        # Never upscaled
+        self.assertEqual([item['width'] for item in logo['sources']['avif']], [100, 200, 400])
+        self.assertEqual(set(variants['images/photo.jpg']['sources']), {'avif', 'webp', 'jpg'})
+        hashed = json.loads((self.root / 'staticfiles.json').read_text())['paths']
+        self.assertIn('images/logo-100w.avif', hashed)
+        self.assertTrue((self.root / hashed['images/photo-200w.webp']).exists())
+
+        html = Template("{% load responsive_images %}{% static_image 'images/logo.png' 'Logo' sizes='100px' %}").render(Context())
+        self.assertIn(f'<source type="image/avif" srcset="/static/{hashed["images/logo-100w.avif"]} 100w', html)
+        self.assertIn('width="400" height="200"', html)
+        style = Template("{% load responsive_images %}{% static_image_set 'images/photo.jpg' 250 %}").render(Context())
+        self.assertIn(f"url('/static/{hashed['images/photo-200w.avif']}') type('image/avif')", style)
+        self.assertIn("type('image/jpeg')", style)
+
+    def test_repeat_runs_use_the_cache(self):
+        first = self.collect()
+        with mock.patch('welcomeletter.storage.encode_variants', side_effect=AssertionError('encoded again')):
+            self.assertEqual(self.collect(), first)
+
+    @override_settings(DEBUG=True)
+    def test_plain_image_before_collectstatic(self):
+        html = Template("{% load responsive_images %}{% static_image 'images/logo.png' 'Logo' %}").render(Context())
+        self.assertEqual(html, '<img src="/static/images/logo.png" alt="Logo" class="" loading="lazy" decoding="async">')
+
+    def test_missing_manifest_entry_is_an_error(self):
+        self.collect()
+        with self.assertRaisesMessage(ValueError, "Missing staticfiles manifest entry for 'images/missing.png'"):
+            Template("{% load static %}{% static 'images/missing.png' %}").render(Context())
+
+    @override_settings(STATIC_IMAGE_WORKERS=1)
+    def test_webp_only_without_an_avif_encoder(self):
+        with mock.patch('welcomeletter.storage.preferred_formats', return_value=('webp',)):
+            variants = self.collect()
+        self.assertEqual(set(variants['images/photo.jpg']['sources']), {'webp', 'jpg'})
+        html = Template("{% load responsive_images %}{% static_image 'images/logo.png' 'Logo' %}").render(Context())
+        self.assertNotIn('image/avif', html)
+
+
+class SubscribeUpsertTests(TestCase):
+
+    def test_statuses(self):
+        subscribers = MailingListSubscriber.objects
+        with self.assertNumQueries(1):
+            self.assertEqual(subscribers.subscribe('guest@example.com', '10.0.0.1'), subscribers.CREATED)
+        with self.assertNumQueries(1):
+            self.assertEqual(subscribers.subscribe('Guest@Example.com'), subscribers.ALREADY_ACTIVE)
+        subscribers.update(is_active=False)
+        self.assertEqual(subscribers.subscribe('GUEST@example.com'), subscribers.REACTIVATED)
+
+        subscriber = subscribers.get()
+        self.assertEqual(subscriber.email, 'guest@example.com')
+        self.assertEqual(subscriber.ip_address, '10.0.0.1')
+        self.assertTrue(subscriber.is_active)
+        self.assertIsNone(subscriber.unsubscribed_at)
+
+    def test_reactivation_message(self):
+        MailingListSubscriber.objects.create(email='guest@example.com', is_active=False)
+        response = self.client.post(
+            reverse('subscribe_newsletter'), {'email': 'Guest@example.com'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.json()['message'], 'Welcome back! Your subscription has been reactivated.')
+
+    def test_email_unique_regardless_of_case(self):
+        from django.db import IntegrityError
+        MailingListSubscriber.objects.create(email='guest@example.com')
+        with self.assertRaises(IntegrityError):
+            MailingListSubscriber.objects.bulk_create([MailingListSubscriber(email='GUEST@example.com')])
+
+
+class SubscribeConcurrencyTests(TransactionTestCase):
+
+    def test_concurrent_submissions_of_the_same_email(self):
+        threads, results, errors = 16, [], []
+        barrier = threading.Barrier(threads)
+
+        def submit(i):
+            try:
+                client = Client()
+                barrier.wait()
+                for attempt in range(5):
+                    email = 'rush@example.com' if attempt % 2 == 0 else f'guest{i}-{attempt}@example.com'
+                    response = client.post(
+                        reverse('subscribe_newsletter'), {'email': email.upper() if i % 2 else email},
+                        HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+                    )
+                    results.append((email, response.status_code, response.json()['success']))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=submit, args=(i,)) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), threads * 5)
+        self.assertTrue(all(status == 200 and success for _, status, success in results))
+        self.assertEqual(MailingListSubscriber.objects.filter(email='rush@example.com').count(), 1)
+        self.assertEqual(MailingListSubscriber.objects.count(), 1 + threads * 2)
+
+
+class SubscriptionBufferTests(TestCase):
+
+    @override_settings(SUBSCRIBE_BUFFERED=True, SUBSCRIBE_BUFFER_SIZE=1000, SUBSCRIBE_BUFFER_MAX_DELAY=60)
+    def test_buffered_subscribe_answers_before_writing(self):
+        response = self.client.post(
+            reverse('subscribe_newsletter'), {'email': 'Burst@Example.com'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertTrue(response.json()['success'])
+        self.assertFalse(MailingListSubscriber.objects.exists())
+        self.assertEqual(get_buffer().stats()['depth'], 1)
+
+        self.assertEqual(get_buffer().flush(), 1)
+        self.assertTrue(MailingListSubscriber.objects.filter(email='burst@example.com', is_active=True).exists())
+
+    def test_flush_skips_duplicates_and_reactivates(self):
+        MailingListSubscriber.objects.create(email='active@example.com')
+        MailingListSubscriber.objects.create(email='gone@example.com', is_active=False)
+        buffer = SubscriptionBuffer(max_size=1000, max_delay=60)
+        for email in ('new@example.com', 'NEW@example.com', 'active@example.com', 'gone@example.com'):
+            buffer.add(email, '10.0.0.1')
+        with self.assertNumQueries(2):
+            buffer.flush()
+        buffer.close()
+
+        self.assertEqual(MailingListSubscriber.objects.count(), 3)
+        self.assertFalse(MailingListSubscriber.objects.filter(is_active=False).exists())
+        self.assertEqual(buffer.stats()['flushed'], 3)
+
+    def test_failed_flush_keeps_entries_queued(self):
+        written, failures = [], [RuntimeError('database is down')]
+
+        def writer(entries):
+            if failures:
+                raise failures.pop()
+            written.extend(entries)
+
+        buffer = SubscriptionBuffer(max_size=1000, max_delay=60, writer=writer)
+        buffer.add('a@example.com')
+        with self.assertLogs('welcomeletter.buffer', 'ERROR'):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.stats()['depth'], 1)
+
+        buffer.add('b@example.com')
+        buffer.close()
+        self.assertEqual(sorted(written), ['a@example.com', 'b@example.com'])
+        self.assertEqual(buffer.stats()['failures'], 1)
+
+
+class SubscriptionBufferThresholdTests(TransactionTestCase):
+
+    def test_size_threshold_flushes_in_background(self):
+        buffer = SubscriptionBuffer(max_size=3, max_delay=60)
+        for i in range(3):
+            buffer.add(f'guest{i}@example.com')
+        deadline = time.monotonic() + 5
+        while buffer.stats()['flushes'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        buffer.close()
+
+        stats = buffer.stats()
+        self.assertEqual((stats['flushes'], stats['flushed'], stats['max_depth']), (1, 3, 3))
+        self.assertEqual(MailingListSubscriber.objects.count(), 3)
+
+
+class SubscriberExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        MailingListSubscriber.objects.create(email='first@example.com', ip_address='10.0.0.1')
+        MailingListSubscriber.objects.create(email='gone@example.com', is_active=False)
+        old = MailingListSubscriber.objects.create(email='old@example.com')
+        # subscribed_at is auto_now_add, so backdate it with update()
+        MailingListSubscriber.objects.filter(pk=old.pk).update(subscribed_at=timezone.now() - timedelta(days=400))
+
+    def test_admin_action_streams_csv(self):
+        admin_user = get_user_model().objects.create_superuser('admin@example.com', 'secret')
+        self.client.force_login(admin_user)
+        response = self.client.post(reverse('admin:welcomeletter_mailinglistsubscriber_changelist'), {
+            'action': 'export_csv',
+            '_selected_action': list(MailingListSubscriber.objects.values_list('pk', flat=True)),
+        })
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment;', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'email,is_active,subscribed_at,unsubscribed_at,ip_address')
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].startswith('first@example.com,True,'))
+
+    def test_command_filters_and_writes_jsonl(self):
+        out = StringIO()
+        since = (timezone.localdate() - timedelta(days=30)).isoformat()
+        call_command('export_subscribers', '--format', 'jsonl', '--active', '--since', since, stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['email'] for row in rows], ['first@example.com'])
+        self.assertEqual(rows[0]['ip_address'], '10.0.0.1')
+        self.assertIsNone(rows[0]['unsubscribed_at'])
+
+    def test_memory_stays_bounded_for_large_lists(self):
+        MailingListSubscriber.objects.bulk_create(
+            [MailingListSubscriber(email=f'guest{i:06d}@example.com', ip_address='192.168.1.1') for i in range(30000)],
+            batch_size=5000,
+        )
+        response = export_response(MailingListSubscriber.objects.all(), 'csv', chunk_size=500)
+        total = 0
+        tracemalloc.start()
+        try:
+            for chunk in response.streaming_content:
+                total += len(chunk)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        # The whole file is about 2 MB; only one chunk of rows may be held at a time
+        self.assertGreater(total, 2_000_000)
+        self.assertLess(peak, 1_000_000)
+
+
+class SubscriberImportTests(TestCase):
+
+    CSV = (
+        'Name,Email\n'
+        'Ann,ann@example.com\n'
+        'Ann again,ANN@Example.com \n'
+        'Bob,not-an-email\n'
+        ',\n'
+        'Cleo,cleo@example.com\n'
+        'Dan,dan@example.com\n'
+        'Eve,eve@example.com\n'
+    )
+
+    def setUp(self):
+        MailingListSubscriber.objects.create(email='cleo@example.com')
+        MailingListSubscriber.objects.create(email='dan@example.com', is_active=False)
+
+    def test_counts_and_batches(self):
+        with self.assertNumQueries(3 * 3):
+            result = import_subscribers(StringIO(self.CSV), batch_size=2)
+        self.assertEqual(
+            (result.rows, result.inserted, result.reactivated, result.skipped, result.invalid), (6, 2, 1, 2, 1)
+        )
+        self.assertEqual(MailingListSubscriber.objects.filter(is_active=True).count(), 4)
+        self.assertIn('rows/s', str(result))
+
+    def test_file_without_header_uses_first_column(self):
+        result = import_subscribers(StringIO('new@example.com,x\nother@example.com\n'))
+        self.assertEqual(result.inserted, 2)
+
+    def test_admin_upload(self):
+        admin_user = get_user_model().objects.create_superuser('admin@example.com', 'secret')
+        self.client.force_login(admin_user)
+        url = reverse('admin:welcomeletter_mailinglistsubscriber_import')
+        self.assertContains(self.client.get(reverse('admin:welcomeletter_mailinglistsubscriber_changelist')), url)
+
+        upload = SimpleUploadedFile('guests.csv', ('\ufeff' + self.CSV).encode('utf-8'), content_type='text/csv')
+        response = self.client.post(url, {'csv_file': upload}, follow=True)
+        self.assertContains(response, '2 inserted, 1 reactivated')
+        self.assertTrue(MailingListSubscriber.objects.filter(email='eve@example.com').exists())
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(self.CSV)
+        self.addCleanup(Path(f.name).unlink)
+        out = StringIO()
+        call_command('import_subscribers', f.name, '--ip', '10.0.0.9', stdout=out)
+        self.assertIn('2 inserted, 1 reactivated, 2 skipped, 1 invalid', out.getvalue())
+        self.assertEqual(MailingListSubscriber.objects.get(email='ann@example.com').ip_address, '10.0.0.9')
+
+
+
+class SyntheticDataTests(TestCase):
+
+    def test_same_seed_gives_same_rows(self):
+        generate_data(links=5, restaurants=20, subscribers=120, users=4, seed=7, batch_size=50)
+        first = list(MailingListSubscriber.objects.order_by('pk').values_list('email', 'is_active', 'ip_address'))
+        restaurants = list(Restaurant.objects.order_by('pk').values_list('name', 'menu_link__slug'))
+        self.assertEqual(clear_synthetic(batch_size=50), {
+            'restaurants': 20, 'links': 5, 'subscribers': 120, 'users': 4,
+        })
+
+        generate_data(links=5, restaurants=20, subscribers=120, seed=7, batch_size=50)
+        self.assertEqual(
+            list(MailingListSubscriber.objects.order_by('pk').values_list('email', 'is_active', 'ip_address')), first,
+        )
+        self.assertEqual(list(Restaurant.objects.order_by('pk').values_list('name', 'menu_link__slug')), restaurants)
+
+    def test_batches_are_spread_over_time(self):
+        with CaptureQueriesContext(connections['default']) as queries:
+            generate_data(subscribers=250, batch_size=100, days=100)
+        self.assertEqual([query['sql'].split()[0] for query in queries].count('INSERT'), 3)
+        dates = sorted(set(MailingListSubscriber.objects.values_list('subscribed_at', flat=True)))
+        self.assertEqual(len(dates), 3)
+        self.assertGreater(dates[-1] - dates[0], timedelta(days=60))
+        inactive = MailingListSubscriber.objects.filter(is_active=False)
+        self.assertTrue(inactive.exists())
+        self.assertFalse(inactive.filter(unsubscribed_at__isnull=True).exists())
+
+    def test_command_refuses_to_duplicate(self):
+        out = StringIO()
+        call_command('generate_data', subscribers=10, users=2, stdout=out)
+        self.assertIn('subscribers: 10 rows', out.getvalue())
+        with self.assertRaisesMessage(CommandError, 'pass --clear'):
+            call_command('generate_data', subscribers=10, stdout=out)
+        call_command('generate_data', subscribers=30, clear=True, stdout=out)
+        self.assertEqual(MailingListSubscriber.objects.count(), 30)
+        self.assertEqual(get_user_model().objects.count(), 0)
+
+
+
+class SubscriberChangeListTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_data(subscribers=250, batch_size=60, days=30)
+        cls.admin = get_user_model().objects.create_superuser('admin@example.com', 'secret')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:welcomeletter_mailinglistsubscriber_changelist')
+
+    def page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def test_cursor_walks_every_row_once(self):
+        expected = list(MailingListSubscriber.objects.order_by('-subscribed_at', '-pk').values_list('pk', flat=True))
+        seen, url, pages = [], self.url, []
+        while url:
+            cl = self.page(url if url.startswith('/') else self.url + url)
+            self.assertTrue(cl.keyset)
+            seen += [row.pk for row in cl.result_list]
+            pages.append(cl)
+            url = cl.next_url
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(pages[0].result_count, 250)
+        self.assertIsNone(pages[0].previous_url)
+
+        back = self.page(self.url + pages[2].previous_url)
+        self.assertEqual([row.pk for row in back.result_list], [row.pk for row in pages[1].result_list])
+        self.assertEqual(self.url + back.first_url, self.url + '?')
+
+    def test_filters_and_sorting(self):
+        cl = self.page(self.url + '?is_active__exact=1')
+        self.assertTrue(all(row.is_active for row in cl.result_list))
+        next_page = self.page(self.url + cl.next_url)
+        self.assertIn('is_active__exact=1', cl.next_url)
+        self.assertNotIn('cursor', next_page.get_query_string({'is_active__exact': 0}))
+        # Sorting by another column falls back to numbered pages
+        self.assertFalse(self.page(self.url + '?o=1').keyset)
+        self.assertEqual(self.client.get(self.url + '?cursor=garbage').status_code, 302)
+
+    def test_search_matches_prefix(self):
+        email = MailingListSubscriber.objects.order_by('pk').values_list('email', flat=True)[7]
+        prefix = email.split('@')[0].upper()
+        cl = self.page(self.url + '?q=' + prefix)
+        self.assertEqual([row.email for row in cl.result_list], [email])
+        self.assertEqual(self.page(self.url + '?q=' + email[1:]).result_count, 0)
+
+
+class BatchQRTests(SimpleTestCase):
+
+    MANIFEST = (
+        'kind,code,label,path,formats\n'
+        'room,0998-1001,Room {code},,\n'
+        'table,nile-terrace-1,Nile Terrace <1>,/restaurants/,\n'
+        'site,lobby,Lobby,,poster-a4;poster-a5\n'
+    )
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.output = Path(tmp.name)
+        self.codes = read_manifest(StringIO(self.MANIFEST), 'https://ramseshilton.com')
+
+    def test_manifest_expands_ranges_and_tracks_codes(self):
+        self.assertEqual([code.code for code in self.codes[:4]], ['0998', '0999', '1000', '1001'])
+        self.assertEqual(self.codes[0].label, 'Room 0998')
+        self.assertEqual(self.codes[0].url, 'https://ramseshilton.com/q/room-0998/')
+        self.assertEqual(self.codes[4].url, 'https://ramseshilton.com/q/table-nile-terrace-1/restaurants/')
+        self.assertEqual(self.codes[0].formats, ('tent-card',))
+        self.assertEqual(self.codes[5].formats, ('poster-a4', 'poster-a5'))
+
+    def test_unchanged_codes_are_skipped(self):
+        rendered, skipped, _ = generate_codes(self.codes, self.output, processes=2)
+        self.assertEqual((rendered, skipped), (6, 0))
+        self.assertTrue((self.output / 'svg' / 'room' / '0998.svg').exists())
+
+        manifest = self.MANIFEST.replace('/restaurants/', '/board-menus/')
+        changed = read_manifest(StringIO(manifest), 'https://ramseshilton.com')
+        rendered, skipped, _ = generate_codes(changed, self.output, processes=2)
+        self.assertEqual((rendered, skipped), (1, 5))
+
+    def test_print_sheets_use_the_static_designs(self):
+        generate_codes(self.codes, self.output, processes=1)
+        sheets = {path.name: path.read_text() for path in write_sheets(self.codes, self.output)}
+        self.assertEqual(sorted(sheets), [
+            'room-tent-card.html', 'site-poster-a4.html', 'site-poster-a5.html', 'table-table-cards.html',
+        ])
+        rooms = sheets['room-tent-card.html']
+        self.assertEqual(rooms.count('class="sheet-page"'), 4)
+        self.assertIn('<img src="../svg/room/0999.svg" alt="QR code for Room 0999">', rooms)
+        self.assertNotIn('ramseshilton_qr.svg', rooms)
+        self.assertIn('Nile Terrace &lt;1&gt;', sheets['table-table-cards.html'])
+
+    def test_command_reports_timings(self):
+        manifest = self.output / 'rooms.csv'
+        manifest.write_text(self.MANIFEST)
+        out = StringIO()
+        call_command('generate_qr', manifest=str(manifest), output_dir=str(self.output), processes=1, stdout=out)
+        self.assertIn('6 rendered, 0 unchanged', out.getvalue())
+        self.assertIn('codes/s', out.getvalue())
+
+    def test_manifest_cannot_run_in_the_background(self):
+        manifest = self.output / 'rooms.csv'
+        manifest.write_text(self.MANIFEST)
+        with self.assertRaisesMessage(CommandError, '--background'):
+            call_command('generate_qr', manifest=str(manifest), background=True)
+
+
+class QRScanTests(TestCase):
+
+    def setUp(self):
+        close_counter()
+        self.addCleanup(close_counter)
+
+    def test_redirect_counts_in_memory(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/q/table-nile-terrace-1/restaurants/?lang=ar')
+        self.assertRedirects(response, '/restaurants/?lang=ar', fetch_redirect_response=False)
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertRedirects(self.client.get('/q/room-1204/'), '/', fetch_redirect_response=False)
+        self.assertFalse(QRScanDaily.objects.exists())
+        self.assertEqual(get_counter().stats()['pending_rows'], 2)
+
+    def test_redirect_stays_on_site(self):
+        response = self.client.get('/q/room-1204//evil.example/')
+        self.assertEqual(response['Location'], '/evil.example/')
+
+    def test_flushes_add_up(self):
+        today = timezone.localdate()
+        counter = ScanCounter(interval=60)
+        for source in ('room-1204', 'room-1204', 'table-1'):
+            counter.add(source)
+        counter.add('room-1204', day=today - timedelta(days=1))
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.assertEqual(counter.flush(), 3)
+        self.assertEqual([query['sql'].split()[0] for query in queries].count('INSERT'), 1)
+        counter.add('room-1204')
+        counter.close()
+
+        totals = {(row.day, row.source): row.count for row in QRScanDaily.objects.all()}
+        self.assertEqual(totals, {
+            (today, 'room-1204'): 3, (today, 'table-1'): 1, (today - timedelta(days=1), 'room-1204'): 1,
+        })
+
+    def test_distinct_sources_are_capped(self):
+        counter = ScanCounter(interval=60, max_sources=2, writer=lambda counts: None)
+        for source in ('room-1', 'room-2', 'room-3', 'room-4', 'room-1'):
+            counter.add(source, day=timezone.localdate())
+        self.assertEqual(counter.stats()['pending_rows'], 3)
+        counter.close()
+
+        day = timezone.localdate()
+        counter = ScanCounter(interval=60, max_sources=1)
+        for source in ('room-1', 'room-2', 'room-3'):
+            counter.add(source, day=day)
+        counter.close()
+        self.assertEqual(QRScanDaily.objects.get(source=OTHER_SOURCE).count, 2)
+
+    @override_settings(QR_SCAN_MAX_SOURCES=2)
+    def test_distinct_sources_are_capped_per_day(self):
+        today = timezone.localdate()
+        yesterday = today - timedelta(days=1)
+        # Every flush is below the in-memory cap, but they add up
+        for sources in (('room-1', 'room-2'), ('room-3', 'room-1'), ('room-4',)):
+            write_counts({(today, source): 1 for source in sources})
+        write_counts({(yesterday, 'room-3'): 1})
+
+        totals = {(row.day, row.source): row.count for row in QRScanDaily.objects.all()}
+        self.assertEqual(totals, {
+            (today, 'room-1'): 2, (today, 'room-2'): 1, (today, OTHER_SOURCE): 2, (yesterday, 'room-3'): 1,
+        })
+
+    def test_redirect_overhead(self):
+        request = RequestFactory().get('/q/room-1204/')
+        timings = []
+        for _ in range(2000):
+            started = time.perf_counter()
+            qr_redirect(request, 'room-1204')
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        self.assertLess(timings[int(len(timings) * 0.99)], 0.001)
+
+    def test_admin_rolls_up_by_day_and_source(self):
+        today = timezone.localdate()
+        QRScanDaily.objects.bulk_create([
+            QRScanDaily(day=today, source='room-1204', count=5),
+            QRScanDaily(day=today, source='table-1', count=2),
+            QRScanDaily(day=today - timedelta(days=1), source='room-1204', count=4),
+        ])
+        self.client.force_login(get_user_model().objects.create_superuser('admin@example.com', 'secret'))
+        response = self.client.get(reverse('admin:welcomeletter_qrscandaily_changelist'))
+        self.assertEqual(response.context['scan_total'], 11)
+        self.assertEqual(list(response.context['top_sources']), [
+            {'source': 'room-1204', 'total': 9}, {'source': 'table-1', 'total': 2},
+        ])
+        self.assertEqual([row['total'] for row in response.context['scans_by_day']], [7, 4])
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingEmailBackend(LocMemEmailBackend):
+    """locmem backend that counts opened connections and rejects one address"""
+
+    opened = 0
+
+    def open(self):
+        if not getattr(self, 'is_open', False):
+            self.is_open = True
+            type(self).opened += 1
+            return True
+        return False
+
+    def close(self):
+        self.is_open = False
+
+    def send_messages(self, messages):
+        for message in messages:
+            if 'bounce@example.com' in message.to:
+                raise OSError('550 mailbox unavailable')
+        return super().send_messages(messages)
+
+
+class CampaignSendTests(TestCase):
+
+    def setUp(self):
+        RecordingEmailBackend.opened = 0
+        self.campaign = Campaign.objects.create(subject='Summer at the Nile', body_text='Hello', body_html='<p>Hello</p>')
+        self.subscribers = [MailingListSubscriber.objects.create(email=f'guest{i}@example.com') for i in range(5)]
+        MailingListSubscriber.objects.create(email='gone@example.com', is_active=False)
+
+    def send(self, **kwargs):
+        kwargs.setdefault('backend', 'welcomeletter.tests.RecordingEmailBackend')
+        return send_campaign(self.campaign, workers=1, rate=0, chunk_size=2, **kwargs)
+
+    def test_sends_to_active_subscribers_over_one_connection(self):
+        result = self.send()
+        self.assertEqual((result.sent, result.failed), (5, 0))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), [f'guest{i}@example.com' for i in range(5)])
+        self.assertEqual(mail.outbox[0].alternatives[0].content, '<p>Hello</p>')
+        self.assertEqual(RecordingEmailBackend.opened, 1)
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.status, 'sent')
+
+    def test_failed_recipient_is_recorded(self):
+        MailingListSubscriber.objects.create(email='bounce@example.com')
+        result = self.send()
+        self.assertEqual((result.sent, result.failed), (5, 1))
+        delivery = CampaignDelivery.objects.get(subscriber__email='bounce@example.com')
+        self.assertEqual(delivery.status, 'failed')
+        self.assertIn('550', delivery.error)
+
+    def test_resume_does_not_send_twice(self):
+        # A previous run mailed guest0 and crashed while guest1 was in flight
+        CampaignDelivery.objects.create(campaign=self.campaign, subscriber=self.subscribers[0], status='sent')
+        CampaignDelivery.objects.create(campaign=self.campaign, subscriber=self.subscribers[1], status='queued')
+
+        result = self.send()
+        self.assertEqual((result.sent, result.unknown), (3, 1))
+        self.assertNotIn('guest0@example.com', [m.to[0] for m in mail.outbox])
+        self.assertNotIn('guest1@example.com', [m.to[0] for m in mail.outbox])
+
+        mail.outbox.clear()
+        self.assertEqual(self.send().sent, 0)
+        self.assertEqual(self.send(retry_unknown=True).sent, 1)
+        self.assertEqual([m.to[0] for m in mail.outbox], ['guest1@example.com'])
+
+    def test_unreachable_smtp_leaves_addresses_for_the_next_run(self):
+        with self.assertLogs('welcomeletter.campaigns', 'WARNING') as logs:
+            result = self.send(backend='welcomeletter.tests.UnreachableEmailBackend')
+        self.assertEqual((result.sent, result.failed, result.deferred), (0, 0, 5))
+        self.assertIn('Connection refused', '\n'.join(logs.output))
+        self.assertFalse(CampaignDelivery.objects.exists())
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.status, 'draft')
+
+        result = self.send()
+        self.assertEqual((result.sent, result.unknown), (5, 0))
+
+    def test_rows_claimed_by_another_run_are_skipped(self):
+        # Another run inserts its row between our select and insert
+        real_bulk_create = CampaignDelivery.objects.bulk_create
+
+        def bulk_create(objs, **kwargs):
+            CampaignDelivery.objects.get_or_create(campaign=self.campaign, subscriber=self.subscribers[0])
+            return real_bulk_create(objs, **kwargs)
+
+        with mock.patch.object(CampaignDelivery.objects, 'bulk_create', side_effect=bulk_create):
+            result = self.send()
+        self.assertEqual(result.sent, 4)
+        self.assertNotIn('guest0@example.com', [m.to[0] for m in mail.outbox])
+
+    def test_campaign_being_sent_is_left_alone(self):
+        # Another run is sending and has guest0 in flight
+        Campaign.objects.filter(pk=self.campaign.pk).update(status='sending')
+        CampaignDelivery.objects.create(campaign=self.campaign, subscriber=self.subscribers[0], status='queued')
+        with self.assertRaises(CampaignInProgress):
+            self.send()
+        self.assertEqual(CampaignDelivery.objects.get().status, 'queued')
+        self.assertEqual(mail.outbox, [])
+        with self.assertRaisesMessage(CommandError, '--force'):
+            call_command('send_campaign', self.campaign.pk, rate=0, stdout=StringIO())
+
+        # That run was killed
+        result = self.send(force=True)
+        self.assertEqual((result.sent, result.unknown), (4, 1))
+
+    def test_failed_run_frees_the_campaign(self):
+        with mock.patch('welcomeletter.campaigns._send_batch', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.send()
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.status, 'draft')
+        # The first chunk was claimed before the failure
+        result = self.send()
+        self.assertEqual((result.sent, result.unknown), (3, 2))
+
+    def test_campaigns_do_not_share_the_email_queue(self):
+        job = send_campaign_job.enqueue(self.campaign.pk)
+        self.assertEqual(job.queue, 'campaigns')
+        self.assertIn('campaigns', settings.JOBS_QUEUE_CONCURRENCY)
+
+
+class UnreachableEmailBackend(LocMemEmailBackend):
+
+    def open(self):
+        raise ConnectionRefusedError('Connection refused')
+
+
+class CampaignConcurrencyTests(TransactionTestCase):
+
+    def test_workers_share_the_run_without_duplicates(self):
+        MailingListSubscriber.objects.bulk_create(
+            [MailingListSubscriber(email=f'guest{i}@example.com') for i in range(40)]
+        )
+        campaign = Campaign.objects.create(subject='News', body_text='Hello')
+        result = send_campaign(campaign, workers=3, rate=0, chunk_size=15, batch_size=4)
+
+        recipients = [m.to[0] for m in mail.outbox]
+        self.assertEqual(result.sent, 40)
+        self.assertEqual(len(recipients), len(set(recipients)))
+        self.assertEqual(CampaignDelivery.objects.filter(status='sent').count(), 40)
+
+
+class RateLimiterTests(SimpleTestCase):
+
+    def test_caps_messages_per_second(self):
+        clock = FakeClock()
+
+        def sleep(seconds):
+            clock.now += seconds
+
+        limiter = RateLimiter(5, clock=clock, sleep=sleep)
+        for _ in range(15):
+            limiter.acquire()
+        # The first 5 go out as a burst, the other 10 at 5 per second
+        self.assertAlmostEqual(clock.now, 2.0)
+
+
+def _bump_file_version(path, times):
+    backend = FileVersionBackend(path)
+    for _ in range(times):
+        backend.bump()
+
+
+class FileVersionBackendTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = str(Path(tmp.name) / 'content-version')
+
+    def test_concurrent_bumps_from_several_processes(self):
+        ctx = multiprocessing.get_context('fork')
+        workers = [ctx.Process(target=_bump_file_version, args=(self.path, 25)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(30)
+            self.assertEqual(worker.exitcode, 0)
+        self.assertEqual(FileVersionBackend(self.path).read(), 100)
+
+    def test_other_worker_sees_edit_after_poll_interval(self):
+        clock = FakeClock()
+        editor = VersionTracker(FileVersionBackend(self.path), poll_interval=2, clock=clock)
+        reader = VersionTracker(FileVersionBackend(self.path), poll_interval=2, clock=clock)
+        self.assertEqual(reader.get(), 0)
+
+        self.assertEqual(editor.bump(), 1)
+        self.assertEqual(editor.get(), 1)
+        # The reader keeps serving its cached version until the interval expires
+        clock.now = 1.5
+        self.assertEqual(reader.get(), 0)
+        clock.now = 2.0
+        self.assertEqual(reader.get(), 1)
+
+
+class DatabaseVersionBackendTests(TestCase):
+
+    def test_reader_polls_at_most_once_per_interval(self):
+        clock = FakeClock()
+        editor = VersionTracker(DatabaseVersionBackend(), poll_interval=5, clock=clock)
+        reader = VersionTracker(DatabaseVersionBackend(), poll_interval=5, clock=clock)
+        with self.assertNumQueries(1):
+            self.assertEqual(reader.get(), 0)
+            self.assertEqual(reader.get(), 0)
+
+        editor.bump()
+        editor.bump()
+        clock.now = 4.9
+        with self.assertNumQueries(0):
+            self.assertEqual(reader.get(), 0)
+        clock.now = 5
+        self.assertEqual(reader.get(), 2)
+
+    def test_admin_save_bumps_version_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant = Restaurant.objects.create(name='Marbar', slug='marbar', description='Tapas')
+        with self.captureOnCommitCallbacks(execute=True):
+            SiteSettings.get_settings()
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant.delete()
+        self.assertEqual(ContentVersion.objects.get(pk=1).version, 3)
+
+    def test_subscriber_changes_do_not_bump_version(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            MailingListSubscriber.objects.create(email='guest@example.com')
+        self.assertFalse(ContentVersion.objects.exists())
@@ -1,14 +1,25 @@
+from django.conf import settings
 from django.urls import path
-from . import views
-
-urlpatterns = [
-    path('', views.home, name='home'),
-    path('transfers/', views.transfers, name='transfers'),
-    path('info/', views.info, name='info'),
-    path('restaurants/', views.restaurants, name='restaurants'),
-    path('kids/', views.kids, name='kids'),
-    path('spa/', views.spa, name='spa'),
-    path('board-menus/', views.board_menus, name='board_menus'),
-    path('hilton-honors/', views.hilton_honors, name='hilton_honors'),
-    path('subscribe/', views.subscribe_newsletter, name='subscribe_newsletter'),
-]
+from . import async_views, views
+
+
+def view_patterns(views):
+    return [
+        path('', views.home, name='home'),
+        path('transfers/', views.transfers, name='transfers'),
+        path('info/', views.info, name='info'),
+        path('restaurants/', views.restaurants, name='restaurants'),
+        path('kids/', views.kids, name='kids'),
+        path('spa/', views.spa, name='spa'),
+        path('board-menus/', views.board_menus, name='board_menus'),
+        path('hilton-honors/', views.hilton_honors, name='hilton_honors'),
+        path('subscribe/', views.subscribe_newsletter, name='subscribe_newsletter'),
+        path('subscribe/token/', views.newsletter_token, name='newsletter_token'),
+        path('metrics', views.metrics, name='metrics'),
+        path('q/<slug:source>/', views.qr_redirect, name='qr_redirect'),
+        path('q/<slug:source>/<path:target>', views.qr_redirect, name='qr_redirect'),
+    ]
+
+
+# Under ASGI the coroutine versions of the same views (see async_views.py)
+urlpatterns = view_patterns(async_views if getattr(settings, 'ASYNC_VIEWS', False) else views)
@@ -0,0 +1,166 @@
+"""
+Content version shared by every worker process.
+
+Admin edits to the public content models bump a monotonic counter stored in
+the database (or in a local file shared by all workers of a node). Each
+process keeps the last value it saw and re-reads the shared counter at most
+once every ``CONTENT_VERSION_POLL_INTERVAL`` seconds, so per-process caches
+keyed on the version stay hot indefinitely while still picking up an edit
+within that delay. The process that made the edit sees it immediately.
+"""
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models import F
+from django.utils import timezone
+
+
+class DatabaseVersionBackend:
+    """Counter stored in the ``ContentVersion`` singleton row"""
+
+    def read(self):
+        from .models import ContentVersion
+        version = ContentVersion.objects.filter(pk=1).values_list('version', flat=True).first()
+        return version or 0
+
+    async def aread(self):
+        from .models import ContentVersion
+        version = await ContentVersion.objects.filter(pk=1).values_list('version', flat=True).afirst()
+        return version or 0
+
+    def bump(self):
+        from .models import ContentVersion
+        updated = ContentVersion.objects.filter(pk=1).update(
+            version=F('version') + 1, updated_at=timezone.now()
+        )
+        if not updated:
+            obj, created = ContentVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+            if not created:
+                return self.bump()
+        return self.read()
+
+
+class FileVersionBackend:
+    """Counter stored in a small text file shared by the workers of one node"""
+
+    def __init__(self, path):
+        self.path = str(path)
+
+    def read(self):
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    async def aread(self):
+        # A few bytes from a local file; not worth a thread
+        return self.read()
+
+    def bump(self):
+        import fcntl
+
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                version = self.read() + 1
+                # Write a temp file and rename it so readers never see a partial value
+                fd, tmp_path = tempfile.mkstemp(dir=directory)
+                with os.fdopen(fd, 'w') as tmp:
+                    tmp.write(str(version))
+                os.replace(tmp_path, self.path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return version
+
+
+class VersionTracker:
+    """Per-process view of the shared content version"""
+
+    def __init__(self, backend, poll_interval=2.0, clock=time.monotonic):
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self._version = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the known version, polling the backend when the last read is too old"""
+        now = self.clock()
+        if self._checked_at is not None and now - self._checked_at < self.poll_interval:
+            return self._version
+        with self._lock:
+            if self._checked_at is None or now - self._checked_at >= self.poll_interval:
+                self._version = self.backend.read()
+                self._checked_at = now
+        return self._version
+
+    async def aget(self):
+        """``get`` for async code; concurrent polls may both read the backend, which is harmless"""
+        now = self.clock()
+        if self._checked_at is not None and now - self._checked_at < self.poll_interval:
+            return self._version
+        version = await self.backend.aread()
+        with self._lock:
+            self._version = version
+            self._checked_at = now
+        return version
+
+    def bump(self):
+        """Increment the shared version and adopt the new value right away"""
+        version = self.backend.bump()
+        with self._lock:
+            self._version = version
+            self._checked_at = self.clock()
+        return version
+
+
+def get_backend():
+    """Build the backend selected by ``CONTENT_VERSION_BACKEND``"""
+    backend = getattr(settings, 'CONTENT_VERSION_BACKEND', 'db')
+    if backend == 'file':
+        return FileVersionBackend(settings.CONTENT_VERSION_FILE)
+    return DatabaseVersionBackend()
+
+
+_tracker = None
+
+
+def get_tracker():
+    global _tracker
+    if _tracker is None:
+        _tracker = VersionTracker(
+            get_backend(), poll_interval=getattr(settings, 'CONTENT_VERSION_POLL_INTERVAL', 2.0)
+        )
+    return _tracker
+
+
+def reset_tracker(**kwargs):
+    global _tracker
+    if kwargs.get('setting') in (None, 'CONTENT_VERSION_BACKEND', 'CONTENT_VERSION_FILE', 'CONTENT_VERSION_POLL_INTERVAL'):
+        _tracker = None
+
+
+setting_changed.connect(reset_tracker)
+
+
+def get_content_version():
+    """Return the content version as currently known by this process"""
+    return get_tracker().get()
+
+
+async def aget_content_version():
+    """``get_content_version`` for async views"""
+    return await get_tracker().aget()
+
+
+def bump_content_version():
+    """Record a content change for every worker"""
+    return get_tracker().bump()
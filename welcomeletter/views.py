@@ -1,126 +1,207 @@
-from django.shortcuts import render, redirect
-from django.http import JsonResponse
-from django.contrib import messages
-from django.views.decorators.http import require_POST
-from .models import ExternalLink, Restaurant, TransferOption, MailingListSubscriber, SiteSettings
-
-
-def get_common_context():
+from django.conf import settings
+from django.shortcuts import render
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.middleware.csrf import get_token
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_GET, require_POST
+from .buffer import get_buffer
+from .conditional import conditional_page
+from .content import get_snapshot
+from .metrics import CONTENT_TYPE, get_metrics, render_prometheus
+from .models import MailingListSubscriber
+from .pagecache import cache_public_page
+from .querylog import query_budget
+from .scans import get_counter
+
+
+def get_common_context(snapshot=None):
     """Get common context data for all pages"""
+    if snapshot is None:
+        snapshot = get_snapshot()
     return {
-        'settings': SiteSettings.get_settings(),
-        'external_links': {link.slug: link for link in ExternalLink.objects.filter(is_active=True)},
+        'settings': snapshot.settings,
+        'external_links': snapshot.links_by_slug,
     }
 
 
+@query_budget(6)
+@conditional_page
+@cache_public_page
 def home(request):
     """Welcome Letter page - main landing page"""
     context = get_common_context()
     return render(request, 'home.html', context)
 
 
+@query_budget(6)
+@conditional_page
+@cache_public_page
 def transfers(request):
     """Transfers & Parking page"""
-    context = get_common_context()
-    context['transfer_options'] = TransferOption.objects.filter(is_active=True)
+    snapshot = get_snapshot()
+    context = get_common_context(snapshot)
+    context['transfer_options'] = snapshot.transfer_options
     return render(request, 'transfers.html', context)
 
 
+@query_budget(6)
+@conditional_page
+@cache_public_page
 def info(request):
     """Important Information page"""
-    context = get_common_context()
+    snapshot = get_snapshot()
+    context = get_common_context(snapshot)
     # Get room dining menu link
-    context['room_dining_link'] = ExternalLink.objects.filter(
-        category='room_dining', is_active=True
-    ).first()
+    context['room_dining_link'] = snapshot.first_link('room_dining')
     # Get info page specific link
-    context['info_link'] = ExternalLink.objects.filter(
-        category='info', is_active=True
-    ).first()
+    context['info_link'] = snapshot.first_link('info')
     return render(request, 'info.html', context)
 
 
+@query_budget(6)
+@conditional_page
+@cache_public_page
 def restaurants(request):
     """Restaurants & Bars page"""
-    context = get_common_context()
-    context['restaurants'] = Restaurant.objects.filter(is_active=True)
+    snapshot = get_snapshot()
+    context = get_common_context(snapshot)
+    context['restaurants'] = snapshot.restaurants
     return render(request, 'restaurants.html', context)
 
 
+@query_budget(6)
+@conditional_page
+@cache_public_page
 def kids(request):
     """Kids & Family page"""
     context = get_common_context()
     return render(request, 'kids.html', context)
 
 
+@query_budget(6)
+@conditional_page
+@cache_public_page
 def spa(request):
     """The Spa page"""
-    context = get_common_context()
-    context['spa_menu_link'] = ExternalLink.objects.filter(
-        slug='spa-menu', is_active=True
-    ).first()
+    snapshot = get_snapshot()
+    context = get_common_context(snapshot)
+    context['spa_menu_link'] = snapshot.links_by_slug.get('spa-menu')
     return render(request, 'spa.html', context)
 
 
+@query_budget(6)
+@conditional_page
+@cache_public_page
 def board_menus(request):
     """Half & Full Board Menus page"""
-    context = get_common_context()
+    snapshot = get_snapshot()
+    context = get_common_context(snapshot)
     # Get restaurants that have board menus
-    context['restaurants'] = Restaurant.objects.filter(is_active=True)
+    context['restaurants'] = snapshot.restaurants
     return render(request, 'board_menus.html', context)
 
 
+@query_budget(6)
+@conditional_page
+@cache_public_page
 def hilton_honors(request):
     """Hilton Honors Benefits page"""
     context = get_common_context()
     return render(request, 'hilton_honors.html', context)
 
 
-@require_POST
-def subscribe_newsletter(request):
-    """Handle newsletter subscription"""
+@query_budget(0)
+@never_cache
+def qr_redirect(request, source, target=''):
+    """Count a scan of a printed QR code and send the guest on to its page"""
+    get_counter().add(source)
+    # Always a path on this site: '//evil.example' would be an open redirect
+    url = '/' + target.lstrip('/')
+    if request.META.get('QUERY_STRING'):
+        url += '?' + request.META['QUERY_STRING']
+    return HttpResponseRedirect(url)
+
+
+SUBSCRIBE_MESSAGES = {
+    MailingListSubscriber.objects.CREATED: 'Thank you for subscribing to our mailing list!',
+    MailingListSubscriber.objects.REACTIVATED: 'Welcome back! Your subscription has been reactivated.',
+    MailingListSubscriber.objects.ALREADY_ACTIVE: 'You are already subscribed to our mailing list!',
+}
+# Buffered subscriptions are answered before the database knows the address
+BUFFERED_MESSAGE = 'Thank you for subscribing to our mailing list!'
+
+
+@query_budget(0)
+@never_cache
+@require_GET
+def newsletter_token(request):
+    """Hand out a CSRF token for the newsletter form when a guest starts using it"""
+    return JsonResponse({'csrfToken': get_token(request)})
+
+
+def get_client_ip(request):
+    """The guest's IP address, as passed on by the reverse proxy"""
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        return x_forwarded_for.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR')
+
+
+def clean_email(request):
+    """The submitted address and an error message (None when it looks valid)"""
     email = request.POST.get('email', '').strip().lower()
-    
     if not email:
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return JsonResponse({'success': False, 'message': 'Please enter your email address.'})
-        messages.error(request, 'Please enter your email address.')
-        return redirect(request.META.get('HTTP_REFERER', '/'))
-    
+        return email, 'Please enter your email address.'
     # Basic email validation
     if '@' not in email or '.' not in email:
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return JsonResponse({'success': False, 'message': 'Please enter a valid email address.'})
-        messages.error(request, 'Please enter a valid email address.')
-        return redirect(request.META.get('HTTP_REFERER', '/'))
-    
-    # Get client IP
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip_address = x_forwarded_for.split(',')[0]
-    else:
-        ip_address = request.META.get('REMOTE_ADDR')
+        return email, 'Please enter a valid email address.'
+    return email, None
+
+
+def newsletter_response(success, message):
+    """The JSON answer main.js shows as a notification
+
+    The cached pages carry no CSRF token (main.js fetches one), so a form
+    posted without JavaScript is rejected by the CSRF check before it gets
+    here; there is no HTML result page.
+    """
+    return JsonResponse({'success': success, 'message': message})
+
+
+@query_budget(7)
+@require_POST
+def subscribe_newsletter(request):
+    """Handle newsletter subscription"""
+    email, error = clean_email(request)
+    if error:
+        return newsletter_response(False, error)
     
-    # Check if already subscribed
-    subscriber, created = MailingListSubscriber.objects.get_or_create(
-        email=email,
-        defaults={'ip_address': ip_address, 'is_active': True}
-    )
+    ip_address = get_client_ip(request)
     
-    if not created:
-        if subscriber.is_active:
-            message = 'You are already subscribed to our mailing list!'
-        else:
-            # Reactivate subscription
-            subscriber.is_active = True
-            subscriber.unsubscribed_at = None
-            subscriber.save()
-            message = 'Welcome back! Your subscription has been reactivated.'
+    if getattr(settings, 'SUBSCRIBE_BUFFERED', False):
+        get_buffer().add(email, ip_address)
+        message = BUFFERED_MESSAGE
     else:
-        message = 'Thank you for subscribing to our mailing list!'
-    
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return JsonResponse({'success': True, 'message': message})
+        status = MailingListSubscriber.objects.subscribe(email, ip_address)
+        message = SUBSCRIBE_MESSAGES[status]
     
-    messages.success(request, message)
-    return redirect(request.META.get('HTTP_REFERER', '/'))
+    return newsletter_response(True, message)
+
+
+def has_metrics_token(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorization = request.headers.get('Authorization', '')
+    return bool(token) and constant_time_compare(authorization, f'Bearer {token}')
+
+
+@query_budget(2)
+@never_cache
+@require_GET
+def metrics(request):
+    """Request metrics of all workers for Prometheus (token or staff only)"""
+    if not getattr(settings, 'METRICS_ENABLED', True):
+        raise Http404
+    if not has_metrics_token(request) and not request.user.is_staff:
+        raise Http404
+    return HttpResponse(render_prometheus(get_metrics().collect()), content_type=CONTENT_TYPE)